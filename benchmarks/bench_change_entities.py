@@ -0,0 +1,60 @@
+"""
+Compares the __slots__ value objects db_config.mongodb_model.AAChange with the previous plain class (copied below) in
+terms of memory per object, construction + in-memory deduplication throughput and documents left to ship to MongoDB.
+Run from the project root with: python -m benchmarks.bench_change_entities [n_changes] [distinct_changes]
+"""
+import random
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Optional
+
+import db_config.mongodb_model as db_schema
+
+
+class PlainAAChange:
+    """ db_config.mongodb_model.AAChange before it became a value object """
+    def __init__(self, change_id=None, protein=None, ref=None, pos=None, alt=None, _type=None, length=None, is_opt=None):
+        self.change_id: Optional[str] = change_id.upper()
+        self.protein: Optional[str] = protein.upper()
+        self.ref: Optional[str] = ref.upper()
+        self.pos: Optional[int] = int(pos)
+        self.alt: Optional[str] = alt.upper()
+        self.type: Optional[str] = _type.upper()
+        self.length: Optional[int] = int(length)
+        self.is_optional: Optional[bool] = is_opt
+
+
+def synthetic_changes(n: int, distinct: int, seed: int = 0):
+    rnd = random.Random(seed)
+    pool = []
+    for _ in range(distinct):
+        protein = rnd.choice(("S", "N", "NSP3", "NSP12", "NS8", "M", "E"))
+        ref, alt = rnd.choice("ACDEFGHIKLMNPQRSTVWY"), rnd.choice("ACDEFGHIKLMNPQRSTVWY")
+        pos = rnd.randint(1, 1273)
+        pool.append((f"{protein}:{ref}{pos}{alt}", protein, ref, pos, alt, "SUB", 1, False))
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def measure(cls, rows):
+    tracemalloc.start()
+    start = perf_counter()
+    objects = [cls(*row) for row in rows]
+    deduplicated = set(objects)
+    documents = list(map(vars, deduplicated))
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / len(rows), len(documents)
+
+
+def run(n: int = 200_000, distinct: int = 5_000):
+    rows = synthetic_changes(n, distinct)
+    for cls in (PlainAAChange, db_schema.AAChange):
+        elapsed, bytes_per_change, documents = measure(cls, rows)
+        print(f"{cls.__name__:<14} n={n}  {n / elapsed:,.0f} changes/s  "
+              f"peak {bytes_per_change:.0f} B/change  {documents} documents to load")
+
+
+if __name__ == '__main__':
+    run(*(int(x) for x in sys.argv[1:3]))
@@ -0,0 +1,66 @@
+"""
+Compares the scalar change parsers (Change.from_string, Change.from_parts, AAChange.from_parts) with their columnar
+counterparts on seeded synthetic inputs and checks that both paths produce the same changes.
+Run from the project root with: python -m benchmarks.bench_change_parsing [n_changes]
+"""
+import random
+import sys
+from time import perf_counter
+
+from data_validators.change import Change, AAChange
+
+PROTEINS = ["Spike (surface glycoprotein)", "ORF1ab polyprotein", "ORF1a polyprotein", "NSP3", "NS3 (ORF3a protein)",
+            "N (nucleocapsid phosphoprotein)", "M (membrane glycoprotein)", "E (envelope protein)", "NS8 (ORF8 protein)"]
+MAX_POSITION = {"ORF1ab polyprotein": 7096, "ORF1a polyprotein": 4405}
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def synthetic_parts(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        protein = rnd.choice(PROTEINS)
+        pos = rnd.randint(1, MAX_POSITION.get(protein, 1273))
+        ref = rnd.choice(RESIDUES)
+        alt = rnd.choice(RESIDUES + "-")
+        rows.append((protein, ref, str(pos), alt))
+    return rows
+
+
+def scalar_aa(rows):
+    return [c for p, r, pos, a in rows for c in AAChange.from_parts(p, r, pos, a)]
+
+
+def bulk_aa(rows):
+    proteins, refs, positions, alts = zip(*rows)
+    return AAChange.bulk_from_parts(proteins, refs, positions, alts)
+
+
+def scalar_nuc(strings):
+    return [c for s in strings for c in Change.from_string(s)]
+
+
+def bulk_nuc(strings):
+    return Change.bulk_from_strings(strings)
+
+
+def timed(fun, *args):
+    start = perf_counter()
+    result = fun(*args)
+    return perf_counter() - start, result
+
+
+def run(n: int = 100_000):
+    rows = synthetic_parts(n)
+    nuc_strings = [r + str(int(pos) * 3) + a for _, r, pos, a in rows]
+    for name, scalar, bulk, data in (("AAChange.from_parts", scalar_aa, bulk_aa, rows),
+                                     ("Change.from_string", scalar_nuc, bulk_nuc, nuc_strings)):
+        t_scalar, expected = timed(scalar, data)
+        t_bulk, actual = timed(bulk, data)
+        assert [vars(x.to_db_obj()) for x in expected] == [vars(x) for x in actual.to_db_objs()], \
+            f"{name}: bulk and scalar results differ"
+        print(f"{name:<22} n={n}  scalar {t_scalar:.3f}s  bulk {t_bulk:.3f}s  speed-up x{t_scalar / t_bulk:.1f}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
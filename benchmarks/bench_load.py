@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark of the load of the documents. The whole pipeline first runs once, on seeded synthetic inputs (see
+benchmarks.generate_sources), into a sink recording the operations sent to each collection. The recorded operations
+are then replayed, for every combination of the settings of the load, against
+- MongoDB (a scratch database <DB_NAME>_load_bench, dropped before each combination), when a mongod is reachable at
+  MONGO_DB_CONNECTION_URI: batch size (BATCH_SIZE), ordered or unordered bulk writes (MONGO_BULK_ORDERED), write
+  concern (MONGO_WRITE_CONCERN) and concurrent connections per batch (MONGO_WRITE_THREADS);
+- an in-memory stand-in (db_config.document_sinks.MemorySink), where only the batch size matters.
+For each collection and combination it reports the documents written per second and the 50th and 99th percentile of
+the latency of a batch, and it recommends the fastest combination overall, with the fastest batch size of each
+collection, as the environment variables to set. Unacknowledged writes (w=0) are measured but recommended only with
+--allow-unacknowledged, as they lose errors and can lose documents.
+Results are written as JSON to generated/benchmarks/load-<commit>.json.
+Run from the project root with: python -m benchmarks.bench_load [--scale F] [--batch-sizes 100 1000 ...]
+[--write-concerns 1 majority ...] [--threads 1 4 ...] [--target memory|mongodb] [--allow-unacknowledged]
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import statistics
+import tempfile
+from collections import defaultdict
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import data_validators.change_registry as change_registry
+import db_config.connection as connection
+import db_config.indexes as indexes
+from benchmarks import generate_sources
+from benchmarks.microbench import OUTPUT_DIR, environment, reset_caches
+from data_sources import covariants, phe_variants, uniprot
+from data_sources.aa_residues import aa_residues
+from data_sources.coguk_me import coguk_me
+from data_sources.our_sequence_annotations import our_sequence_annotations
+from data_sources.ruba_aa_change_effects import effects_of_aa_changes
+from data_sources.ruba_variant_effects import effects_of_variants
+from data_sources.virusurf_aa_changes import aa_positional_changes_from_virusurf as virusurf
+from db_config.document_sinks import DocumentSink, MemorySink, MongoDBSink, Operation, set_sink
+from pipeline.dedup import close_merge_stage
+
+# rows of each source of the workload, as a fraction of generate_sources.DEFAULT_ROWS
+SCALE = 0.01
+BATCH_SIZES = (100, 500, 1_000, 5_000, 10_000)
+ORDERED = (False, True)
+WRITE_CONCERNS = ('1', 'majority', '0')
+THREADS = (1, 2, 4, 8)
+MONGO_PING_TIMEOUT_MS = 2_000
+SOURCES = (covariants, phe_variants, virusurf, effects_of_aa_changes, effects_of_variants, coguk_me, uniprot,
+           aa_residues, our_sequence_annotations)
+
+
+class RecordingSink(DocumentSink):
+    name = 'recording'
+
+    def __init__(self):
+        self.classes: Dict[str, type] = dict()
+        self.operations: Dict[str, List[Operation]] = defaultdict(list)    # collection name -> operations in order
+
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        self.classes[cls.collection_name] = cls
+        self.operations[cls.collection_name].extend(operations)
+        return len(operations), 0, 0
+
+
+def record_workload(scale: float = SCALE, seed: int = 0) -> RecordingSink:
+    """
+    Runs every source on synthetic inputs of DEFAULT_ROWS * scale rows, followed by the load of the changes and of the
+    merged entities.
+    :return: the sink holding the operations of the run
+    """
+    recording = RecordingSink()
+    previous_sink = set_sink(recording)
+    reset_caches()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_sources.generate({source: max(1, int(rows * scale))
+                                       for source, rows in generate_sources.DEFAULT_ROWS.items()}, seed, directory)
+            with generate_sources.synthetic_sources(directory):
+                for source in SOURCES:
+                    source.SOURCE.run()
+            close_merge_stage()
+            change_registry.close_registry()
+    finally:
+        set_sink(previous_sink)
+        reset_caches()
+    return recording
+
+
+def replay(recording: RecordingSink, sink: DocumentSink, batch_size: int) -> Dict[str, dict]:
+    """
+    Writes the recorded operations of each collection to sink, batch_size at a time.
+    :return: the documents written per second and the percentiles of the batch latency of each collection
+    """
+    results = dict()
+    for collection_name, operations in recording.operations.items():
+        cls = recording.classes[collection_name]
+        latencies = []
+        for i in range(0, len(operations), batch_size):
+            batch = operations[i:i + batch_size]
+            start = perf_counter()
+            sink.write(cls, batch)
+            latencies.append(perf_counter() - start)
+        seconds = sum(latencies)
+        quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        results[collection_name] = {"documents": len(operations), "batches": len(latencies), "seconds": seconds,
+                                    "docs_per_s": len(operations) / seconds if seconds else None,
+                                    "p50_ms": quantiles[49] * 1000, "p99_ms": quantiles[98] * 1000}
+    return results
+
+
+def _mongo_client() -> Optional[MongoClient]:
+    client = MongoClient(connection.MONGO_DB_CONNECTION_URI, serverSelectionTimeoutMS=MONGO_PING_TIMEOUT_MS)
+    try:
+        client.admin.command('ping')
+        return client
+    except PyMongoError as e:
+        logger.warning(f"MongoDB not reachable at {connection.MONGO_DB_CONNECTION_URI} ({e})")
+        client.close()
+        return None
+
+
+def configurations(target: str, batch_sizes, ordered, write_concerns, threads) -> List[dict]:
+    if target == MemorySink.name:
+        return [{"batch_size": batch_size} for batch_size in batch_sizes]
+    return [{"batch_size": batch_size, "ordered": o, "write_concern": w, "threads": t}
+            for batch_size, o, w, t in itertools.product(batch_sizes, ordered, write_concerns, threads)]
+
+
+def run_sweep(recording: RecordingSink, target: str, configs: List[dict], client: Optional[MongoClient] = None) \
+        -> List[dict]:
+    database = client[f'{connection.DB_NAME}_load_bench'] if client is not None else None
+    results = []
+    try:
+        for config in configs:
+            if database is not None:
+                client.drop_database(database.name)
+                indexes._natural_key_indexed_collections.clear()    # the natural key indexes are created again
+                sink = MongoDBSink(config["ordered"], config["write_concern"], config["threads"], database)
+            else:
+                sink = MemorySink()
+            gc.collect()
+            try:
+                collections = replay(recording, sink, config["batch_size"])
+            finally:
+                sink.close()
+            total_seconds = sum(result["seconds"] for result in collections.values())
+            results.append({"target": target, **config, "seconds": total_seconds, "collections": collections})
+            print(f"{target:<8} {' '.join(f'{k}={v}' for k, v in config.items()):<58} {total_seconds:9.3f}s",
+                  flush=True)
+    finally:
+        if database is not None:
+            client.drop_database(database.name)
+            indexes._natural_key_indexed_collections.clear()
+    return results
+
+
+def recommend(results: List[dict], allow_unacknowledged: bool = False) -> dict:
+    """
+    :return: the settings of the fastest combination overall (excluding w=0, unless allow_unacknowledged) and the
+    fastest batch size of each collection with those settings
+    """
+    candidates = [r for r in results if allow_unacknowledged or r.get("write_concern") != '0']
+    modes = defaultdict(list)
+    for result in candidates:
+        modes[(result.get("ordered"), result.get("write_concern"), result.get("threads"))].append(result)
+    # each mode is judged on its total time with the best batch size of every collection
+    best_time_of_mode = {mode: sum(min(r["collections"][c]["seconds"] for r in mode_results)
+                                   for c in mode_results[0]["collections"])
+                         for mode, mode_results in modes.items()}
+    ordered, write_concern, threads = mode = min(best_time_of_mode, key=best_time_of_mode.get)
+    batch_sizes = {c: min(modes[mode], key=lambda r: r["collections"][c]["seconds"])["batch_size"]
+                   for c in modes[mode][0]["collections"]}
+    recommendation = {"batch_sizes": batch_sizes, "seconds": best_time_of_mode[mode]}
+    if write_concern is not None:
+        recommendation.update(ordered=ordered, write_concern=write_concern, threads=threads)
+    return recommendation
+
+
+def as_environment(recommendation: dict) -> str:
+    variables = []
+    if "ordered" in recommendation:
+        variables += [f"MONGO_BULK_ORDERED={str(recommendation['ordered']).lower()}",
+                      f"MONGO_WRITE_CONCERN={recommendation['write_concern']}",
+                      f"MONGO_WRITE_THREADS={recommendation['threads']}"]
+    sizes = ','.join(f'{c}:{size}' for c, size in sorted(recommendation["batch_sizes"].items()))
+    return ' '.join(variables + [f"BATCH_SIZES={sizes}"])
+
+
+def print_collections(results: List[dict]):
+    print(f"\n{'collection':<26} {'configuration':<58} {'docs/s':>12} {'p50 ms':>9} {'p99 ms':>9}")
+    for collection_name in results[0]["collections"]:
+        for result in results:
+            stats = result["collections"][collection_name]
+            config = ' '.join(f'{k}={result[k]}' for k in ("batch_size", "ordered", "write_concern", "threads")
+                              if k in result)
+            print(f"{collection_name:<26} {config:<58} {stats['docs_per_s'] or 0:>12,.0f} {stats['p50_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f}")
+
+
+def run(target: Optional[str] = None, scale: float = SCALE, batch_sizes=BATCH_SIZES, ordered=ORDERED,
+        write_concerns=WRITE_CONCERNS, threads=THREADS, seed: int = 0, allow_unacknowledged: bool = False,
+        output_path: Optional[str] = None) -> dict:
+    """
+    Records the workload and replays it with every configuration against target (MongoDB when reachable, otherwise
+    memory, by default).
+    :return: the report, also written as JSON to output_path
+    """
+    logger.remove()     # synthetic names and effects would flood the output with warnings
+    client = _mongo_client() if target in (None, MongoDBSink.name) else None
+    if target == MongoDBSink.name and client is None:
+        raise ConnectionError(f"MongoDB not reachable at {connection.MONGO_DB_CONNECTION_URI}")
+    target = MongoDBSink.name if client is not None else MemorySink.name
+    report = environment(seed)
+    report.update(target=target, scale=scale)
+    start = perf_counter()
+    recording = record_workload(scale, seed)
+    report["workload"] = {c: len(operations) for c, operations in recording.operations.items()}
+    print(f"workload recorded in {perf_counter() - start:.1f}s: {report['workload']}", flush=True)
+    try:
+        report["results"] = results = run_sweep(
+            recording, target, configurations(target, batch_sizes, ordered, write_concerns, threads), client)
+    finally:
+        if client is not None:
+            client.close()
+    print_collections(results)
+    report["recommendation"] = recommendation = recommend(results, allow_unacknowledged)
+    print(f"\nrecommended configuration ({recommendation['seconds']:.3f}s): {as_environment(recommendation)}")
+    suffix = "-dirty" if report["dirty"] else ""
+    output_path = output_path or os.path.join(OUTPUT_DIR, f"load-{report['commit'] or 'unknown'}{suffix}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"results written to {output_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load benchmark with sweeps of batch size and write settings")
+    parser.add_argument("--target", choices=(MongoDBSink.name, MemorySink.name),
+                        help="where documents are written (default: MongoDB if reachable, otherwise memory)")
+    parser.add_argument("--scale", type=float, default=SCALE,
+                        help="rows of each source as a fraction of benchmarks.generate_sources.DEFAULT_ROWS")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--ordered", choices=("true", "false"), nargs="+",
+                        default=[str(o).lower() for o in ORDERED])
+    parser.add_argument("--write-concerns", nargs="+", default=WRITE_CONCERNS,
+                        help="values of w, e.g. 0 1 majority (empty string for the default of the server)")
+    parser.add_argument("--threads", type=int, nargs="+", default=THREADS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--allow-unacknowledged", action="store_true", help="w=0 can be recommended")
+    parser.add_argument("--output", help=f"output JSON file (default {OUTPUT_DIR}load-<commit>.json)")
+    args = parser.parse_args()
+    run(args.target, args.scale, args.batch_sizes, [o == "true" for o in args.ordered], args.write_concerns,
+        args.threads, args.seed, args.allow_unacknowledged, args.output)
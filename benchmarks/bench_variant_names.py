@@ -0,0 +1,78 @@
+"""
+Compares data_validators.new_variant.recognize_organization (one combined regex, cached) with the sequential version
+trying the 14 regex of VARIANT_NAME_REGULAR_EXPRESSIONS one after the other. Names are drawn from the test cases of the
+regex, the aliases found in the local copy of covariants' clusters.json (if any) and synthetic unrecognizable names.
+Run from the project root with: python -m benchmarks.bench_variant_names [n_names]
+"""
+import json
+import random
+import sys
+from os.path import exists
+from time import perf_counter
+
+from loguru import logger
+
+from data_validators import new_variant
+from data_sources.covariants import LOCAL_PATH as COVARIANTS_PATH, SourceVariant
+
+
+def sample_names():
+    names = set()
+    for test_class in new_variant.VARIANT_NAME_REGULAR_EXPRESSIONS:
+        names.update(test_class.tests_should_pass)
+        names.update(test_class.tests_should_not_pass)
+    if exists(COVARIANTS_PATH):
+        with open(COVARIANTS_PATH, mode='r') as input_file:
+            for cluster in json.load(input_file)["clusters"]:
+                if cluster.get("type") == "variant":
+                    names.update(SourceVariant(cluster).aliases())
+    names.update(("unknown", "B.1.1.7 (UK)", "Not a variant", "VOC"))
+    return sorted(names)
+
+
+def synthetic_names(n: int, distinct: int, seed: int = 0):
+    rnd = random.Random(seed)
+    pool = sample_names()
+    while len(pool) < distinct:
+        pool.append(f"{rnd.choice('ABCP')}.{rnd.randint(1, 99)}.{rnd.randint(1, 999)}")
+    pool = pool[:distinct]
+    return [rnd.choice(pool) for _ in range(n)]
+
+
+def timed(fun, names):
+    start = perf_counter()
+    result = [fun(name) for name in names]
+    return perf_counter() - start, result
+
+
+def run(n: int = 100_000, distinct: int = 1_000):
+    logger.remove()     # unrecognized names would flood the output with warnings
+    names = synthetic_names(n, distinct)
+    distinct_names = sorted(set(names))
+
+    # agreement over distinct names
+    sequential = [new_variant.recognize_organization_sequentially(name) for name in distinct_names]
+    combined = [new_variant.recognize_organization(name) for name in distinct_names]
+    disagreements = [(name, s, c) for name, s, c in zip(distinct_names, sequential, combined) if s != c]
+    print(f"{len(distinct_names)} distinct names, {len(disagreements)} disagreements {disagreements[:10]}")
+
+    # uncached single pass of each automaton
+    seq_time, _ = timed(new_variant.recognize_organization_sequentially, distinct_names)
+    combined_regex = new_variant.VARIANT_NAME_COMBINED_REGEX
+    comb_time, _ = timed(combined_regex.fullmatch, distinct_names)
+    print(f"distinct names: sequential {seq_time * 1e6 / len(distinct_names):.2f} us/name, "
+          f"combined regex {comb_time * 1e6 / len(distinct_names):.2f} us/name")
+
+    # whole stream, as the loaders see it
+    seq_time, _ = timed(new_variant.recognize_organization_sequentially, names)
+    start = perf_counter()
+    new_variant.recognize_organizations(names)
+    bulk_time = perf_counter() - start
+    cached_time, _ = timed(new_variant.recognize_organization, names)
+    print(f"n={n}: sequential {n / seq_time:,.0f} names/s, cached {n / cached_time:,.0f} names/s, "
+          f"bulk {n / bulk_time:,.0f} names/s")
+    print(f"cache {new_variant.recognize_organization_cache_info()}")
+
+
+if __name__ == '__main__':
+    run(*(int(x) for x in sys.argv[1:3]))
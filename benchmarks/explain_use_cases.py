@@ -0,0 +1,92 @@
+"""
+Runs explain() on the lookups behind the use cases of use_cases.md before and after db_config.indexes.ensure_indexes(),
+reporting for each query the winning plan (COLLSCAN or the indexes used), the documents and keys examined and the
+median latency. The "before" figures force a collection scan with the hint {$natural: 1}, so the report can be produced
+on a database whose indexes already exist. Requires a database populated by main.py.
+Run from the project root with: python -m benchmarks.explain_use_cases [repeats]
+"""
+import statistics
+import sys
+from time import perf_counter
+from typing import Callable, List, Tuple
+
+import db_config.connection as connection
+from db_config.indexes import ensure_indexes
+from db_config.mongodb_model import AAChange, AAResidue, Effect, ProteinRegion, Reference, Structure, Variant
+
+
+def _any_effect_id():
+    effect = Effect.db().find_one({}, {'_id': True})
+    return effect['_id'] if effect else None
+
+
+# (use case, description, collection, filter factory)
+QUERIES: List[Tuple[str, str, Callable, Callable[[], dict]]] = [
+    ("UC1", "variant by name", Variant.db, lambda: {'aliases.name': 'ALPHA'}),
+    ("UC1", "aa_change by change_id", AAChange.db, lambda: {'change_id': {'$in': ['S:D614G', 'S:N501Y', 'S:P681H']}}),
+    ("UC1", "aa_residue by residue", AAResidue.db, lambda: {'residue': 'D'}),
+    ("UC2", "variant by name", Variant.db, lambda: {'aliases.name': 'VOC-20DEC-02'}),
+    ("UC2", "protein_region by protein", ProteinRegion.db, lambda: {'protein_name': 'S'}),
+    ("UC2", "protein_region by name", ProteinRegion.db, lambda: {'description': 'receptor-binding domain (rbd)'}),
+    ("UC2", "aa_change in protein range", AAChange.db, lambda: {'protein': 'S', 'pos': {'$gte': 319, '$lte': 541}}),
+    ("UC3", "variant by aa_change", Variant.db, lambda: {'org_2_aa_changes.changes': 'S:D614G'}),
+    ("UC3", "evidence by effect", Reference.db, lambda: {'effect_ids': _any_effect_id()}),
+    ("UC4", "effect by type", Effect.db, lambda: {'type': 'binding to host receptor'}),
+    ("UC4", "effect by aa_change", Effect.db, lambda: {'aa_changes': 'S:L452R'}),
+    ("UC4", "structure by protein", Structure.db, lambda: {'protein_characterization.protein_name': 'S'}),
+]
+
+
+def _indexes_used(plan: dict) -> List[str]:
+    names = []
+    if plan.get('stage') == 'IXSCAN':
+        names.append(plan['indexName'])
+    for child_key in ('inputStage', 'queryPlan'):
+        if child_key in plan:
+            names += _indexes_used(plan[child_key])
+    for child in plan.get('inputStages', []):
+        names += _indexes_used(child)
+    return names
+
+
+def measure(collection, query: dict, repeats: int, force_collection_scan: bool) -> dict:
+    def cursor():
+        c = collection.find(query)
+        return c.hint([('$natural', 1)]) if force_collection_scan else c
+
+    explained = cursor().explain()
+    stats = explained['executionStats']
+    indexes = _indexes_used(explained['queryPlanner']['winningPlan'])
+    latencies = []
+    for _ in range(repeats):
+        start = perf_counter()
+        list(cursor())
+        latencies.append(perf_counter() - start)
+    return {
+        'plan': ','.join(indexes) if indexes else 'COLLSCAN',
+        'returned': stats['nReturned'],
+        'docs_examined': stats['totalDocsExamined'],
+        'keys_examined': stats['totalKeysExamined'],
+        'median_ms': statistics.median(latencies) * 1000
+    }
+
+
+def run(repeats: int = 20):
+    queries = [(use_case, description, collection(), make_filter()) for use_case, description, collection, make_filter
+               in QUERIES]
+    before = [measure(collection, query, repeats, True) for _, _, collection, query in queries]
+    ensure_indexes()
+    after = [measure(collection, query, repeats, False) for _, _, collection, query in queries]
+    print(f"{'use case':<8} {'query':<28} {'returned':>8}  {'before: plan':<14} {'docs':>7} {'ms':>8}  "
+          f"{'after: plan':<40} {'keys':>6} {'docs':>6} {'ms':>8}")
+    for (use_case, description, _, _), b, a in zip(queries, before, after):
+        print(f"{use_case:<8} {description:<28} {a['returned']:>8}  {b['plan']:<14} {b['docs_examined']:>7} "
+              f"{b['median_ms']:>8.3f}  {a['plan']:<40} {a['keys_examined']:>6} {a['docs_examined']:>6} "
+              f"{a['median_ms']:>8.3f}")
+
+
+if __name__ == '__main__':
+    try:
+        run(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
+    finally:
+        connection.close_conn()
@@ -0,0 +1,205 @@
+"""
+Writes seeded synthetic inputs, as large as requested, in the exact format of each source (see benchmarks.synthetic for
+the content): covariants' clusters.json, the zipped repository of PHE variant YAMLs, the VirusURF CSV of distinct AA
+changes, the Ruba CSVs of effects of AA changes and of variants, the COG-UK ME JSON and the UniProt feature documents
+(one per accession of data_sources.uniprot, as found in its cache). Rows of VirusURF, Ruba and COG-UK repeat a
+previous row with probability DUPLICATE_RATE. synthetic_sources(directory) points the sources to the generated files,
+so that their SOURCE.run() can be load-tested offline.
+Run from the project root with: python -m benchmarks.generate_sources [source=rows ...] [--seed S] [--output-dir DIR]
+e.g. python -m benchmarks.generate_sources virusurf=5000000 covariants=1000
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import zipfile
+from os.path import sep
+from time import perf_counter
+from typing import Dict, Iterable, Iterator
+
+import yaml
+
+from benchmarks import synthetic
+from data_sources import covariants, phe_variants, uniprot
+from data_sources.coguk_me import coguk_me
+from data_sources.ruba_aa_change_effects import effects_of_aa_changes
+from data_sources.ruba_variant_effects import effects_of_variants
+from data_sources.virusurf_aa_changes import aa_positional_changes_from_virusurf as virusurf
+from data_validators.change import AAChange, type_and_length
+
+OUTPUT_DIR = f".{sep}generated{sep}synthetic{sep}"
+# rows of each source: clusters, YAML files, CSV rows, JSON items and UniProt features respectively
+DEFAULT_ROWS = {"covariants": 5_000, "phe": 2_000, "virusurf": 1_000_000, "ruba_aa_change_effects": 100_000,
+                "ruba_variant_effects": 100_000, "coguk_me": 100_000, "uniprot": 160_000}
+DUPLICATE_RATE = 0.02
+NON_VARIANT_CLUSTER_RATE = 0.5  # clusters.json also lists clusters of single mutations, which covariants skips
+
+# paths of the generated files, relative to the output directory
+PATHS = {
+    "covariants": f"covariants{sep}clusters.json",
+    "phe": f"phe{sep}git_repo.zip",
+    "virusurf": f"virusurf{sep}distinct_aa_changes.csv",
+    "ruba_aa_change_effects": (f"ruba{sep}a_change_effect.csv", f"ruba{sep}group_of_changes_effects.csv"),
+    "ruba_variant_effects": f"ruba{sep}variants_effects.csv",
+    "coguk_me": f"coguk_me{sep}coguk_me.json",
+    "uniprot": f"uniprot{sep}features{sep}"
+}
+
+
+def _duplicated(rows: Iterator, n: int, seed: int) -> Iterator:
+    return synthetic.with_duplicates(lambda _: rows, n, DUPLICATE_RATE, seed)
+
+
+def write_covariants(path: str, n: int, seed: int):
+    rnd = random.Random(seed)
+
+    def clusters():
+        for cluster in synthetic.covariants_clusters(n, seed):
+            if rnd.random() < NON_VARIANT_CLUSTER_RATE:
+                mutation = rnd.choice(cluster["mutations"]["nonsynonymous"])
+                yield {"build_name": f"{cluster['build_name']}.{mutation['pos']}", "cluster_data": [],
+                       "col": cluster["col"], "country_info": [],
+                       "display_name": f"{cluster['display_name']} + {mutation['gene']}:{mutation['left']}"
+                                       f"{mutation['pos']}",
+                       "graphing": False, "important": False, "nextstrain_build": False,
+                       "nextstrain_url": cluster["nextstrain_url"], "snps": cluster["snps"],
+                       "type": rnd.choice(["mutation", "do_not_display"])}
+            cluster.update(cluster_data=[], country_info=[])
+            yield cluster
+
+    with open(path, "w") as output_file:
+        output_file.write('{"clusters": [')
+        for i, cluster in enumerate(clusters()):
+            output_file.write((", " if i else "") + json.dumps(cluster))
+        output_file.write("]}")
+
+
+def write_phe(path: str, n: int, seed: int):
+    folder = f"phe-genomics-variant_definitions-{seed:07x}/"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(folder + "README.md", "Synthetic variant definitions\n")
+        for variant in synthetic.phe_variants(n, seed):
+            zip_file.writestr(f"{folder}variant_yaml/{variant['unique-id']}.yml",
+                              yaml.safe_dump(variant, sort_keys=False))
+
+
+def write_virusurf(path: str, n: int, seed: int):
+    with open(path, "w") as output_file:
+        output_file.write("product,sequence_aa_original,start_aa_original,sequence_aa_alternative,variant_aa_type,"
+                          "variant_aa_length\n")
+        for protein, ref, pos, alt in synthetic.aa_change_parts(n, seed, DUPLICATE_RATE):
+            _type, length = type_and_length(*AAChange.translate_residues(ref.upper(), alt.upper()))
+            output_file.write(f"{protein},{ref},{pos},{alt},{_type},{length}\n")
+
+
+def _escaped(field: str) -> str:
+    # like in the original spreadsheets, fields that look like formulae (e.g. a deletion "-") start with `
+    return "`" + field if field.startswith(("-", "+", "=")) else field
+
+
+def write_ruba_aa_change_effects(paths: Iterable[str], n: int, seed: int):
+    header = "product;type;original;position;alternative;effect;level;method;uri;citation;type;publisher\n"
+    single_path, group_path = paths
+    with open(single_path, "w") as single_file, open(group_path, "w") as group_file:
+        single_file.write(header)
+        group_file.write(header)
+        for aa_changes, effect, (citation, _type, uri, publisher) in \
+                _duplicated(synthetic.ruba_aa_change_effects(n, seed), n, seed):
+            products, refs, positions, alts = zip(*aa_changes)
+            types = [type_and_length(ref, alt)[0] for ref, alt in zip(refs, alts)]
+            fields = ["/".join(products), "/".join(types), _escaped("/".join(refs)), "/".join(positions),
+                      _escaped("/".join(alts)), *effect, uri, citation, _type, publisher]
+            (single_file if len(aa_changes) == 1 else group_file).write(";".join(fields) + "\n")
+
+
+def write_ruba_variant_effects(path: str, n: int, seed: int):
+    rnd = random.Random(seed)
+    with open(path, "w") as output_file:
+        output_file.write("variant;pangolin_lineage;effect;level;uri_methods;citation;uri_publisher;uri_type;uri;\n")
+        for pango_id, effect, (citation, _type, uri, publisher) in \
+                _duplicated(synthetic.ruba_variant_effects(n, seed), n, seed):
+            variant = rnd.choice(synthetic.GREEK_LETTERS).lower()
+            output_file.write(";".join((variant, pango_id, *effect, citation, publisher, _type, uri, "")) + "\n")
+
+
+def write_coguk_me(path: str, n: int, seed: int):
+    with open(path, "w", encoding="utf-8") as output_file:
+        json.dump(list(_duplicated(synthetic.coguk_me_items(n, seed), n, seed)), output_file, indent=1)
+
+
+def write_uniprot(directory: str, n: int, seed: int):
+    rnd = random.Random(seed)
+    entry_of_accession = {accession: entry for entry, (accession, _) in synthetic.UNIPROT_ENTRIES.items()}
+    for i, accession in enumerate(uniprot.ACCESSIONS):
+        n_features = n // len(uniprot.ACCESSIONS) + (i < n % len(uniprot.ACCESSIONS))
+        with open(os.path.join(directory, f"{accession}.json"), "w") as output_file:
+            json.dump(synthetic.uniprot_document(rnd, entry_of_accession[accession], n_features), output_file)
+
+
+WRITERS = {"covariants": write_covariants, "phe": write_phe, "virusurf": write_virusurf,
+           "ruba_aa_change_effects": write_ruba_aa_change_effects, "ruba_variant_effects": write_ruba_variant_effects,
+           "coguk_me": write_coguk_me, "uniprot": write_uniprot}
+
+
+def output_paths(directory: str, source: str):
+    paths = PATHS[source]
+    return tuple(os.path.join(directory, p) for p in paths) if isinstance(paths, tuple) else \
+        os.path.join(directory, paths)
+
+
+def generate(rows: Dict[str, int] = None, seed: int = 0, directory: str = OUTPUT_DIR):
+    """
+    Writes the inputs of the sources in rows (all of them, with DEFAULT_ROWS, by default) to directory.
+    """
+    for source, n in (rows or DEFAULT_ROWS).items():
+        paths = output_paths(directory, source)
+        for path in paths if isinstance(paths, tuple) else (paths,):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        start = perf_counter()
+        WRITERS[source](paths, n, seed)
+        print(f"{source:<24} {n:>10} rows written in {perf_counter() - start:7.2f}s to {paths}", flush=True)
+
+
+@contextlib.contextmanager
+def synthetic_sources(directory: str = OUTPUT_DIR):
+    """
+    Points the sources to the inputs generated in directory until the end of the block.
+    """
+    uniprot_dir = output_paths(directory, "uniprot")
+    ruba_single, ruba_group = output_paths(directory, "ruba_aa_change_effects")
+    replacements = [
+        (covariants, "LOCAL_PATH", output_paths(directory, "covariants")),
+        (phe_variants, "LOCAL_PATH", output_paths(directory, "phe")),
+        (virusurf, "SOURCE_FILE_PATH", output_paths(directory, "virusurf")),
+        (effects_of_aa_changes, "FILE_PATH_EFFECT_SINGLE_AA_CHANGE", ruba_single),
+        (effects_of_aa_changes, "FILE_PATH_EFFECT_MULTIPLE_AA_CHANGES", ruba_group),
+        (effects_of_variants, "FILE_PATH_EFFECTS_OF_VARIANTS", output_paths(directory, "ruba_variant_effects")),
+        (coguk_me, "coguk_me_input_path", output_paths(directory, "coguk_me")),
+        (uniprot, "cache_path_of", lambda accession: os.path.join(uniprot_dir, f"{accession}.json"))
+    ]
+    previous = [(module, attr, getattr(module, attr)) for module, attr, _ in replacements]
+    try:
+        for module, attr, value in replacements:
+            setattr(module, attr, value)
+        yield directory
+    finally:
+        for module, attr, value in previous:
+            setattr(module, attr, value)
+
+
+def _rows_argument(argument: str):
+    source, _, n = argument.partition("=")
+    if source not in WRITERS or not n.isdigit():
+        raise argparse.ArgumentTypeError(f"expected <source>=<rows> with source among {list(WRITERS)}")
+    return source, int(n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Writes synthetic inputs in the format of each source")
+    parser.add_argument("rows", nargs="*", type=_rows_argument, metavar="SOURCE=ROWS",
+                        help=f"sources to generate and their size (default {DEFAULT_ROWS})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args()
+    generate(dict(args.rows) or None, args.seed, args.output_dir)
@@ -0,0 +1,260 @@
+"""
+CPU micro-benchmarks of the normalization hot paths (change parsing, protein name conversion, recognition of variant
+names) and of the transform of each source, on seeded synthetic inputs (see benchmarks.synthetic) at several scales.
+Each benchmark draws at most POOL_SIZE distinct rows and cycles them up to the scale, so that large scales do not need
+the memory of as many distinct rows and measure, like real sources, a mix of new and repeated inputs. Before each
+repetition the change registry and the caches of protein and variant names are emptied, so repetitions are comparable.
+Results are written as JSON, tagged with the commit of the working tree, to generated/benchmarks/micro-<commit>.json;
+--compare prints the ratio between the timings of two such files.
+Run from the project root with: python -m benchmarks.microbench [--scales 1000 100000 1000000] [--only PATTERN]
+[--repeats N] [--output FILE] [--compare BASE.json [NEW.json]]
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from collections import deque
+from datetime import datetime, timezone
+from itertools import chain, cycle, islice, starmap
+from os.path import sep
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional
+
+from loguru import logger
+
+import data_validators.change_registry as change_registry
+from benchmarks import synthetic
+from data_sources import covariants, phe_variants, uniprot
+from data_sources.aa_residues import aa_residues
+from data_sources.coguk_me import coguk_me
+from data_sources.our_sequence_annotations import our_sequence_annotations
+from data_sources.ruba_aa_change_effects import effects_of_aa_changes
+from data_sources.ruba_variant_effects import effects_of_variants
+from data_sources.virusurf_aa_changes import aa_positional_changes_from_virusurf as virusurf
+from data_validators.change import Change, AAChange
+from data_validators.new_variant import recognize_organization, _organization_of
+from data_validators.protein import convert_protein, resolve_protein_name
+
+SCALES = (1_000, 100_000, 1_000_000)
+POOL_SIZE = 10_000
+REPEATS = 5
+MAX_SECONDS = 30    # no more repetitions of a benchmark after this time (at least one is always done)
+OUTPUT_DIR = f".{sep}generated{sep}benchmarks{sep}"
+FORMAT_VERSION = 1
+
+
+def consume(iterable: Iterable):
+    deque(iterable, maxlen=0)
+
+
+def chunks_of(size: int, function: Callable[[list], Iterable]) -> Callable[[Iterable], None]:
+    """
+    :return: a benchmark body passing the rows to function size rows at a time, for transforms returning collections
+    """
+    def body(rows: Iterable):
+        rows = iter(rows)
+        for chunk in iter(lambda: list(islice(rows, size)), []):
+            consume(function(chunk))
+    return body
+
+
+class Benchmark:
+    def __init__(self, name: str, pool: Callable[[int, int], Iterable], body: Callable[[Iterable], None],
+                 rows_per_item: int = 1):
+        """
+        :param pool: function of (n, seed) returning n distinct items
+        :param body: the code measured, which consumes an iterable of items
+        :param rows_per_item: rows in each item (e.g. features in a UniProt document), as scales count rows
+        """
+        self.name = name
+        self.pool = pool
+        self.body = body
+        self.rows_per_item = rows_per_item
+
+    def inputs(self, rows: int, seed: int) -> Callable[[], Iterable]:
+        items = math.ceil(rows / self.rows_per_item)
+        pool = list(self.pool(min(items, math.ceil(POOL_SIZE / self.rows_per_item)), seed))
+        return lambda: islice(cycle(pool), items)
+
+
+def _nuc_parts(n: int, seed: int):
+    return [(ref, str(pos), alt) for ref, pos, alt in map(Change.split_string, synthetic.nuc_change_strings(n, seed))]
+
+
+def _aa_changes(n: int, seed: int):
+    return [(protein, Change(*Change.check_parts(ref, pos, alt)))
+            for protein, ref, pos, alt in synthetic.aa_change_parts(n, seed)]
+
+
+def _protein_positions(n: int, seed: int):
+    return [(protein, int(pos)) for protein, _, pos, _ in synthetic.aa_change_parts(n, seed)]
+
+
+BENCHMARKS = [
+    Benchmark("Change.from_string", synthetic.nuc_change_strings,
+              lambda rows: consume(chain.from_iterable(map(Change.from_string, rows)))),
+    Benchmark("Change.from_parts", _nuc_parts,
+              lambda rows: consume(chain.from_iterable(starmap(Change.from_parts, rows)))),
+    Benchmark("AAChange.uniform", _aa_changes,
+              lambda rows: consume(starmap(AAChange, rows))),
+    Benchmark("convert_protein", _protein_positions,
+              lambda rows: consume(starmap(convert_protein, rows))),
+    Benchmark("recognize_organization", synthetic.variant_names,
+              lambda rows: consume(map(recognize_organization, rows))),
+    Benchmark("transform.covariants",
+              lambda n, seed: list(map(covariants.SourceVariant, synthetic.covariants_clusters(n, seed))),
+              lambda rows: consume(covariants.transform(rows))),
+    Benchmark("transform.phe",
+              lambda n, seed: list(map(phe_variants.SourceVariant, synthetic.phe_variants(n, seed))),
+              chunks_of(1_000, phe_variants.transform)),
+    Benchmark("transform.coguk_me", synthetic.coguk_me_items,
+              lambda rows: consume(coguk_me.transform(rows))),
+    Benchmark("transform.effects_of_aa_changes", synthetic.ruba_aa_change_effects,
+              lambda rows: consume(map(effects_of_aa_changes.transform_tuple, rows))),
+    Benchmark("transform.effects_of_variants", synthetic.ruba_variant_effects,
+              lambda rows: consume(map(effects_of_variants.transform, rows))),
+    Benchmark("transform.virusurf", synthetic.aa_change_parts,
+              chunks_of(virusurf.CHUNK_SIZE, lambda chunk: [virusurf.transform(chunk)])),
+    Benchmark("transform.uniprot", lambda n, seed: synthetic.uniprot_documents(n * 200, seed),
+              lambda rows: consume(chain.from_iterable(map(uniprot.transform, rows))), rows_per_item=200),
+    Benchmark("transform.aa_residues", synthetic.aa_residue_rows,
+              lambda rows: consume(aa_residues.transform(rows))),
+    Benchmark("transform.our_sequence_annotations", synthetic.sequence_annotation_lines,
+              chunks_of(100_000, our_sequence_annotations.transform)),
+]
+
+
+def reset_caches():
+    """
+    Discards the change registry of the run and the caches of protein and variant names.
+    """
+    change_registry._registry = None
+    _organization_of.cache_clear()
+    resolve_protein_name.cache_clear()
+
+
+def measure(benchmark: Benchmark, rows: int, seed: int, repeats: int, max_seconds: float) -> dict:
+    inputs = benchmark.inputs(rows, seed)
+    timings = []
+    while len(timings) < repeats and (not timings or sum(timings) < max_seconds):
+        reset_caches()
+        gc.collect()
+        start = perf_counter()
+        benchmark.body(inputs())
+        timings.append(perf_counter() - start)
+    reset_caches()
+    best = min(timings)
+    return {"benchmark": benchmark.name, "rows": rows, "repeats": len(timings), "best_s": best,
+            "median_s": statistics.median(timings), "rows_per_s": rows / best if best else None}
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(("git",) + args, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(seed: int) -> dict:
+    commit = _git("rev-parse", "--short=12", "HEAD")
+    return {
+        "format_version": FORMAT_VERSION,
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")) if commit else None,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "pool_size": POOL_SIZE
+    }
+
+
+def default_output_path(report: dict) -> str:
+    suffix = "-dirty" if report["dirty"] else ""
+    return os.path.join(OUTPUT_DIR, f"micro-{report['commit'] or 'unknown'}{suffix}.json")
+
+
+def run(scales=SCALES, only: Optional[str] = None, repeats: int = REPEATS, max_seconds: float = MAX_SECONDS,
+        seed: int = 0, output_path: Optional[str] = None) -> dict:
+    """
+    Runs the benchmarks whose name matches the glob pattern only (all of them by default) at each scale.
+    :return: the results, also written as JSON to output_path
+    """
+    logger.remove()     # synthetic names and effects would flood the output with warnings
+    report = environment(seed)
+    report["results"] = results = []
+    for benchmark in BENCHMARKS:
+        if only and not fnmatch.fnmatch(benchmark.name, only):
+            continue
+        for rows in scales:
+            result = measure(benchmark, rows, seed, repeats, max_seconds)
+            results.append(result)
+            print(f"{benchmark.name:<38} {rows:>9} rows  best {result['best_s']:9.4f}s  "
+                  f"median {result['median_s']:9.4f}s  {result['rows_per_s']:>12,.0f} rows/s", flush=True)
+    output_path = output_path or default_output_path(report)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"results written to {output_path}")
+    return report
+
+
+def compare(base_path: str, new_path: str, threshold: float = 0.05) -> List[tuple]:
+    """
+    Prints the ratio new / base of the best timings of the benchmarks present in both files. Ratios beyond
+    1 ± threshold are marked as slower or faster.
+    :return: the (benchmark, rows, ratio) of the regressions
+    """
+    with open(base_path) as base_file, open(new_path) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    for key in ("python", "machine", "cpu_count", "pool_size"):
+        if base.get(key) != new.get(key):
+            print(f"WARNING: {key} differs ({base.get(key)} vs {new.get(key)}): timings may not be comparable")
+    print(f"base {base.get('commit')}{'-dirty' if base.get('dirty') else ''}  "
+          f"new {new.get('commit')}{'-dirty' if new.get('dirty') else ''}")
+    base_results = {(r["benchmark"], r["rows"]): r for r in base["results"]}
+    regressions = []
+    for result in new["results"]:
+        key = (result["benchmark"], result["rows"])
+        if key not in base_results:
+            continue
+        ratio = result["best_s"] / base_results[key]["best_s"]
+        mark = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else ""
+        if mark == "slower":
+            regressions.append(key + (ratio,))
+        print(f"{key[0]:<38} {key[1]:>9} rows  {base_results[key]['best_s']:9.4f}s -> {result['best_s']:9.4f}s  "
+              f"x{ratio:5.2f} {mark}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="CPU micro-benchmarks of the normalization hot paths")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="rows of each benchmark")
+    parser.add_argument("--only", help="glob pattern of the benchmarks to run, e.g. 'transform.*'")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--max-seconds", type=float, default=MAX_SECONDS,
+                        help="no more repetitions of a benchmark after this time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help=f"output JSON file (default {OUTPUT_DIR}micro-<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS_JSON",
+                        help="compare two result files (or a result file with a new run) instead of running")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative change reported by --compare")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two files")
+    if args.compare and len(args.compare) == 2:
+        sys.exit(1 if compare(*args.compare, threshold=args.threshold) else 0)
+    new_report = run(args.scales, args.only, args.repeats, args.max_seconds, args.seed, args.output)
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.output or default_output_path(new_report),
+                              threshold=args.threshold) else 0)
@@ -0,0 +1,369 @@
+"""
+Seeded synthetic rows shaped like the ones each source passes to its transform (i.e. the output of its extract), with
+real protein names, positions within the length of each protein, residues written as long names and variant names of
+every naming system. The same seed always generates the same rows.
+"""
+import random
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from data_validators.change import AAChange
+
+GENOME_LENGTH = 29903
+NUCLEOTIDES = "ACGT"
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+LONG_RESIDUE_NAMES = [name for name in AAChange.residues_map
+                      if len(name) > 3 and name not in ("UNKNOWN", "UNSPECIFIED")]
+
+# protein names used by VirusURF (and the Ruba effect files) -> length in residues
+VCM_PROTEIN_LENGTH = {
+    "ORF1ab polyprotein": 7096, "ORF1a polyprotein": 4405, "Spike (surface glycoprotein)": 1273,
+    "N (nucleocapsid phosphoprotein)": 419, "M (membrane glycoprotein)": 222, "E (envelope protein)": 75,
+    "NS3 (ORF3a protein)": 275, "NS6 (ORF6 protein)": 61, "NS7a (ORF7a protein)": 121, "NS7b (ORF7b)": 43,
+    "NS8 (ORF8 protein)": 121, "ORF10 protein": 38, "NSP1 (leader protein)": 180, "NSP2": 638, "NSP3": 1945,
+    "NSP4": 500, "NSP5 (3C-like proteinase)": 306, "NSP6": 290, "NSP7": 83, "NSP8": 198, "NSP9": 113, "NSP10": 139,
+    "NSP11": 13, "NSP12 (RNA-dependent RNA polymerase)": 932, "NSP13 (helicase)": 601,
+    "NSP14 (3'-to-5' exonuclease)": 527, "NSP15 (endoRNAse)": 346, "NSP16 (2'-O-ribose methyltransferase)": 298
+}
+# most changes of real exports fall in the polyproteins and in the spike
+VCM_PROTEIN_WEIGHT = {"ORF1ab polyprotein": 20, "ORF1a polyprotein": 5, "Spike (surface glycoprotein)": 10,
+                      "N (nucleocapsid phosphoprotein)": 4}
+# gene names used by covariants -> length in residues
+COVARIANTS_GENE_LENGTH = {"S": 1273, "ORF1a": 4405, "ORF1b": 2695, "N": 419, "M": 222, "E": 75, "ORF3a": 275,
+                          "ORF6": 61, "ORF7a": 121, "ORF7b": 43, "ORF8": 121, "ORF9b": 97}
+# protein names used by PHE -> gene, length in residues
+PHE_PROTEINS = {"S": ("S", 1273), "N": ("N", 419), "M": ("M", 222), "E": ("E", 75), "ORF3a": ("ORF3a", 275),
+                "ORF8": ("ORF8", 121), **{f"nsp{i}": ("ORF1ab", length) for i, length in
+                                          ((1, 180), (2, 638), (3, 1945), (4, 500), (5, 306), (6, 290), (8, 198),
+                                           (9, 113), (12, 932), (13, 601), (14, 527), (15, 346), (16, 298))}}
+# UniProt entry names -> accession, length in residues
+UNIPROT_ENTRIES = {
+    "SPIKE_SARS2": ("P0DTC2", 1273), "R1AB_SARS2": ("P0DTD1", 7096), "R1A_SARS2": ("P0DTC1", 4405),
+    "NCAP_SARS2": ("P0DTC9", 419), "VME1_SARS2": ("P0DTC5", 222), "VEMP_SARS2": ("P0DTC4", 75),
+    "AP3A_SARS2": ("P0DTC3", 275), "NS6_SARS2": ("P0DTC6", 61), "NS7A_SARS2": ("P0DTC7", 121),
+    "NS7B_SARS2": ("P0DTD8", 43), "NS8_SARS2": ("P0DTC8", 121), "ORF9B_SARS2": ("P0DTD2", 97),
+    "ORF9C_SARS2": ("P0DTD3", 73), "ORF3C_SARS2": ("P0DTG1", 41), "ORF3D_SARS2": ("P0DTG0", 57),
+    "ORF3B_SARS2": ("P0DTF1", 22)
+}
+UNIPROT_FEATURE_TYPES = {"CHAIN": "MOLECULE_PROCESSING", "DOMAIN": "DOMAINS_AND_SITES", "REGION": "DOMAINS_AND_SITES",
+                         "TOPO_DOM": "TOPOLOGY", "TRANSMEM": "TOPOLOGY", "DISULFID": "PTM", "CARBOHYD": "PTM",
+                         "HELIX": "STRUCTURAL", "STRAND": "STRUCTURAL", "VARIANT": "VARIANTS", "MUTAGEN": "MUTAGENESIS"}
+
+GREEK_LETTERS = ["Alpha", "Beta", "Gamma", "Delta", "Epsilon", "Zeta", "Eta", "Theta", "Iota", "Kappa", "Lambda", "Mu",
+                 "Omicron"]
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+AUTHORS = ["Greaney", "Wang", "Liu", "McCallum", "Starr", "Planas", "Cele", "Tegally", "Faria", "Mlcochova", "Plante",
+           "Madhi", "Zhao", "Deng", "Rees-Spear", "Nonaka", "Szemiel", "Wu", "Rahman", "Li"]
+JOURNALS = ["Nature", "Science", "Cell", "Nature medicine", "The new england journal of medicine", "bioRxiv",
+            "medRxiv", "Eurosurveillance", "Journal of medical virology", "PLoS pathogens", "mBio"]
+EVIDENCE_TYPES = ["published", "preprint", "accepted"]
+EFFECTS = [("infectivity", "experimental"), ("binding_to_host_receptor", "experimental"),
+           ("binding_to_host_receptor", "computational"), ("protein_stability", "computational"),
+           ("protein_flexibility", "computational"), ("sensitivity_to_convalescent_sera", "experimental"),
+           ("sensitivity_to_neutralizing_mAbs", "experimental"), ("sensitivity_to_vaccine_sera", "experimental"),
+           ("viral_transmission", "inferred"), ("effectiveness_of_available_antiviral_drugs", "experimental"),
+           ("effectiveness_of_available_vaccines", "epidemiological"), ("risk_of_reinfection", "epidemiological")]
+EFFECT_LEVELS = ["higher", "lower", "null"]
+ESCAPE_DETAILS = ["mAb class1", "mAb class2", "mAb class3", "mAb bamlanivimab", "mAb regdanvimab", "mAb S309",
+                  "mAb COV2-2096", "mAb S2X58", "Plasma", "Vaccine sera"]
+
+# properties of the AA residues as in data_sources/aa_residues/Amino_acids_properities.csv
+POLARITIES = ["Nonpolar", "Polar"]
+R_GROUP_STRUCTURES = ["Aliphatic", "Aromatic", "Cyclic"]
+CHARGES = ["Uncharged", "Positive", "Negative", None]
+ESSENTIALITIES = ["Essential", "Non essential", "Conditionally essential"]
+FLEXIBILITIES = ["Limited", "Low", "Moderate", "High"]
+CHEMICAL_GROUPS = ["Methylene", "Sulfur", "Carboxylic acid", "Amide", "Hydroxyl", "Phenyl", "Indole", "Guanidinium"]
+# annotations of data_sources/our_sequence_annotations/sars_cov_2.tsv: gene -> CDS (begin, end), protein name
+ANNOTATED_GENES = {"S": (21563, 25384, "Spike (surface glycoprotein)"), "ORF3a": (25393, 26220, "NS3 (ORF3a protein)"),
+                   "E": (26245, 26472, "E (envelope protein)"), "M": (26523, 27191, "M (membrane glycoprotein)"),
+                   "ORF6": (27202, 27387, "NS6 (ORF6 protein)"), "ORF7a": (27394, 27759, "NS7a (ORF7a protein)"),
+                   "ORF7b": (27756, 27887, "NS7b (ORF7b)"), "ORF8": (27894, 28259, "NS8 (ORF8 protein)"),
+                   "N": (28274, 29533, "N (nucleocapsid phosphoprotein)"), "ORF10": (29558, 29674, "ORF10 protein")}
+
+
+def _weighted(weights: Dict[str, int], default: int = 1) -> Tuple[List[str], List[int]]:
+    return list(weights.keys()), [weights.get(key, default) for key in weights.keys()]
+
+
+def _residue(rnd: random.Random, long_name_rate: float) -> str:
+    if rnd.random() < long_name_rate:
+        return rnd.choice(LONG_RESIDUE_NAMES).capitalize()
+    return rnd.choice(RESIDUES)
+
+
+def with_duplicates(rows: Callable[[random.Random], Iterator], n: int, duplicate_rate: float, seed: int) -> Iterator:
+    """
+    :return: n rows where, with probability duplicate_rate, a row repeats one of the previous ones instead of being the
+    next one of rows(rnd)
+    """
+    rnd = random.Random(seed)
+    fresh = rows(rnd)
+    emitted = []
+    for _ in range(n):
+        if emitted and rnd.random() < duplicate_rate:
+            yield rnd.choice(emitted)
+        else:
+            row = next(fresh)
+            emitted.append(row)
+            yield row
+
+
+def _aa_change_rows(rnd: random.Random, long_name_rate: float) -> Iterator[Tuple[str, str, str, str]]:
+    proteins, weights = _weighted({p: VCM_PROTEIN_WEIGHT.get(p, 1) for p in VCM_PROTEIN_LENGTH})
+    while True:
+        protein = rnd.choices(proteins, weights)[0]
+        pos = rnd.randint(1, VCM_PROTEIN_LENGTH[protein])
+        alt = "-" if rnd.random() < 0.05 else _residue(rnd, long_name_rate)
+        yield protein, _residue(rnd, long_name_rate), str(pos), alt
+
+
+def aa_change_parts(n: int, seed: int = 0, duplicate_rate: float = 0.0, long_name_rate: float = 0.05) \
+        -> Iterator[Tuple[str, str, str, str]]:
+    """
+    :return: (protein, ref, pos, alt) rows like the ones of the VirusURF exports
+    """
+    return with_duplicates(lambda rnd: _aa_change_rows(rnd, long_name_rate), n, duplicate_rate, seed)
+
+
+def nuc_change_strings(n: int, seed: int = 0) -> Iterator[str]:
+    """
+    :return: NUC changes like C241T, including deletions (A28271-) and insertions (-22205GAGCCAGAA)
+    """
+    rnd = random.Random(seed)
+    for _ in range(n):
+        pos = rnd.randint(1, GENOME_LENGTH)
+        kind = rnd.random()
+        if kind < 0.9:
+            yield f"{rnd.choice(NUCLEOTIDES)}{pos}{rnd.choice(NUCLEOTIDES)}"
+        elif kind < 0.97:
+            yield f"{''.join(rnd.choices(NUCLEOTIDES, k=rnd.randint(1, 9)))}{pos}-"
+        else:
+            yield f"-{pos}{''.join(rnd.choices(NUCLEOTIDES, k=rnd.randint(1, 9)))}"
+
+
+def aa_change_strings(n: int, seed: int = 0) -> Iterator[str]:
+    """
+    :return: AA changes like S:D614G, with covariants' gene names
+    """
+    rnd = random.Random(seed)
+    genes = list(COVARIANTS_GENE_LENGTH)
+    for _ in range(n):
+        gene = rnd.choice(genes)
+        alt = "-" if rnd.random() < 0.05 else rnd.choice(RESIDUES)
+        yield f"{gene}:{rnd.choice(RESIDUES)}{rnd.randint(1, COVARIANTS_GENE_LENGTH[gene])}{alt}"
+
+
+def pango_lineage(rnd: random.Random) -> str:
+    if rnd.random() < 0.3:
+        return f"{rnd.choice(['AY', 'BA', 'P', 'Q', 'C'])}.{rnd.randint(1, 40)}"
+    return ".".join(["B"] + [str(rnd.randint(1, 9 if depth else 1)) for depth in range(rnd.randint(1, 4))])
+
+
+def variant_names(n: int, seed: int = 0) -> Iterator[str]:
+    """
+    :return: names of variants of every naming system (WHO, PANGO, Nextstrain, PHE, GISAID) and unrecognizable ones
+    """
+    rnd = random.Random(seed)
+    kinds = [
+        lambda: rnd.choice(GREEK_LETTERS),
+        lambda: pango_lineage(rnd),
+        lambda: f"{rnd.randint(19, 22)}{chr(65 + rnd.randrange(26))}",
+        lambda: f"{rnd.randint(19, 22)}{chr(65 + rnd.randrange(26))} ({rnd.choice(GREEK_LETTERS)})",
+        lambda: f"{rnd.choice(['VOC', 'VUI'])}-{rnd.randint(20, 22)}{rnd.choice(MONTHS)}-{rnd.randint(1, 9):02d}",
+        lambda: f"{rnd.choice(['GR', 'GH', 'GRY', 'G'])}/{rnd.randint(1, 999)}{rnd.choice(RESIDUES)}."
+                f"V{rnd.randint(1, 3)}",
+        lambda: f"{rnd.choice(['Not a variant', 'unknown', 'Cluster'])} {rnd.randint(1, 99)}"
+    ]
+    for _ in range(n):
+        yield rnd.choice(kinds)()
+
+
+def covariants_clusters(n: int, seed: int = 0) -> Iterator[dict]:
+    """
+    :return: the variant clusters of clusters.json, without the per-country fields skipped by the reader
+    """
+    rnd = random.Random(seed)
+    genes = list(COVARIANTS_GENE_LENGTH)
+    for i in range(n):
+        clade = f"{20 + i % 4}{chr(65 + (i // 4) % 26)}"
+        greek = GREEK_LETTERS[i % len(GREEK_LETTERS)] if rnd.random() < 0.3 else None
+        display_name = f"{clade} ({greek})" if greek else f"{clade}.{i}"
+        lineages = sorted({pango_lineage(rnd) for _ in range(rnd.randint(1, 3))})
+        nonsynonymous = []
+        for gene in sorted(rnd.choices(genes, k=rnd.randint(10, 40))):
+            right = "-" if rnd.random() < 0.08 else rnd.choice(RESIDUES)
+            nonsynonymous.append({"gene": gene, "left": rnd.choice(RESIDUES),
+                                  "pos": rnd.randint(1, COVARIANTS_GENE_LENGTH[gene]), "right": right})
+        synonymous = [{"left": rnd.choice(NUCLEOTIDES), "pos": rnd.randint(1, GENOME_LENGTH),
+                       "right": rnd.choice(NUCLEOTIDES)} for _ in range(rnd.randint(3, 15))]
+        yield {
+            "alt_display_name": [f"{clade}.V{i}"] if rnd.random() < 0.2 else [],
+            "build_name": f"{clade}.{greek or i}",
+            "col": f"#{rnd.randrange(1 << 24):06X}",
+            "display_name": display_name,
+            "graphing": rnd.random() < 0.5,
+            "important": rnd.random() < 0.5,
+            "mutations": {"nonsynonymous": nonsynonymous, "synonymous": synonymous},
+            "nextstrain_build": True,
+            "nextstrain_name": display_name,
+            "nextstrain_url": f"https://nextstrain.org/groups/neherlab/ncov/{clade}.{greek or i}",
+            "old_build_names": [],
+            "pango_lineages": [{"name": name, "url": f"https://cov-lineages.org/lineages/lineage_{name}.html"}
+                               for name in lineages],
+            "snps": sorted(rnd.sample(range(1, GENOME_LENGTH), 3)),
+            "type": "variant",
+            "who_name": [greek] if greek else []
+        }
+
+
+def _unique_id(rnd: random.Random, i: int) -> str:
+    words = ["animating", "thermos", "quiet", "radius", "copper", "lantern", "marble", "orbit", "willow", "falcon"]
+    return f"{rnd.choice(words)}-{rnd.choice(words)}-{i}"
+
+
+def phe_variants(n: int, seed: int = 0) -> Iterator[dict]:
+    """
+    :return: the variant definitions of the PHE YAML files
+    """
+    rnd = random.Random(seed)
+    proteins = list(PHE_PROTEINS)
+    for i in range(n):
+        changes = []
+        for _ in range(rnd.randint(5, 30)):
+            ref, alt = rnd.sample(NUCLEOTIDES, 2)
+            change = {"codon-change": f"{ref}{ref}{ref}-{ref}{ref}{alt}",
+                      "one-based-reference-position": rnd.randint(1, GENOME_LENGTH), "reference-base": ref,
+                      "type": "SNP", "variant-base": alt}
+            protein = rnd.choice(proteins)
+            gene, length = PHE_PROTEINS[protein]
+            codon_position = rnd.randint(1, length)
+            change.update({"gene": gene, "protein": protein, "protein-codon-position": codon_position})
+            if rnd.random() < 0.7:
+                change["predicted-effect"] = "non-synonymous"
+                change["amino-acid-change"] = f"{rnd.choice(RESIDUES)}{codon_position}{rnd.choice(RESIDUES)}"
+            else:
+                change["predicted-effect"] = "synonymous"
+            changes.append(change)
+        yield {
+            "unique-id": _unique_id(rnd, i),
+            "phe-label": f"{rnd.choice(['VOC', 'VUI'])}-{20 + i % 3}{MONTHS[i % 12]}-{i % 100:02d}",
+            "alternate-names": [f"{rnd.choice(['VOC', 'VUI'])}{2020 + i % 3}{(i % 12) + 1:02d}/{i % 100:02d}"],
+            "belongs-to-lineage": [{"PANGO": pango_lineage(rnd)}],
+            "description": f"This variant is a cluster of {rnd.choice(RESIDUES)}{rnd.randint(1, 1273)}"
+                           f"{rnd.choice(RESIDUES)} containing genomes",
+            "information-sources": [],
+            "variants": changes
+        }
+
+
+def coguk_me_items(n: int, seed: int = 0) -> Iterator[dict]:
+    """
+    :return: the spike changes with escape evidence of the COG-UK ME JSON
+    """
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield {
+            "change": f"{rnd.choice(RESIDUES)}{rnd.randint(1, 1273)}{rnd.choice(RESIDUES)}",
+            "domain": rnd.choice(["RBM", "RBD", "NTD", "S2"]),
+            "escape_mut_details": ", ".join(rnd.sample(ESCAPE_DETAILS, rnd.randint(1, 6))),
+            "cumulative_seq_uk": str(rnd.randint(1, 300_000)),
+            "seq_over_28d": str(rnd.randint(0, 100_000)),
+            "confidence": rnd.choice(["high", "medium", "low"]),
+            "references": [_reference(rnd) for _ in range(rnd.randint(1, 5))]
+        }
+
+
+def _reference(rnd: random.Random) -> dict:
+    year = rnd.randint(2020, 2022)
+    return {"author": f"{rnd.choice(AUTHORS)} et al. ({year})",
+            "doi": f"https://doi.org/10.{rnd.randint(1000, 1999)}/{rnd.randint(10 ** 6, 10 ** 7)}"}
+
+
+def _evidence(rnd: random.Random) -> Tuple[str, str, str, str]:
+    reference = _reference(rnd)
+    return reference["author"], rnd.choice(EVIDENCE_TYPES), reference["doi"], rnd.choice(JOURNALS)
+
+
+def _effect(rnd: random.Random) -> Tuple[str, str, str]:
+    effect_type, method = rnd.choice(EFFECTS)
+    return effect_type, rnd.choice(EFFECT_LEVELS), method
+
+
+def ruba_aa_change_effects(n: int, seed: int = 0) -> Iterator[tuple]:
+    """
+    :return: (AA changes, effect, evidence) rows of the Ruba files of effects of (groups of) AA changes
+    """
+    rnd = random.Random(seed)
+    changes = _aa_change_rows(rnd, long_name_rate=0)
+    for _ in range(n):
+        yield list(islice(changes, 1 if rnd.random() < 0.7 else rnd.randint(2, 4))), _effect(rnd), _evidence(rnd)
+
+
+def ruba_variant_effects(n: int, seed: int = 0) -> Iterator[tuple]:
+    """
+    :return: (PANGO lineage, effect, evidence) rows of the Ruba file of effects of variants
+    """
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield pango_lineage(rnd), _effect(rnd), _evidence(rnd)
+
+
+def uniprot_document(rnd: random.Random, entry_name: str, n_features: int) -> dict:
+    """
+    :return: the UniProt feature document of entry_name, with n_features features
+    """
+    accession, length = UNIPROT_ENTRIES[entry_name]
+    feature_types = list(UNIPROT_FEATURE_TYPES)
+    features = []
+    for _ in range(n_features):
+        _type = rnd.choice(feature_types)
+        begin = rnd.randint(1, length)
+        end = min(length, begin + rnd.randint(0, 300))
+        features.append({"type": _type, "category": UNIPROT_FEATURE_TYPES[_type],
+                         "description": f"{_type.capitalize().replace('_', ' ')} {rnd.randint(1, 50)}",
+                         "begin": str(begin), "end": str(end), "evidences": []})
+    return {"accession": accession, "entryName": entry_name, "taxid": 2697049, "features": features}
+
+
+def uniprot_documents(n_features: int, seed: int = 0, features_per_document: int = 200) -> Iterator[dict]:
+    """
+    :return: UniProt feature documents with n_features features in total
+    """
+    rnd = random.Random(seed)
+    entries = list(UNIPROT_ENTRIES)
+    while n_features > 0:
+        document = uniprot_document(rnd, rnd.choice(entries), min(n_features, features_per_document))
+        n_features -= len(document["features"])
+        yield document
+
+
+def aa_residue_rows(n: int, seed: int = 0) -> Iterator[tuple]:
+    """
+    :return: rows of AA residue properties like the ones read from Amino_acids_properities.csv
+    """
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield (rnd.choice(RESIDUES), rnd.randint(57, 186), float(rnd.randint(3, 11)), round(rnd.uniform(0, 1), 3),
+               rnd.randint(0, 4), rnd.choice(POLARITIES), rnd.choice(R_GROUP_STRUCTURES), rnd.choice(CHARGES),
+               rnd.choice(ESSENTIALITIES), rnd.choice(FLEXIBILITIES), rnd.choice(CHEMICAL_GROUPS))
+
+
+def sequence_annotation_lines(n: int, seed: int = 0, lines_per_annotation: int = 40) -> Iterator[List[str]]:
+    """
+    :return: the split lines of a sequence annotation TSV like sars_cov_2.tsv, describing n / lines_per_annotation
+    copies of the genes
+    """
+    rnd = random.Random(seed)
+    copies = max(1, n // lines_per_annotation)
+    genes = list(ANNOTATED_GENES)
+    for _ in range(n):
+        gene = rnd.choice(genes)
+        begin, end, protein = ANNOTATED_GENES[gene]
+        copy = rnd.randrange(copies)
+        if rnd.random() < 0.5:
+            yield ["NC_045512.2", "RefSeq", "gene", f"{begin},{end}", f"{gene}.{copy}", ".", ".", "."]
+        else:
+            sequence = "".join(rnd.choices(RESIDUES, k=(end - begin + 1) // 3))
+            yield ["NC_045512.2", "RefSeq", "CDS", f"{begin},{end}", f"{gene}.{copy}", protein,
+                   f"YP_{rnd.randint(10 ** 8, 10 ** 9)}.1", sequence]
@@ -0,0 +1 @@
+# Makes the packages of the project root importable by the tests in tests/. Run from the project root with: pytest
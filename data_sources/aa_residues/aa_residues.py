@@ -7,6 +7,8 @@ import numpy
 
 from db_config.mongodb_model import AAResidue
 from db_config.connection import close_conn
+from pipeline.etl import Source
+from pipeline.sinks import UpsertSink
 
 file_path_amino_acid_chemical_prop = f"data_sources{sep}aa_residues{sep}Amino_acids_properities.csv"
 file_path_grantham_dist = f"data_sources{sep}aa_residues{sep}Grantham_distance.csv"
@@ -74,7 +76,7 @@ def transform_grantham_dist() -> Dict:
     return {r: list_grantham_distance_from_residue(r) for r in all_residues}
 
 
-def transform() -> Generator[Tuple, None, None]:
+def extract() -> Generator[Tuple, None, None]:
     with open(file_path_amino_acid_chemical_prop, "r") as file:
         file.readline()
         for line in file.readlines():
@@ -94,23 +96,22 @@ def transform() -> Generator[Tuple, None, None]:
                   essentiality, side_chain_flexibility, side_chain_chem_group
 
 
-def load(aa_residues: Iterable[Tuple]):
-    db_objects = []
-    for description in aa_residues:
-        db_objects.append(AAResidue(description))
-    AAResidue.db().insert_many(map(vars, db_objects))
+def transform(aa_residues: Iterable[Tuple]) -> Generator[AAResidue, None, None]:
+    grantham_dist_for_residues = transform_grantham_dist()
+    for aa_prop in aa_residues:
+        yield AAResidue((*aa_prop, grantham_dist_for_residues[aa_prop[0]]))
+
+
+SOURCE = Source('aa_residues', extract, [transform], UpsertSink())
 
 
 def run():
-    aa_residues = list(transform())
-    grantham_dist_for_residues = transform_grantham_dist()
-    aa_residues = [(*aa_prop, grantham_dist_for_residues[aa_prop[0]]) for aa_prop in aa_residues]
+    SOURCE.run()
 
-    try:
-        load(aa_residues)
-    finally:
-        close_conn()
 
 if __name__ == "__main__":
     chdir(f"..{sep}..{sep}")
-    run()
+    try:
+        run()
+    finally:
+        close_conn()
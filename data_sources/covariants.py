@@ -1,19 +1,27 @@
 import itertools
-from utils import download_file
+import os
+from download_cache import download
 import warnings
 from os.path import sep
 from loguru import logger
 import sys
 import json
-from typing import List, Set, Tuple
-from data_validators.change import AAChange, Change as NUCChange
-from data_validators.new_variant import recognize_organization
+from typing import Generator, Iterable, List, TextIO
+from data_validators.change_registry import open_registry, close_registry
+from data_validators.new_variant import recognize_organizations
 import db_config.mongodb_model as db_schema
 import db_config.connection as connection
+from json_stream import JSONStream
+from pipeline.dedup import open_merge_stage, close_merge_stage
+from pipeline.etl import Source
+from pipeline.metrics import measured
+from pipeline.sinks import CallbackSink
 from data_validators.vocabulary import Organization
 
 URL = "https://raw.githubusercontent.com/hodcroftlab/covariants/master/web/data/clusters.json"
 LOCAL_PATH = "./generated/covariants/clusters.json" .replace("/", sep)
+# per-country data of each cluster, not used by this source
+SKIPPED_FIELDS = ("country_info", "cluster_data")
 
 
 class SourceVariant:
@@ -65,135 +73,139 @@ class SourceVariant:
         names = {n.strip() for n in names if n.strip()}
         return list(names)
 
-    def aa_changes(self) -> List[AAChange]:
+    def aa_changes(self) -> List[int]:
+        """
+        :return: the IDs of the AA changes of this variant in the change registry of the run.
+        """
+        registry = open_registry()
         non_syn_muts = []
         try:
             for mut in self.data["mutations"]["nonsynonymous"]:
-                for aa_change in AAChange.from_parts(
+                non_syn_muts += registry.aa_from_parts(
                         mut["gene"].strip(),  # <- protein
                         mut["left"].strip(),
                         mut["pos"],
-                        mut["right"].strip()):
-                    non_syn_muts.append(aa_change)
+                        mut["right"].strip())
         except KeyError:
             pass
         return non_syn_muts
 
-    def nuc_changes(self) -> List[NUCChange]:
+    def nuc_changes(self) -> List[int]:
+        """
+        :return: the IDs of the NUC changes of this variant in the change registry of the run.
+        """
+        registry = open_registry()
         syn_muts = []
         try:
             for mut in self.data["mutations"]["synonymous"]:
-                for nuc_change in NUCChange.from_parts(
+                syn_muts += registry.nuc_from_parts(
                         mut["left"].strip(),
                         mut["pos"],
-                        mut["right"].strip()):
-                    syn_muts.append(nuc_change)
+                        mut["right"].strip())
         except KeyError:
             pass
         return syn_muts
 
 
-def download_source_file() -> None:
+def download_source_file() -> bool:
+    """
+    If the download fails, the copy of the previous download is used, if any.
+    :return: whether the content of the source file changed since the previous download.
+    """
     try:
-        download_file(URL, LOCAL_PATH)
+        with measured('covariants', 'download') as stats:
+            result = download(URL, LOCAL_PATH)
+            stats.bytes = result.received
+            stats.rows_out = int(result.received > 0)
+        return result.changed
     except:
-        logger.exception("Download failed. Aborting...")
-        sys.exit(1)
+        if not os.path.exists(LOCAL_PATH):
+            logger.exception("Download failed. Aborting...")
+            raise
+        logger.exception(f"Download failed. Using the previous copy of {LOCAL_PATH}")
+        return False
+
+
+def read_clusters(input_file: TextIO) -> Generator[dict, None, None]:
+    """
+    Parses clusters.json incrementally, without building the fields in SKIPPED_FIELDS.
+    :return: the clusters, one at a time
+    """
+    stream = JSONStream(input_file)
+    for key in stream.keys():
+        if key != "clusters":
+            stream.skip()
+            continue
+        for _ in stream.elements():
+            cluster = dict()
+            for field in stream.keys():
+                if field in SKIPPED_FIELDS:
+                    stream.skip()
+                else:
+                    cluster[field] = stream.value()
+            yield cluster
 
 
-def read_input_file() -> List[SourceVariant]:
+def read_input_file() -> Generator[SourceVariant, None, None]:
     with open(LOCAL_PATH, mode='r') as input_file:
         try:
-            source_variants: dict = json.load(input_file)
+            for x in read_clusters(input_file):
+                # filter
+                if x["type"] != "variant":
+                    logger.info(f"variant {x['display_name']} of type {x['type']} skipped.")
+                    continue
+                yield SourceVariant(x)
         except json.JSONDecodeError:
             logger.exception(f"Can't decode JSON {LOCAL_PATH}")
             sys.exit(1)
 
-    # unnest
-    source_variants: list = source_variants["clusters"]
-    # filter
-    parsed_variants = []
-    for x in source_variants:
-        if x["type"] != "variant":
-            logger.info(f"variant {x['display_name']} of type {x['type']} skipped.")
-            continue
-        y = SourceVariant(x)
-        parsed_variants.append(y)
-    return parsed_variants
-
 
-def transform(parsed_variants: List[SourceVariant]) -> Tuple[List, Set, Set]:
-    # transform
-    variants: List[db_schema.Variant] = []
-    aa_changes: Set[db_schema.AAChange] = set()
-    nuc_changes: Set[db_schema.NUCChange] = set()
+def transform(parsed_variants: Iterable[SourceVariant]) -> Generator[db_schema.Variant, None, None]:
+    """
+    :return: a variant for each cluster, characterized by the AA and NUC changes of its mutations
+    """
+    registry = open_registry()
     for variant_in in parsed_variants:
-        aliases = [db_schema.Variant.Name(recognize_organization(name, Organization.COVARIANTS), name, None)
-                   for name in variant_in.aliases()]
+        names = variant_in.aliases()
+        aliases = [db_schema.Variant.Name(org, name, None)
+                   for org, name in zip(recognize_organizations(names, Organization.COVARIANTS), names)]
         aa_v_characterization = db_schema.Variant.Characterization(
             Organization.COVARIANTS,
-            [change.get_encoded_string() for change in variant_in.aa_changes()]
+            registry.aa_encoded_strings(variant_in.aa_changes())
         )
         nuc_v_characterization = db_schema.Variant.Characterization(
             Organization.COVARIANTS,
-            [change.get_encoded_string() for change in variant_in.nuc_changes()]
+            registry.nuc_encoded_strings(variant_in.nuc_changes())
         )
-        # append to returned db objects
-        variants.append(db_schema.Variant(aliases, [aa_v_characterization], [nuc_v_characterization]))
-        aa_changes.update([change.to_db_obj() for change in variant_in.aa_changes()])
-        nuc_changes.update([change.to_db_obj() for change in variant_in.nuc_changes()])
-    return variants, aa_changes, nuc_changes
+        yield db_schema.Variant(aliases, [aa_v_characterization], [nuc_v_characterization])
+
+
+def load(variants: Iterable[db_schema.Variant]):
+    """
+    Adds the variants of the clusters to the merge stage of the run (see pipeline.dedup).
+    """
+    merge_stage = open_merge_stage()
+    for variant in variants:
+        merge_stage.add(variant)
 
 
-def load(variants: List[db_schema.Variant], aa_changes: Set[db_schema.AAChange], nuc_changes: Set[db_schema.NUCChange]):
-    db_schema.Variant.db().insert_many(map(vars, variants))
-    db_schema.AAChange.db().insert_many(map(vars, aa_changes))
-    db_schema.NUCChange.db().insert_many(map(vars, nuc_changes))
+SOURCE = Source('covariants', read_input_file, [transform], CallbackSink(load))
 
 
 def run():
-    try:
-        # EXTRACT
-        download_source_file()
-        source_variants = read_input_file()
-
-        # for var in source_variants:
-        #     # DESCRIBE VARIANTS
-        #     # logger.info(f"\n"
-        #     #             f"name: {var.name()}\n"
-        #     #             f"aliases: {var.aliases()}\n"
-        #     #             f"aa_changes: {var.aa_changes()}\n"
-        #     #             f"nuc_changes: {var.nuc_changes()}")
-        #
-        #     #DESCRIBE ALIASES
-        #     names = var.aliases()
-        #     names.append(var.id())
-        #     names = list(set(names))
-        #     organizations = list(map(lambda n: (n, '->', recognize_organization(n, Organization.COVARIANTS)), names))
-        #     organizations.sort(key=lambda x: x[2])
-        #     logger.info(f"\n"
-        #                 f"IN CLUSTER {var.id()}:\n"
-        #                 f"{organizations}")
-
-        # TRANSFORM
-        variants, aa_changes, nuc_changes = transform(source_variants)
-
-        # number_gen = itertools.count()
-        # for var in variants:
-        #     print(f'{next(number_gen)} CLUSTER:')
-        #     sorted_aliases = sorted(var.aliases, key=lambda x: x.org)
-        #     print([vars(x) for x in sorted_aliases])
-
-        #LOAD
-        try:
-            # load method requests a DB connection
-            load(variants, aa_changes, nuc_changes)
-        finally:
-            connection.close_conn()
-    except:
-        logger.exception("")
+    # Even when the file did not change, the variants are needed by the merge stage: without them, the variants of the
+    # other sources would be merged into different alias sets and stored as new documents.
+    if not download_source_file():
+        logger.info(f"{LOCAL_PATH} unchanged since the last run")
+    # the clusters flow one at a time from the file to the merge stage
+    SOURCE.run()
 
 
 if __name__ == "__main__":
     LOCAL_PATH = "." + LOCAL_PATH
     run()
+    try:
+        close_merge_stage()
+        close_registry()
+    finally:
+        connection.close_conn()
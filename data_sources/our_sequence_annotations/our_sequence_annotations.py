@@ -1,9 +1,12 @@
 from os.path import sep
 from os import chdir
 from pprint import pprint
+from typing import Generator, Iterable, List
 import db_config.mongodb_model as db_schema
 from db_config.mongodb_model import Structure
 import db_config.connection as connection
+from pipeline.etl import Source
+from pipeline.sinks import UpsertSink
 
 file_path = f".{sep}data_sources{sep}our_sequence_annotations{sep}sars_cov_2.tsv"
 
@@ -45,58 +48,62 @@ def translate_protein_name(name: str):
         raise AssertionError("Translation dictionary incomplete")
 
 
-def transform():
+def extract() -> Generator[List[str], None, None]:
     with open(file_path, mode="r") as file:
-        rows = dict()
-        for line in file.readlines():
-            _, _, ann_type, begin_end, gene, protein, _, aa_sequence = line.rstrip().split("\t")
-            if ann_type in ("mature_protein_region", "CDS", "gene"):
-                annotation_id = gene
-            else:
-                annotation_id = ann_type
-            # find or create new nuc_annotation
-            nuc_annotation = rows.get(annotation_id)
-            if not nuc_annotation:
-                nuc_annotation = Structure(annotation_id)
-                rows[annotation_id] = nuc_annotation
-            # compute data
-            begin = int(begin_end[:begin_end.index(",")])
-            end = int(begin_end[begin_end.rindex(",") + 1:])
-            # pour data
-            if ann_type in ("mature_protein_region", "CDS"):
-                length = end - begin
-                length += 1 if ";" not in begin_end else 2
-                assert length % 3 == 0, "Protein length not multiple of 3!"
+        for line in file:
+            yield line.rstrip().split("\t")
+
 
-                protein_characterization = Structure.ProteinCharacterization(
-                    protein_name=translate_protein_name(protein),
-                    aa_length=int(length/3),
-                    aa_sequence=aa_sequence
-                )
-                # find or create protein_characterization
-                if not nuc_annotation.protein_characterization:
-                    nuc_annotation.protein_characterization = [protein_characterization]
-                else:
-                    nuc_annotation.protein_characterization.append(protein_characterization)
+def transform(lines: Iterable[List[str]]) -> Iterable[Structure]:
+    """
+    :return: the structures described by the lines, which are grouped by annotation, after reading all of them
+    """
+    rows = dict()
+    for _, _, ann_type, begin_end, gene, protein, _, aa_sequence in lines:
+        if ann_type in ("mature_protein_region", "CDS", "gene"):
+            annotation_id = gene
+        else:
+            annotation_id = ann_type
+        # find or create new nuc_annotation
+        nuc_annotation = rows.get(annotation_id)
+        if not nuc_annotation:
+            nuc_annotation = Structure(annotation_id)
+            rows[annotation_id] = nuc_annotation
+        # compute data
+        begin = int(begin_end[:begin_end.index(",")])
+        end = int(begin_end[begin_end.rindex(",") + 1:])
+        # pour data
+        if ann_type in ("mature_protein_region", "CDS"):
+            length = end - begin
+            length += 1 if ";" not in begin_end else 2
+            assert length % 3 == 0, "Protein length not multiple of 3!"
+
+            protein_characterization = Structure.ProteinCharacterization(
+                protein_name=translate_protein_name(protein),
+                aa_length=int(length/3),
+                aa_sequence=aa_sequence
+            )
+            # find or create protein_characterization
+            if not nuc_annotation.protein_characterization:
+                nuc_annotation.protein_characterization = [protein_characterization]
             else:
-                nuc_annotation.start_on_ref = begin
-                nuc_annotation.stop_on_ref = end
-    return rows
+                nuc_annotation.protein_characterization.append(protein_characterization)
+        else:
+            nuc_annotation.start_on_ref = begin
+            nuc_annotation.stop_on_ref = end
+    return rows.values()
 
 
-def load(transformed_nuc_annotations: dict):
-    for _, nuc_annotation in transformed_nuc_annotations.items():
-        Structure.db().insert_one(vars(nuc_annotation))
+SOURCE = Source('our_sequence_annotations', extract, [transform], UpsertSink())
 
 
 def run():
-    transformed_annotations = transform()
-    try:
-        load(transformed_annotations)
-    finally:
-        connection.close_conn()
+    SOURCE.run()
 
 
 if __name__ == '__main__':
     chdir(f"..{sep}..{sep}")
-    run()
\ No newline at end of file
+    try:
+        run()
+    finally:
+        connection.close_conn()
\ No newline at end of file
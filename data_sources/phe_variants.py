@@ -1,6 +1,8 @@
+import multiprocessing
 import os
 import re
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from loguru import logger
 import sys
 import glob
@@ -9,13 +11,18 @@ from os.path import sep
 from os import chdir, getcwd
 
 import data_validators.new_variant
-from utils import download_file, download_dir_for
-from typing import Collection, List, Set, Tuple
-from data_validators.change import AAChange, Change as NUCChange
+from utils import download_dir_for
+from download_cache import download
+from typing import Collection, Iterable, List, Set
+from data_validators.change_registry import open_registry, close_registry
 from data_validators.vocabulary import Organization
-from data_validators.new_variant import recognize_organization
+from data_validators.new_variant import recognize_organizations
 import db_config.mongodb_model as db_schema
 import db_config.connection as connection
+from pipeline.dedup import open_merge_stage, close_merge_stage
+from pipeline.etl import Source
+from pipeline.metrics import measured
+from pipeline.sinks import CallbackSink
 
 
 # files to download from directory:
@@ -23,20 +30,39 @@ import db_config.connection as connection
 # the following URL is to download the repo with wget, curl, etc...
 URL = "https://api.github.com/repos/phe-genomics/variant_definitions/zipball/"
 LOCAL_PATH = f'.{sep}generated{sep}phe{sep}git_repo.zip'
+# the C (libyaml) safe loader is several times faster than the pure-Python one, when PyYAML is built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# processes parsing the variant definitions; with 1 they are parsed by the calling process
+PHE_PARSE_PROCESSES = int(os.environ.get('PHE_PARSE_PROCESSES', os.cpu_count() or 1))
+# starting a process costs about as much as parsing a couple of hundred files, so fewer files are parsed in-process
+PHE_FILES_PER_PROCESS = int(os.environ.get('PHE_FILES_PER_PROCESS', 200))
 
 
-def download_source_files() -> None:
+def download_source_files() -> bool:
     """
-    :return: a list of relative file paths.
-    For example ./generated/phe/git_repo/phe-genomics-variant_definitions-1612814/variant_yaml/cheesy-styling.yml
+    Downloads the zipped repository to LOCAL_PATH.
+    :return: whether the content of the repository changed since the previous download.
     """
     try:
-        download_file(URL, LOCAL_PATH)
+        with measured('phe_variants', 'download') as stats:
+            result = download(URL, LOCAL_PATH)
+            stats.bytes = result.received
+            stats.rows_out = int(result.received > 0)
+        return result.changed
     except:
         logger.exception("Download failed. Aborting...")
         sys.exit(1)
-    with zipfile.ZipFile(LOCAL_PATH, 'r') as zip_file:
-        zip_file.extractall(LOCAL_PATH.rstrip(".zip"))
+
+
+def extract_source_files(changed: bool = True):
+    """
+    Extracts the zipped repository, unless it didn't change and it was already extracted. The extracted files are, for
+    example, ./generated/phe/git_repo/phe-genomics-variant_definitions-1612814/variant_yaml/cheesy-styling.yml
+    Only find_source_files() needs them: read_zipped_source_files() reads the archive directly.
+    """
+    if changed or not os.path.isdir(LOCAL_PATH.rstrip(".zip")):
+        with zipfile.ZipFile(LOCAL_PATH, 'r') as zip_file:
+            zip_file.extractall(LOCAL_PATH.rstrip(".zip"))
 
 
 def find_source_files() -> Collection[str]:
@@ -156,63 +182,97 @@ class SourceVariant:
         names = {x.strip() for x in names if x.strip()}
         return list(names)
 
-    def aa_changes(self) -> Collection[AAChange]:
+    def aa_changes(self) -> List[int]:
+        """
+        :return: the IDs of the AA changes of this variant in the change registry of the run. Changes listed among the
+        additional mutations are registered as optional.
+        """
+        registry = open_registry()
         non_syn_muts = []
 
-        def read_change(mut: dict, container: List[AAChange]) -> None:
+        def read_change(mut: dict, container: List[int], optional: bool) -> None:
             _type = mut.get("predicted-effect")
             if _type and _type == "non-synonymous":
-                for aa_change in AAChange.from_string(
-                        mut["protein"]+":"+mut["amino-acid-change"]):
-                    container.append(aa_change)
+                container += registry.aa_from_string(mut["protein"]+":"+mut["amino-acid-change"], optional)
 
         try:
             for mut in self.data["variants"]:
-                read_change(mut, non_syn_muts)
+                read_change(mut, non_syn_muts, False)
             if self.data.get("additional-mutations"):
-                additional_changes: List[AAChange] = []
                 for mut in self.data["additional-mutations"]:
-                    read_change(mut, additional_changes)
-                for x in additional_changes:
-                    x.set_optional()
-                non_syn_muts += additional_changes
+                    read_change(mut, non_syn_muts, True)
         except KeyError:
             logger.exception("")
         return non_syn_muts
 
-    def nuc_changes(self) -> Collection[NUCChange]:
+    def nuc_changes(self) -> List[int]:
+        """
+        :return: the IDs of the NUC changes of this variant in the change registry of the run. Changes listed among the
+        additional mutations are registered as optional.
+        """
+        registry = open_registry()
         syn_muts = []
 
-        def read_change(mut: dict, container: List[NUCChange]) -> None:
+        def read_change(mut: dict, container: List[int], optional: bool) -> None:
             _type = mut.get("predicted-effect")
             if not _type or _type == "synonymous" or _type == "no-effect":
-                for nuc_change in NUCChange.from_parts(
+                container += registry.nuc_from_parts(
                         mut["reference-base"].strip(),
                         mut["one-based-reference-position"],
-                        mut["variant-base"].strip()):
-                    container.append(nuc_change)
+                        mut["variant-base"].strip(),
+                        optional)
 
         try:
             for mut in self.data["variants"]:
-                read_change(mut, syn_muts)
+                read_change(mut, syn_muts, False)
             if self.data.get("additional-mutations"):
-                additional_changes: List[NUCChange] = []
                 for mut in self.data["additional-mutations"]:
-                    read_change(mut, additional_changes)
-                for x in additional_changes:
-                    x.set_optional()
-                syn_muts += additional_changes
+                    read_change(mut, syn_muts, True)
         except KeyError:
             logger.exception("")
         return syn_muts
 
 
-def read_input_files(file_paths: Collection[str]) -> Collection[SourceVariant]:
-    parsed_files = []
+def parse_source_file(content: bytes) -> SourceVariant:
+    return SourceVariant(yaml.load(content, Loader=YAML_LOADER))
+
+
+def parse_source_files(contents: Iterable[bytes], processes: int = PHE_PARSE_PROCESSES) -> List[SourceVariant]:
+    """
+    Parses the YAML variant definitions on a pool of processes.
+    :return: the parsed variants, in the order of contents
+    """
+    contents = list(contents)
+    processes = min(processes, len(contents) // PHE_FILES_PER_PROCESS)
+    if processes <= 1:
+        return [parse_source_file(content) for content in contents]
+    # spawned workers don't inherit the threads and the locks of the other sources running in this process
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return list(executor.map(parse_source_file, contents, chunksize=max(1, len(contents) // (processes * 4))))
+
+
+def read_zipped_source_files(zip_path: str = None, processes: int = PHE_PARSE_PROCESSES) -> List[SourceVariant]:
+    """
+    Parses the .yml files of the zipped repository (LOCAL_PATH by default) without extracting them.
+    :return: the parsed variants, in the order of the files in the archive
+    """
+    zip_path = zip_path or LOCAL_PATH
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        contents = [zip_file.read(member) for member in zip_file.infolist()
+                    if not member.is_dir() and member.filename.endswith('.yml')]
+    if len(contents) == 0:
+        logger.error(f"No .yml file (PHE variant definition) found in {zip_path}\n"
+                     f"Aborting...")
+        sys.exit(1)
+    return parse_source_files(contents, processes)
+
+
+def read_input_files(file_paths: Collection[str], processes: int = PHE_PARSE_PROCESSES) -> List[SourceVariant]:
+    contents = []
     for file_path in file_paths:
-        with open(file_path, mode='r') as file:
-            file_content = yaml.safe_load(file)
-            parsed_files.append(SourceVariant(file_content))
+        with open(file_path, mode='rb') as file:
+            contents.append(file.read())
+    parsed_files = parse_source_files(contents, processes)
 
     # for var in parsed_files:
     #     try:
@@ -228,16 +288,18 @@ def read_input_files(file_paths: Collection[str]) -> Collection[SourceVariant]:
     return parsed_files
 
 
-def transform(parsed_variants: Collection[SourceVariant]) -> Tuple[List, Set, Set]:
-    # transform
+def transform(parsed_variants: Collection[SourceVariant]) -> List[db_schema.Variant]:
+    """
+    :return: a variant for each definition with at least one recognized name. PHE names classify it as VOC or VUI.
+    """
+    registry = open_registry()
     variants: List[db_schema.Variant] = []
-    aa_changes: Set[db_schema.AAChange] = set()
-    nuc_changes: Set[db_schema.NUCChange] = set()
     logger.warning("PHE modules ignores distinction between optional changes and normal ones")
     for variant_in in parsed_variants:
         # find aliases
-        aliases = [db_schema.Variant.Name(recognize_organization(name, None), name, None)
-                   for name in variant_in.aliases()]
+        names = variant_in.aliases()
+        aliases = [db_schema.Variant.Name(org, name, None)
+                   for org, name in zip(recognize_organizations(names, None), names)]
         # clean ignored names
         aliases = [x for x in aliases if x.org is not None]
         if not aliases:
@@ -255,104 +317,40 @@ def transform(parsed_variants: Collection[SourceVariant]) -> Tuple[List, Set, Se
         # create AA characterization
         aa_v_characterization = db_schema.Variant.Characterization(
             Organization.PHE,
-            [change.get_encoded_string() for change in variant_in.aa_changes()]
+            registry.aa_encoded_strings(variant_in.aa_changes())
         )
         # create NUC characterization
         nuc_v_characterization = db_schema.Variant.Characterization(
             Organization.PHE,
-            [change.get_encoded_string() for change in variant_in.nuc_changes()]
+            registry.nuc_encoded_strings(variant_in.nuc_changes())
         )
         # append to returned db objects
         variants.append(db_schema.Variant(aliases, [aa_v_characterization], [nuc_v_characterization]))
-        aa_changes.update([change.to_db_obj() for change in variant_in.aa_changes()])
-        nuc_changes.update([change.to_db_obj() for change in variant_in.nuc_changes()])
-    return variants, aa_changes, nuc_changes
+    return variants
 
 
-def load(variants: List[db_schema.Variant], aa_changes: Set[db_schema.AAChange], nuc_changes: Set[db_schema.NUCChange]):
-    db_schema.Variant.db().insert_many(map(vars, variants))
-    db_schema.AAChange.db().insert_many(map(vars, aa_changes))
-    db_schema.NUCChange.db().insert_many(map(vars, nuc_changes))
+def load(variants: List[db_schema.Variant]):
+    """
+    Adds the variants defined by PHE to the merge stage of the run (see pipeline.dedup).
+    """
+    merge_stage = open_merge_stage()
+    for variant in variants:
+        merge_stage.add(variant)
 
 
-def run():
-    if not os.path.exists(LOCAL_PATH):
-        os.makedirs(LOCAL_PATH, exist_ok=True)
-    try:
-        # example_file_url = "https://raw.githubusercontent.com/phe-genomics/variant_definitions/main/variant_yaml/animating-thermos.yml"
-        # example_file = download_dir_for("phe") + "animating-thermos.yml"
-
-        # with open(example_file, 'r') as stream:
-        #     parsed_file: dict = yaml.safe_load(stream)
-        #     for (k, v) in parsed_file.items():
-        #         if isinstance(v, list):
-        #             parsed_file[k] = [_ for _ in v if _]  # removes Nones from lists
-        #     # remove empty lists, none values
-        #     parsed_file = {key: value for (key, value) in parsed_file.items() if value}
-        #
-        #     # PRINT AS DICT
-        #     for key, value in parsed_file.items():
-        #         print(key + " : " + str(value))
-        #     print("\n")
-
-            # for key in ("belongs-to-lineage",):  # arrays of objects
-            #     try:
-            #         for obj in parsed_file[key]:
-            #             print(obj.values())
-            #     except KeyError:
-            #         pass
-
-            # # PARSE
-            # var = SourceVariant(parsed_file)
-            # # DESCRIBE VARIANTS
-            # logger.info(f"\n"
-            #             f"name: {var.id()}\n"
-            #             f"aliases: {var.aliases()}\n"
-            #             f"aa_changes: {[x.get_encoded_string() for x in var.aa_changes()]}\n"
-            #             f"nuc_changes: {[x.get_encoded_string() for x in var.nuc_changes()]}")
-
-
-
-        # download_source_files()
-        source_files = find_source_files()
-        parsed_variants = read_input_files(source_files)
-
-        # for variant_in in parsed_variants:
-        #     # aliases = [db_schema.Variant.Name(recognize_organization(name, Organization.PHE), name, None)
-        #     #            for name in variant_in.aliases()]
-        #     aliases = [db_schema.Variant.Name(recognize_organization(name, None), name, None)
-        #                for name in variant_in.aliases()]
-        #     names_with_org = [(x.name, '->', x.org) for x in aliases]
-        #     print("\n"
-        #           f"id {variant_in.id()}\n"
-        #           f"{len(aliases)} aliases: {names_with_org}")
-        #     aliases = [x for x in aliases if x.org is not None]
-        #     names_with_org = [(x.name, '->', x.org) for x in aliases]
-        #     print(f"{len(aliases)} aliases after cleaning")
-
-
-        variants, aa_changes, nuc_changes = transform(parsed_variants)
-
-        for v in variants:
-            try:
-                print(vars(v))
-            except:
-                logger.exception(f"exception with variant:\n"
-                                 f"{v.aliases}\n"
-                                 f"{v.org_2_aa_changes}\n"
-                                 f"{v.org_2_nuc_changes}\n")
-
-        # LOAD
-        try:
-            # load method requests a DB connection
-            load(variants, aa_changes, nuc_changes)
-        finally:
-            connection.close_conn()
+SOURCE = Source('phe_variants', read_zipped_source_files, [transform], CallbackSink(load))
 
-    except:
-        logger.exception("")
+
+def run():
+    # download_source_files()
+    SOURCE.run()
 
 
 if __name__ == '__main__':
     chdir(f"..{sep}")
     run()
+    try:
+        close_merge_stage()
+        close_registry()
+    finally:
+        connection.close_conn()
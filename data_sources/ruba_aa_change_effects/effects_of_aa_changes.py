@@ -1,11 +1,14 @@
-from typing import Tuple, List, Iterable
+from typing import Tuple, List
 
 from loguru import logger
 from os.path import sep
 from os import chdir
-from data_validators.change import AAChange
+from data_validators.change_registry import open_registry, close_registry
 import db_config.mongodb_model as db_model
 import db_config.connection as connection
+from pipeline.dedup import open_merge_stage, close_merge_stage
+from pipeline.etl import Source, map_rows
+from pipeline.sinks import CallbackSink
 
 FILE_PATH_EFFECT_SINGLE_AA_CHANGE = "data_sources/ruba_aa_change_effects/a_change_effect.csv".replace("/", sep)
 FILE_PATH_EFFECT_MULTIPLE_AA_CHANGES = "data_sources/ruba_aa_change_effects/group_of_changes_effects.csv".replace("/", sep)
@@ -51,14 +54,16 @@ def extract(file_path: str):
         raise ValueError("the input file contains errors.")
 
 
-def transform_tuple(t: Tuple[List[Tuple], Tuple, Tuple]) -> Tuple[List[db_model.AAChange], db_model.Effect, db_model.Reference]:
+def transform_tuple(t: Tuple[List[Tuple], Tuple, Tuple]) -> Tuple[db_model.Effect, db_model.Reference]:
+    """
+    :return: the effect of a group of AA changes and the evidence reporting it
+    """
+    registry = open_registry()
     aa_changes, effect, evidence = t
 
     # tramsform aa change
-    aa_changes_temp: List[Iterable[AAChange]] = [AAChange.from_parts(x[0], x[1], x[2], x[3]) for x in aa_changes]
-    # unnest result from AAChange.from_parts
-    aa_changes_temp: List[AAChange] = [y for x in aa_changes_temp for y in x]
-    assert len(aa_changes) == len(aa_changes_temp)
+    aa_change_ids: List[int] = [y for x in aa_changes for y in registry.aa_from_parts(x[0], x[1], x[2], x[3])]
+    assert len(aa_changes) == len(aa_change_ids)
 
     # transform effect and evidence
     effect = (x.strip() if x else None for x in effect)
@@ -66,49 +71,44 @@ def transform_tuple(t: Tuple[List[Tuple], Tuple, Tuple]) -> Tuple[List[db_model.
     evidence = (x.strip() if x else None for x in evidence)
     evidence = list(x if x else None for x in evidence)
 
-    parsed_aa_changes = [x.to_db_obj() for x in aa_changes_temp]
-    effect = db_model.Effect(effect[0], effect[1], effect[2], [x.get_encoded_string() for x in aa_changes_temp])
+    effect = db_model.Effect(effect[0], effect[1], effect[2], registry.aa_encoded_strings(aa_change_ids))
     evidence = db_model.Reference(None, evidence[0], evidence[1], evidence[2], evidence[3])
 
-    return parsed_aa_changes, effect, evidence
+    return effect, evidence
 
 
 def load(tuples):
+    """
+    Adds each effect to the merge stage of the run (see pipeline.dedup), followed by the evidence pointing to it.
+    """
+    merge_stage = open_merge_stage()
     for t in tuples:
-        aa_changes, effect, evidence = t
-        # insert aa_changes
-        db_model.AAChange.db().insert_many(map(vars, aa_changes))
-        # insert effects
-        insert_result = db_model.Effect.db().insert_one(vars(effect))
-        effect_id = insert_result.inserted_id
-        # insert evidence
-        evidence.effect_ids = [effect_id]
-        db_model.Reference.db().insert_one(vars(evidence))
+        effect, evidence = t
+        # add effects
+        effect_handle = merge_stage.add(effect)
+        # add evidence
+        evidence.effect_ids = [effect_handle]
+        merge_stage.add(evidence)
 
 
-def run():
-    try:
-        extracted = list(extract(FILE_PATH_EFFECT_SINGLE_AA_CHANGE))
-        transformed = [transform_tuple(e) for e in extracted]
-        try:
-            load(transformed)
-        finally:
-            connection.close_conn()
-    except:
-        logger.exception("")
+def extract_all():
+    yield from extract(FILE_PATH_EFFECT_SINGLE_AA_CHANGE)
+    yield from extract(FILE_PATH_EFFECT_MULTIPLE_AA_CHANGES)
 
-    try:
-        extracted = list(extract(FILE_PATH_EFFECT_MULTIPLE_AA_CHANGES))
-        transformed = [transform_tuple(e) for e in extracted]
-        try:
-            load(transformed)
-        finally:
-            connection.close_conn()
-    except:
-        logger.exception("")
+
+SOURCE = Source('effects_of_aa_changes', extract_all, [map_rows(transform_tuple)], CallbackSink(load))
+
+
+def run():
+    SOURCE.run()
 
 
 if __name__ == '__main__':
     chdir(f"..{sep}..{sep}")
     run()
+    try:
+        close_merge_stage()
+        close_registry()
+    finally:
+        connection.close_conn()
 
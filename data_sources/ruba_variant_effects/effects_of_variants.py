@@ -1,11 +1,14 @@
 from os.path import sep
 from os import chdir
-from typing import Tuple
+from typing import Tuple, Iterable
 
 import data_validators.new_variant
 from db_config.mongodb_model import *
 from loguru import logger
 import db_config.connection as connection
+from pipeline.dedup import open_merge_stage, close_merge_stage
+from pipeline.etl import Source, map_rows
+from pipeline.sinks import CallbackSink
 
 
 FILE_PATH_EFFECTS_OF_VARIANTS = "data_sources/ruba_variant_effects/variants_effects.csv".replace("/", sep)
@@ -41,42 +44,49 @@ def transform(one_effect: Tuple[str, Tuple[str, str, str], Tuple[str, str, str,
     return strings[0], strings[1:4], strings[4:]
 
 
-def load(row: Tuple[str, Tuple[Tuple[str]], Tuple[Tuple[str]]]):
-    pango_id, (effect_type, eff_level, eff_method), (evidence_citation, evidence_type,
-                                                     evidence_uri, evidence_publisher) = row
-    variant_org = data_validators.new_variant.recognize_organization(pango_id)
-    try:
-        variant = Variant(
-            aliases=[Variant.Name(org=variant_org, name=pango_id, v_class=None)]
-        )
-        effect = Effect(effect_type, eff_level, eff_method)
-        evidence = Reference(citation=evidence_citation
-                                           , _type=evidence_type
-                                           , uri=evidence_uri
-                                           , publisher=evidence_publisher)
-
-
-        id_inserted_effect = Effect.db().insert_one(vars(effect)).inserted_id
-        # id is of type ObjectID
-        variant.set_effects([id_inserted_effect])
-        evidence.effect_ids = [id_inserted_effect]
-
-        Variant.db().insert_one(vars(variant))
-        Reference.db().insert_one(vars(evidence))
-    except:
-        logger.exception("")
-        raise
+def load(rows: Iterable[Tuple[str, Tuple[Tuple[str]], Tuple[Tuple[str]]]]):
+    """
+    Adds to the merge stage of the run (see pipeline.dedup) the effect of each row, and a variant named after its
+    PANGO lineage and the evidence, both pointing to the effect.
+    """
+    merge_stage = open_merge_stage()
+    for row in rows:
+        pango_id, (effect_type, eff_level, eff_method), (evidence_citation, evidence_type,
+                                                         evidence_uri, evidence_publisher) = row
+        variant_org = data_validators.new_variant.recognize_organization(pango_id)
+        try:
+            variant = Variant(
+                aliases=[Variant.Name(org=variant_org, name=pango_id, v_class=None)]
+            )
+            effect = Effect(effect_type, eff_level, eff_method)
+            evidence = Reference(citation=evidence_citation
+                                               , _type=evidence_type
+                                               , uri=evidence_uri
+                                               , publisher=evidence_publisher)
+
+            effect_handle = merge_stage.add(effect)
+            # the handle is replaced with the ObjectID of the effect when loading
+            variant.set_effects([effect_handle])
+            evidence.effect_ids = [effect_handle]
+
+            merge_stage.add(variant)
+            merge_stage.add(evidence)
+        except:
+            logger.exception("")
+            raise
+
+
+SOURCE = Source('effects_of_variants', extract, [map_rows(transform)], CallbackSink(load))
 
 
 def run():
-    try:
-        for item in extract():
-            item = transform(item)
-            load(item)
-    finally:
-        connection.close_conn()
+    SOURCE.run()
 
 
 if __name__ == '__main__':
     chdir(f"..{sep}..{sep}")
-    run()
\ No newline at end of file
+    try:
+        run()
+        close_merge_stage()
+    finally:
+        connection.close_conn()
\ No newline at end of file
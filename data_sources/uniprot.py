@@ -1,16 +1,50 @@
-import requests as requests
-import pandas as pd
+import csv
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from os.path import sep
 from os import chdir
+from typing import Dict, Generator, Iterable, List, Optional
 
+import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-import db_config.mongodb_model as db_schema
 from db_config.mongodb_model import ProteinRegion
 import db_config.connection as connection
+from pipeline.etl import Source, flat_map_rows
+from pipeline.metrics import measured
+from pipeline.sinks import UpsertSink
 from data_validators.protein import convert_protein
-
-download_location = f".{sep}generated{sep}uniprot{sep}original_protein_annotations.csv"
+from utils import download_dir_for
+
+URL = "https://www.ebi.ac.uk/proteins/api/features/"
+ACCESSIONS = (
+    "P0DTG1", "P0DTG0", "P0DTF1", "P0DTD8", "P0DTD3", "P0DTD2", "P0DTD1", "P0DTC9", "P0DTC8", "P0DTC7", "P0DTC6",
+    "P0DTC5", "P0DTC4", "P0DTC3", "P0DTC2", "P0DTC1"
+)
+UNIPROT_MAX_WORKERS = int(os.environ.get('UNIPROT_MAX_WORKERS', 4))
+UNIPROT_ATTEMPTS = int(os.environ.get('UNIPROT_ATTEMPTS', 5))
+UNIPROT_BACKOFF_S = float(os.environ.get('UNIPROT_BACKOFF_S', 1))     # doubled after each failed attempt
+UNIPROT_TIMEOUT_S = float(os.environ.get('UNIPROT_TIMEOUT_S', 30))
+# when true, the feature documents are downloaded again even if they are in the cache
+UNIPROT_REFRESH_CACHE = os.environ.get('UNIPROT_REFRESH_CACHE', '').lower() in ('1', 'true', 'yes')
+IGNORED_FEATURE_TYPES = ("VARIANT", "MUTAGEN")
+# Annotations of every accession exported from UniProt and shipped with the repository. When an accession cannot be
+# downloaded (e.g. offline runs) and is not in the cache, its features are read from here instead.
+BUNDLED_ANNOTATIONS_PATH = f".{sep}generated{sep}uniprot{sep}original_protein_annotations.csv"
+# UniProt entry name of each accession, to find its rows in the bundled annotations
+ENTRY_NAMES = {
+    "P0DTG1": "ORF3C_SARS2", "P0DTG0": "ORF3D_SARS2", "P0DTF1": "ORF3B_SARS2", "P0DTD8": "NS7B_SARS2",
+    "P0DTD3": "ORF9C_SARS2", "P0DTD2": "ORF9B_SARS2", "P0DTD1": "R1AB_SARS2", "P0DTC9": "NCAP_SARS2",
+    "P0DTC8": "NS8_SARS2", "P0DTC7": "NS7A_SARS2", "P0DTC6": "NS6_SARS2", "P0DTC5": "VME1_SARS2",
+    "P0DTC4": "VEMP_SARS2", "P0DTC3": "AP3A_SARS2", "P0DTC2": "SPIKE_SARS2", "P0DTC1": "R1A_SARS2"
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
 
 
 def translate_protein(protein_code):
@@ -51,99 +85,139 @@ def translate_protein(protein_code):
     return protein_name
 
 
-def download_annotation_file():
-
-    all_protein_codes = [
-        "P0DTG1", "P0DTG0", "P0DTF1", "P0DTD8", "P0DTD3", "P0DTD2", "P0DTD1", "P0DTC9", "P0DTC8", "P0DTC7", "P0DTC6",
-        "P0DTC5", "P0DTC4", "P0DTC3", "P0DTC2", "P0DTC1"
-    ]
-    url = "https://www.ebi.ac.uk/proteins/api/features/"
-
-    array_all = []
-    for protein_code in all_protein_codes:
-        full_url = url + protein_code
-        response = requests.get(full_url)
-        response = response.json()
-
-        features = response['features']
-        for single_feature in features:
-            # 'accession': response.get('accession'),
-            single_line = {}
-            if 'entryName' in response:
-                single_line['Protein'] = translate_protein(response['entryName']).split(' ')[0]
-            else:
-                single_line['Protein'] = None
-
-            if 'type' in single_feature:
-                single_line['Type'] = single_feature['type']
-            else:
-                single_line['Type'] = None
-
-            if 'category' in single_feature:
-                single_line['Category'] = single_feature['category']
-            else:
-                single_line['Category'] = None
-
-            if 'description' in single_feature:
-                description = single_feature['description'].strip()
-                if description:
-                    single_line = description
-            else:
-                single_line['Description'] = None
-
-            if 'begin' in single_feature:
-                single_line['Begin'] = single_feature['begin']
-            else:
-                single_line['Begin'] = None
-
-            if 'end' in single_feature:
-                single_line['End'] = single_feature['end']
-            else:
-                single_line['End'] = None
-
-            if 'evidences' in single_feature:
-                evidences = single_feature['evidences']
-                array_url = []
-                for evidence in evidences:
-                    if 'source' in evidence:
-                        array_url.append(evidence['source']['url'])
-                single_line['EvidenceUrls'] = array_url
-            else:
-                single_line['EvidenceUrls'] = []
-            array_all.append(single_line)
-
-    table = pd.DataFrame(array_all)
-    # noinspection PyTypeChecker
-    table.to_csv(download_location, index=False, header=True, sep="\t")
-
-
-def load():
-    protein_regions = []
-    with open(download_location, "r") as downloaded_file:
-        downloaded_file.readline()  # skip header
-        for line in downloaded_file.readlines():
-            protein_name, _type, category, description, begin, end, _ = line[:line.rindex("[")].split("\t")
-            description = description if description else None
-            _type = _type if _type else None
-            if _type in ["VARIANT", "MUTAGEN"]:
-                continue
-            protein_name = protein_name if protein_name else None
-            assert protein_name != None, f"Protein name is NULL in {line}"
-            protein_name, begin, end = convert_protein(protein_name, int(begin), int(end))
-            protein_regions.append(ProteinRegion(protein_name, begin, end, description, _type, category))
-    for p in protein_regions:
-        print(vars(p))
-    ProteinRegion.db().insert_many(map(vars, protein_regions))
+def open_session() -> requests.Session:
+    """
+    :return: the keep-alive session shared by the threads fetching from UniProt. Failed requests and responses with
+    status 429 or 5xx are retried with exponential backoff.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=UNIPROT_ATTEMPTS - 1, backoff_factor=UNIPROT_BACKOFF_S,
+                          status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UNIPROT_MAX_WORKERS, max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is not None:
+        session.close()
+
+
+def cache_path_of(accession: str) -> str:
+    return f"{download_dir_for('uniprot')}features{sep}{accession}.json"
+
+
+_bundled_features: Optional[Dict[str, List[dict]]] = None
+_bundled_lock = threading.Lock()
+
+
+def read_bundled_features() -> Dict[str, List[dict]]:
+    """
+    :return: the features in the bundled annotations, by protein name (as returned by translate_protein)
+    """
+    global _bundled_features
+    with _bundled_lock:
+        if _bundled_features is None:
+            features = dict()
+            with open(BUNDLED_ANNOTATIONS_PATH, "r", newline='') as annotations_file:
+                for row in csv.DictReader(annotations_file, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    features.setdefault(row['Protein'], []).append({
+                        'type': row['Type'], 'category': row['Category'], 'description': row['Description'],
+                        'begin': row['Begin'], 'end': row['End']
+                    })
+            _bundled_features = features
+        return _bundled_features
+
+
+def bundled_features_of(accession: str) -> dict:
+    """
+    :return: a feature document of the accession built from the bundled annotations, with the fields used by
+    transform()
+    """
+    protein_name = translate_protein(ENTRY_NAMES[accession])
+    features = read_bundled_features().get(protein_name)
+    if not features:
+        raise KeyError(f"No bundled annotations for the UniProt accession {accession} ({protein_name})")
+    # the bundled annotations are keyed by the translated name, which translate_protein() returns unchanged
+    return {'accession': accession, 'entryName': protein_name, 'features': features}
+
+
+def fetch_features(accession: str, refresh: bool = UNIPROT_REFRESH_CACHE) -> dict:
+    """
+    :return: the feature document of the UniProt accession, read from the on-disk cache of the raw responses if
+    present, otherwise downloaded and saved in the cache. If the download fails, the features are read from the
+    bundled annotations (BUNDLED_ANNOTATIONS_PATH), which are not saved in the cache.
+    """
+    cache_path = cache_path_of(accession)
+    if not refresh and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as cached:
+            return json.load(cached)
+    try:
+        with measured('uniprot', 'download') as stats:
+            response = open_session().get(URL + accession, headers={'Accept': 'application/json'},
+                                          timeout=UNIPROT_TIMEOUT_S)
+            response.raise_for_status()
+            stats.bytes = len(response.content)
+            stats.rows_out = 1
+    except requests.RequestException as e:
+        if accession not in ENTRY_NAMES or not os.path.exists(BUNDLED_ANNOTATIONS_PATH):
+            raise
+        logger.warning(f"Download of the UniProt accession {accession} failed ({e}). Its features are read from "
+                       f"{BUNDLED_ANNOTATIONS_PATH}")
+        return bundled_features_of(accession)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path + '.tmp', 'wb') as cache_file:
+        cache_file.write(response.content)
+    os.replace(cache_path + '.tmp', cache_path)
+    return response.json()
+
+
+def extract(accessions: Iterable[str] = ACCESSIONS, max_workers: int = UNIPROT_MAX_WORKERS) \
+        -> Generator[dict, None, None]:
+    """
+    Fetches at most max_workers accessions concurrently.
+    :return: the feature documents of the accessions, in the order of accessions.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='uniprot') as executor:
+        yield from executor.map(fetch_features, accessions)
+
+
+def transform(document: dict) -> Generator[ProteinRegion, None, None]:
+    """
+    :return: the protein regions described by the features of a UniProt feature document, except variants and
+    mutagenesis sites.
+    """
+    protein_name = translate_protein(document['entryName']).split(' ')[0] if document.get('entryName') else None
+    assert protein_name is not None, f"Protein name is NULL in the document of {document.get('accession')}"
+    for feature in document['features']:
+        _type = feature.get('type') or None
+        if _type in IGNORED_FEATURE_TYPES:
+            continue
+        description = (feature.get('description') or '').strip() or None
+        name, begin, end = convert_protein(protein_name, int(feature['begin']), int(feature['end']))
+        yield ProteinRegion(name, begin, end, description, _type, feature.get('category'))
+
+
+SOURCE = Source('uniprot', extract, [flat_map_rows(transform)], UpsertSink())
 
 
 def run():
-    # download_annotation_file()
     try:
-        load()
+        SOURCE.run()
     finally:
-        connection.close_conn()
+        close_session()
 
 
 if __name__ == '__main__':
     chdir(f"..{sep}")   # move to root dir
-    run()
+    try:
+        run()
+    finally:
+        connection.close_conn()
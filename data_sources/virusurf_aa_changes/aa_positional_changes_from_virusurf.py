@@ -1,37 +1,64 @@
+import os
 from os import chdir
 from os.path import sep
-from data_validators.change import AAChange
-from typing import Generator
-import db_config.mongodb_model as kb_model
+from data_validators.change import AAChange, ChangeColumns
+from data_validators.change_registry import open_registry, close_registry
 from db_config.connection import close_conn
 from loguru import logger
+from typing import Generator, Iterable, List, Tuple
+from pipeline.etl import Source, batched, map_rows
+from pipeline.sinks import CallbackSink
 
 SOURCE_FILE_PATH = "data_sources/virusurf_aa_changes/distinct_aa_changes_vcm_du_21_11_30.csv".replace('/', sep)
 
 
-def extract_transform() -> Generator[AAChange, None, None]:
+# rows parsed at once by AAChange.bulk_from_parts (one protein conversion per distinct protein and position in a chunk)
+CHUNK_SIZE = int(os.environ.get('VIRUSURF_CHUNK_SIZE', 100_000))
+
+
+def read_rows() -> Generator[Tuple[str, str, str, str], None, None]:
     with open(SOURCE_FILE_PATH, "r") as source_file:
         source_file.readline()  # skip header
         for line in source_file:
             virusurf_proitein, ref, pos, alt, _type, length = line.rstrip('\n').split(',')
-            for change_4_kb in AAChange.from_parts(virusurf_proitein, ref, pos, alt):
-                yield change_4_kb.to_db_obj()
+            yield virusurf_proitein, ref, pos, alt
 
 
-def load(generator_of_aa_changes):
-    db = kb_model.AAChange.db()
-    try:
-        db.insert_many(list(map(vars, generator_of_aa_changes)))
-    except:
-        logger.exception("")
-    finally:
-        close_conn()
+def extract() -> Iterable[List[Tuple[str, str, str, str]]]:
+    """
+    :return: the rows of the source file in chunks of CHUNK_SIZE rows
+    """
+    return batched(CHUNK_SIZE)(read_rows())
+
+
+def transform(chunk: List[Tuple[str, str, str, str]]) -> ChangeColumns:
+    proteins, refs, positions, alts = zip(*chunk)
+    return AAChange.bulk_from_parts(proteins, refs, positions, alts)
+
+
+def load(aa_change_columns: Iterable[ChangeColumns]):
+    """
+    Registers each chunk of AA changes parsed in bulk. No variant or effect references them.
+    """
+    registry = open_registry()
+    for columns in aa_change_columns:
+        ids = registry.aa_from_columns(columns)
+        logger.info(f"{len(ids)} AA changes from VirusURF, {len(set(ids))} distinct")
+
+
+# each row passed between the stages is a chunk
+SOURCE = Source('virusurf_aa_changes', extract, [map_rows(transform)], CallbackSink(load, batch_size=1),
+                queue_batch_size=1)
 
 
 def run():
-    load(extract_transform())
+    SOURCE.run()
 
 
 if __name__ == '__main__':
     chdir(f'..{sep}..{sep}')
     run()
+    try:
+        close_registry()
+    finally:
+        close_conn()
@@ -1,13 +1,28 @@
 import re
 import warnings
+from itertools import repeat
+import numpy as np
 from data_validators.vocabulary import ChangeType
-from data_validators.protein import convert_protein
+from data_validators.protein import convert_protein, convert_positions
 import db_config.mongodb_model as db_schema
-from typing import Iterable, Union
+from typing import Iterable, Optional, Tuple, Union
 
 capital_letters = re.compile(r'[A-Z]*')
 
 
+def type_and_length(ref: str, alt: str) -> Tuple[str, int]:
+    """
+    Classifies an already uniformed change as DEL, INS or SUB and returns its type together with its length.
+    """
+    length = max(len(alt), len(ref))
+    if '-' in alt or len(ref) > len(alt):
+        return ChangeType.DEL, length
+    elif '' == ref or len(ref) < len(alt):
+        return ChangeType.INS, length
+    else:
+        return ChangeType.SUB, length
+
+
 class Change:
     """
     Container class for fields: ref, pos, alt. Makes ref and alt both uppercase and changes 'DEL' to symbol '-'.
@@ -18,13 +33,7 @@ class Change:
         self.alt: str = alt
         self.optional: bool = False
         self.uniform()
-        self.length = max(len(self.alt), len(self.ref))
-        if '-' in self.alt or len(self.ref) > len(self.alt):
-            self._type = ChangeType.DEL
-        elif '' == self.ref or len(self.ref) < len(self.alt):
-            self._type = ChangeType.INS
-        else:
-            self._type = ChangeType.SUB
+        self._type, self.length = type_and_length(self.ref, self.alt)
 
     # shared objects
     ref_regex = re.compile(r'[a-zA-Z\-\*]*')
@@ -38,6 +47,21 @@ class Change:
         Checks that ref, pos and alt represent a change (syntactic checks) and returns one or more corresponding
         Change objects.
         """
+        yield Change(*Change.check_parts(ref, pos, alt))
+
+    @staticmethod
+    def from_string(input_string: str) -> Iterable:
+        """
+        Parses the change encoded as input_string and returns one or more corresponding Change objects.
+        """
+        yield Change(*Change.split_string(input_string))
+
+    @staticmethod
+    def check_parts(ref: str, pos: Union[int, str], alt: str) -> Tuple[str, int, str]:
+        """
+        Syntactic checks of Change.from_parts. Returns the stripped ref, the (first) position as int and the stripped
+        alt or raises ValueError.
+        """
         ref = ref.strip()
         try:
             pos.strip()
@@ -61,12 +85,12 @@ class Change:
                 f"match with the regex {str(Change.alt_regex.pattern)}")
         if '/' in pos:  # split concatenated mutations (usually they are close by changes, e.g. AT69/70- ==> AT69-)
             pos, _ = pos.split('/')
-        yield Change(ref, int(pos), alt)
+        return ref, int(pos), alt
 
     @staticmethod
-    def from_string(input_string: str) -> Iterable:
+    def split_string(input_string: str) -> Tuple[str, int, str]:
         """
-        Parses the change encoded as input_string and returns one or more corresponding Change objects.
+        Syntactic checks of Change.from_string. Returns ref, the (first) position as int and alt or raises ValueError.
         """
         # the regex matches strings like <ref><pos><alt> where
         # <ref> can be none or a combination of letters and "-"
@@ -83,17 +107,42 @@ class Change:
 
         if '/' in pos:  # split concatenated mutations (usually they are close by changes, e.g. AT69/70- ==> AT69-)
             pos, _ = pos.split('/')
-        yield Change(ref, int(pos), alt)
+        return ref, int(pos), alt
 
-    def uniform(self):
-        self.ref = self.ref.upper()
+    @staticmethod
+    def uniform_parts(ref: str, alt: str) -> Tuple[str, str]:
+        ref = ref.upper()
         # e.g. -10T (insertion of T) ==> 10T
-        if self.ref == '-':
-            self.ref = ''
-        self.alt = self.alt.upper()
+        if ref == '-':
+            ref = ''
+        alt = alt.upper()
         # e.g. A11DEL (deletion of A) ==> A11-
-        if self.alt == 'DEL':
-            self.alt = '-'
+        if alt == 'DEL':
+            alt = '-'
+        return ref, alt
+
+    @staticmethod
+    def bulk_from_strings(input_strings: Iterable[str]) -> 'ChangeColumns':
+        """
+        Columnar equivalent of Change.from_string for a whole column of encoded changes. Distinct inputs are parsed
+        once; raises ValueError on the first invalid input like the scalar method.
+        """
+        distinct, inverse = _distinct(input_strings)
+        refs, positions, alts = _bulk_split_strings(distinct)
+        return _build_columns(None, refs, positions, alts, inverse)
+
+    @staticmethod
+    def bulk_from_parts(refs: Iterable[str], positions: Iterable[Union[int, str]], alts: Iterable[str]) \
+            -> 'ChangeColumns':
+        """
+        Columnar equivalent of Change.from_parts for parallel columns of ref, pos and alt. Distinct inputs are parsed
+        once; raises ValueError on the first invalid input like the scalar method.
+        """
+        refs, positions, alts = _bulk_check_parts(refs, positions, alts)
+        return _build_columns(None, refs, positions, alts)
+
+    def uniform(self):
+        self.ref, self.alt = Change.uniform_parts(self.ref, self.alt)
 
     def set_optional(self):
         self.optional = True
@@ -128,13 +177,7 @@ class AAChange:
         self.alt: str = change.alt
         self.optional: bool = change.optional
         self.uniform()
-        self.length = max(len(self.alt), len(self.ref))
-        if '-' in self.alt or len(self.ref) > len(self.alt):
-            self._type = ChangeType.DEL
-        elif '' == self.ref or len(self.ref) < len(self.alt):
-            self._type = ChangeType.INS
-        else:
-            self._type = ChangeType.SUB
+        self._type, self.length = type_and_length(self.ref, self.alt)
 
     # map for translating AA residue names and special values (e.g. 'STOP') to single letter codes or symbols.
     # noinspection SpellCheckingInspection
@@ -188,6 +231,9 @@ class AAChange:
     special_residues_map = {
         'STOP': '*'
     }
+    residues_map = {**short_residues_map, **long_residues_map, **special_residues_map}
+    # alternation of all residues' names, longest first, so that a name is never translated piecewise
+    residues_regex = re.compile('|'.join(sorted(residues_map, key=len, reverse=True)))
     protein_name_replacements = {
         'GLYCOPROTEIN': '',
         'PHOSPHOPROTEIN': '',
@@ -265,6 +311,29 @@ class AAChange:
         for change in Change.from_string(changes_str):
             yield AAChange(protein, change)
 
+    @staticmethod
+    def bulk_from_strings(input_strings: Iterable[str]) -> 'ChangeColumns':
+        """
+        Columnar equivalent of AAChange.from_string for a whole column of changes encoded as <protein>:<change>.
+        """
+        distinct, inverse = _distinct(input_strings)
+        proteins, changes_str = [], []
+        for input_string in distinct:
+            protein, change_str = input_string.split(":")
+            proteins.append(protein)
+            changes_str.append(change_str)
+        refs, positions, alts = _bulk_split_strings(changes_str)
+        return _build_columns(proteins, refs, positions, alts, inverse)
+
+    @staticmethod
+    def bulk_from_parts(proteins: Iterable[str], refs: Iterable[str], positions: Iterable[Union[int, str]],
+                        alts: Iterable[str]) -> 'ChangeColumns':
+        """
+        Columnar equivalent of AAChange.from_parts for parallel columns of protein, ref, pos and alt.
+        """
+        refs, positions, alts = _bulk_check_parts(refs, positions, alts)
+        return _build_columns(proteins, refs, positions, alts)
+
     def uniform(self):
         # self.protein = self.protein.upper()
         # # convert protein names
@@ -343,25 +412,21 @@ class AAChange:
         #         warnings.warn(f"AA change with protein {self.protein} and pos {self.pos} doesn't resolve to any NSP")
 
         self.protein, self.pos, _ = convert_protein(self.protein, self.pos)
+        self.ref, self.alt = AAChange.translate_residues(self.ref, self.alt)
 
-        # substitute special characters in residues' names (e.g. STOP => '*')
-        for old, new in self.long_residues_map.items():
-            self.ref = self.ref.replace(old, new)
-            self.alt = self.alt.replace(old, new)
-
-        # substitute all occurrences of long residues' names
-        # BEWARE to do this before replacing short names or the translation might be wrong!
-        original_len = len(self.ref) + len(self.alt)
-        for old, new in self.long_residues_map.items():
-            self.ref = self.ref.replace(old, new)
-            self.alt = self.alt.replace(old, new)
-
-        # substitute all occurrences of short residues' names
-        # BEWARE to do this only if there are not long residues names or the translation might be wrong!
-        if not len(self.ref) + len(self.alt) < original_len:
-            for old, new in self.short_residues_map.items():
-                self.ref = self.ref.replace(old, new)
-                self.alt = self.alt.replace(old, new)
+    @staticmethod
+    def translate_residues(ref: str, alt: str) -> Tuple[str, str]:
+        # residues' names are at least 3 letters long: single letter codes and symbols are already translated
+        if len(ref) < 3 and len(alt) < 3:
+            return ref, alt
+        # substitute all occurrences of long, short and special residues' names in a single pass.
+        # Long names are tried before the short ones (e.g. GLUTAMINE before GLU) or the translation might be wrong!
+        return AAChange.residues_regex.sub(AAChange._residue_symbol, ref), \
+            AAChange.residues_regex.sub(AAChange._residue_symbol, alt)
+
+    @staticmethod
+    def _residue_symbol(match: re.Match) -> str:
+        return AAChange.residues_map[match.group()]
 
     def set_optional(self):
         self.optional = True
@@ -380,3 +445,142 @@ class AAChange:
             self.length,
             is_opt=self.optional
         )
+
+
+class ChangeColumns:
+    """
+    Columnar result of the bulk parsers of Change and AAChange. Each attribute is a NumPy array with one element per
+    input change: protein (None for NUC changes), ref, pos, alt, type, length and change_id (the encoded string).
+    """
+    def __init__(self, protein: np.ndarray, ref: np.ndarray, pos: np.ndarray, alt: np.ndarray, _type: np.ndarray,
+                 length: np.ndarray, change_id: np.ndarray):
+        self.protein: np.ndarray = protein
+        self.ref: np.ndarray = ref
+        self.pos: np.ndarray = pos
+        self.alt: np.ndarray = alt
+        self.type: np.ndarray = _type
+        self.length: np.ndarray = length
+        self.change_id: np.ndarray = change_id
+
+    def __len__(self):
+        return len(self.change_id)
+
+    def is_aa(self) -> bool:
+        return len(self) > 0 and self.protein[0] is not None
+
+    def to_db_objs(self, is_opt: bool = False) -> Iterable[Union[db_schema.AAChange, db_schema.NUCChange]]:
+        if self.is_aa():
+            for i in range(len(self)):
+                yield db_schema.AAChange(self.change_id[i], self.protein[i], self.ref[i], self.pos[i], self.alt[i],
+                                         self.type[i], self.length[i], is_opt=is_opt)
+        else:
+            for i in range(len(self)):
+                yield db_schema.NUCChange(self.change_id[i], self.ref[i], self.pos[i], self.alt[i], self.type[i],
+                                          self.length[i], is_opt=is_opt)
+
+
+def _distinct(keys: Iterable) -> Tuple[list, np.ndarray]:
+    """
+    :return: the distinct keys in order of first occurrence and, for each input key, the index of its distinct value.
+    """
+    keys = list(keys)
+    distinct = list(dict.fromkeys(keys))
+    index = {k: i for i, k in enumerate(distinct)}
+    return distinct, np.fromiter(map(index.__getitem__, keys), dtype=np.int64, count=len(keys))
+
+
+# Change.ref_pos_alt_regex applied to one change per line
+_lines_of_ref_pos_alt_regex = re.compile(r'^' + Change.ref_pos_alt_regex.pattern + r'$', re.MULTILINE)
+
+
+def _bulk_split_strings(input_strings: list) -> Tuple[tuple, tuple, tuple]:
+    """
+    Change.split_string applied to a list of strings with a single regex scan. The returned positions are strings.
+    """
+    if not input_strings:
+        return (), (), ()
+    text = '\n'.join(input_strings)
+    matches = _lines_of_ref_pos_alt_regex.findall(text)
+    if len(matches) != len(input_strings) or text.count('\n') != len(input_strings) - 1:
+        # replay the scalar checks to raise the same error of Change.from_string
+        for x in input_strings:
+            Change.split_string(x)
+        raise ValueError("Column of changes not recognized as valid changes")
+    refs, positions, alts = zip(*matches)
+    return refs, positions, alts
+
+
+def _bulk_check_parts(refs: Iterable[str], positions: Iterable[Union[int, str]], alts: Iterable[str]) \
+        -> Tuple[list, list, list]:
+    """
+    Change.check_parts applied to parallel columns of ref, pos and alt. The returned positions are strings.
+    """
+    refs = list(map(str.strip, refs))
+    positions = list(map(str, positions))
+    alts = list(map(str.strip, alts))
+    if not (all(map(Change.ref_regex.fullmatch, refs))
+            and all(map(Change.pos_regex.fullmatch, positions))
+            and all(map(Change.alt_regex.fullmatch, alts))):
+        # replay the scalar checks to raise the same error of Change.from_parts
+        for x in zip(refs, positions, alts):
+            Change.check_parts(*x)
+    return refs, positions, alts
+
+
+def _to_position(pos: str) -> int:
+    if '/' in pos:  # split concatenated mutations (usually they are close by changes, e.g. AT69/70- ==> AT69-)
+        pos, _ = pos.split('/')
+    return int(pos)
+
+
+_change_types = np.array([ChangeType.SUB, ChangeType.DEL, ChangeType.INS], dtype=object)
+
+
+def _build_columns(proteins: Optional[Iterable[str]], refs: Iterable[str], positions: Iterable[str],
+                   alts: Iterable[str], inverse: Optional[np.ndarray] = None) -> ChangeColumns:
+    """
+    Applies the uniform() step of Change (and of AAChange if proteins is given) to whole columns of parsed changes.
+    If inverse is given, the result is expanded to the original order of the input through it.
+    """
+    refs, alts, positions = list(refs), list(alts), list(positions)
+    n = len(refs)
+    if n:
+        refs = ['' if x == '-' else x for x in '\n'.join(refs).upper().split('\n')]
+        alts = ['-' if x == 'DEL' else x for x in '\n'.join(alts).upper().split('\n')]
+    positions = np.fromiter(map(_to_position if '/' in ''.join(positions) else int, positions),
+                            dtype=np.int64, count=n)
+    ref_len = np.fromiter(map(len, refs), dtype=np.int64, count=n)
+    alt_len = np.fromiter(map(len, alts), dtype=np.int64, count=n)
+
+    if proteins is not None:
+        # convert the positions of each distinct protein name at once
+        raw_proteins = np.array(list(proteins), dtype=object)
+        proteins = raw_proteins.copy()
+        for raw_protein in dict.fromkeys(raw_proteins.tolist()):
+            rows = np.flatnonzero(raw_proteins == raw_protein)
+            proteins[rows], positions[rows], _ = convert_positions(raw_protein, positions[rows])
+        # residue names have at least 3 letters: shorter refs and alts are already translated
+        rows = np.flatnonzero((ref_len >= 3) | (alt_len >= 3))
+        translated = dict()
+        for i in rows.tolist():
+            key = (refs[i], alts[i])
+            if key not in translated:
+                translated[key] = AAChange.translate_residues(*key)
+            refs[i], alts[i] = translated[key]
+            ref_len[i], alt_len[i] = len(refs[i]), len(alts[i])
+        change_ids = list(map(''.join, zip(proteins.tolist(), repeat(':', n), refs, map(str, positions.tolist()), alts)))
+    else:
+        proteins = np.full(n, None, dtype=object)
+        change_ids = list(map(''.join, zip(refs, map(str, positions.tolist()), alts)))
+
+    # type_and_length over the whole column
+    is_del = np.fromiter(map(str.__contains__, alts, repeat('-', n)), dtype=bool, count=n) | (ref_len > alt_len)
+    is_ins = ~is_del & ((ref_len == 0) | (ref_len < alt_len))
+    types = _change_types[is_del + 2 * is_ins]
+    lengths = np.maximum(ref_len, alt_len)
+
+    columns = (proteins, np.array(refs, dtype=object), positions, np.array(alts, dtype=object), types, lengths,
+               np.array(change_ids, dtype=object))
+    if inverse is not None:
+        columns = (c[inverse] for c in columns)
+    return ChangeColumns(*columns)
@@ -0,0 +1,189 @@
+"""
+AA and NUC changes of a pipeline run. Sources do not load changes themselves: they register them in the registry of
+the run (open_registry()) and keep their IDs or encoded strings, while close_registry(), which runs once every source
+adding changes has completed, loads each distinct change once.
+"""
+import threading
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from data_validators.change import AAChange, Change, ChangeColumns
+import db_config.mongodb_model as db_schema
+from db_config.batched_loader import BatchedLoader
+
+
+class ChangeRegistry:
+    """
+    Collects the AA and NUC changes produced by all the sources of a pipeline run. Each raw input is parsed once and
+    each normalized change receives a dense integer ID (AA and NUC changes are numbered separately) the first time
+    it is seen. At the end of the run, load() writes every distinct change exactly once.
+    A change is stored as optional only if every registration of it was optional, so the result does not depend on the
+    order of the sources. The raw inputs are cached together with their optional flag.
+    The registry can be shared by sources running in different threads.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._aa_changes: List[db_schema.AAChange] = []
+        self._nuc_changes: List[db_schema.NUCChange] = []
+        self._aa_id_of: Dict[str, int] = dict()      # change_id -> ID
+        self._nuc_id_of: Dict[str, int] = dict()     # change_id -> ID
+        self._aa_ids_of_input: Dict[Hashable, List[int]] = dict()     # raw input -> IDs
+        self._nuc_ids_of_input: Dict[Hashable, List[int]] = dict()    # raw input -> IDs
+
+    def _register(self, change: Union[db_schema.AAChange, db_schema.NUCChange], id_of: Dict[str, int],
+                  changes: list) -> int:
+        _id = id_of.get(change.change_id)
+        if _id is None:
+            _id = len(changes)
+            id_of[change.change_id] = _id
+            changes.append(change)
+        elif not change.is_optional:
+            changes[_id].is_optional = False    # required by at least one registration
+        return _id
+
+    def _register_aa(self, input_key: Hashable, parsed_changes, optional: bool) -> List[int]:
+        parsed_changes = list(parsed_changes)   # parse outside the lock
+        with self._lock:
+            ids = []
+            for change in parsed_changes:
+                if optional:
+                    change.set_optional()
+                ids.append(self._register(change.to_db_obj(), self._aa_id_of, self._aa_changes))
+            self._aa_ids_of_input[input_key] = ids
+        return ids
+
+    def _register_nuc(self, input_key: Hashable, parsed_changes, optional: bool) -> List[int]:
+        parsed_changes = list(parsed_changes)   # parse outside the lock
+        with self._lock:
+            ids = []
+            for change in parsed_changes:
+                if optional:
+                    change.set_optional()
+                ids.append(self._register(change.to_db_obj(), self._nuc_id_of, self._nuc_changes))
+            self._nuc_ids_of_input[input_key] = ids
+        return ids
+
+    def aa_from_parts(self, protein: str, ref: str, pos: Union[int, str], alt: str, optional: bool = False) \
+            -> List[int]:
+        """
+        Registers the changes of AAChange.from_parts(protein, ref, pos, alt) and returns their IDs.
+        """
+        key = ('parts', protein, ref, pos, alt, optional)
+        ids = self._aa_ids_of_input.get(key)
+        if ids is None:
+            ids = self._register_aa(key, AAChange.from_parts(protein, ref, pos, alt), optional)
+        return ids
+
+    def aa_from_string(self, input_string: str, optional: bool = False) -> List[int]:
+        """
+        Registers the changes of AAChange.from_string(input_string) and returns their IDs.
+        """
+        key = (input_string, optional)
+        ids = self._aa_ids_of_input.get(key)
+        if ids is None:
+            ids = self._register_aa(key, AAChange.from_string(input_string), optional)
+        return ids
+
+    def aa_from_columns(self, columns: ChangeColumns, optional: bool = False) -> List[int]:
+        """
+        Registers the changes parsed in bulk by AAChange.bulk_from_strings / bulk_from_parts and returns their IDs.
+        """
+        ids = []
+        with self._lock:
+            for i, change_id in enumerate(columns.change_id):
+                _id = self._aa_id_of.get(change_id)
+                if _id is None:
+                    _id = self._register(
+                        db_schema.AAChange(change_id, columns.protein[i], columns.ref[i], columns.pos[i],
+                                           columns.alt[i], columns.type[i], columns.length[i], is_opt=optional),
+                        self._aa_id_of, self._aa_changes)
+                elif not optional:
+                    self._aa_changes[_id].is_optional = False
+                ids.append(_id)
+        return ids
+
+    def nuc_from_parts(self, ref: str, pos: Union[int, str], alt: str, optional: bool = False) -> List[int]:
+        """
+        Registers the changes of Change.from_parts(ref, pos, alt) and returns their IDs.
+        """
+        key = ('parts', ref, pos, alt, optional)
+        ids = self._nuc_ids_of_input.get(key)
+        if ids is None:
+            ids = self._register_nuc(key, Change.from_parts(ref, pos, alt), optional)
+        return ids
+
+    def nuc_from_string(self, input_string: str, optional: bool = False) -> List[int]:
+        """
+        Registers the changes of Change.from_string(input_string) and returns their IDs.
+        """
+        key = (input_string, optional)
+        ids = self._nuc_ids_of_input.get(key)
+        if ids is None:
+            ids = self._register_nuc(key, Change.from_string(input_string), optional)
+        return ids
+
+    def aa_change(self, _id: int) -> db_schema.AAChange:
+        return self._aa_changes[_id]
+
+    def nuc_change(self, _id: int) -> db_schema.NUCChange:
+        return self._nuc_changes[_id]
+
+    def aa_encoded_strings(self, ids: Sequence[int]) -> List[str]:
+        return [self._aa_changes[_id].change_id for _id in ids]
+
+    def nuc_encoded_strings(self, ids: Sequence[int]) -> List[str]:
+        return [self._nuc_changes[_id].change_id for _id in ids]
+
+    def __len__(self):
+        return len(self._aa_changes) + len(self._nuc_changes)
+
+    @property
+    def inputs_count(self) -> int:
+        """
+        :return: the number of distinct raw inputs registered, except those parsed in bulk
+        """
+        return len(self._aa_ids_of_input) + len(self._nuc_ids_of_input)
+
+    def load(self) -> int:
+        """
+        Writes each distinct AA and NUC change once (upserting on change_id).
+        :return: the bytes written
+        """
+        with BatchedLoader() as loader:
+            for change in self._aa_changes:
+                loader.upsert(change)
+            for change in self._nuc_changes:
+                loader.upsert(change)
+        logger.info(f"Loaded {len(self._aa_changes)} distinct AA changes and {len(self._nuc_changes)} distinct NUC "
+                    f"changes from {self.inputs_count} distinct inputs")
+        return sum(loader.bytes_written.values())
+
+
+_registry: Optional[ChangeRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def open_registry() -> ChangeRegistry:
+    """
+    :return: the registry shared by all the sources of this run. It is created on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ChangeRegistry()
+        return _registry
+
+
+def close_registry() -> Tuple[int, int, int]:
+    """
+    Loads the changes collected by the shared registry and discards it.
+    :return: the number of distinct raw inputs, the number of distinct changes loaded and the bytes written
+    """
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is None:
+        logger.warning("Request to close a change registry that was never opened.")
+        return 0, 0, 0
+    return registry.inputs_count, len(registry), registry.load()
@@ -1,4 +1,7 @@
 import re
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
 from loguru import logger
 
 from data_validators.vocabulary import Organization
@@ -222,6 +225,16 @@ def test_regex_of_variant_names():
     experiment_tests = set()
     for e in experiments:
         experiment_tests.update(e.tests_should_pass)
+
+    # the combined regex must classify every test case as the sequence of regex does
+    test_cases = sorted(experiment_tests.union(*(e.tests_should_not_pass for e in experiments)))
+    combined_vs_sequential = [(name, recognize_organization(name), recognize_organization_sequentially(name))
+                              for name in test_cases]
+    combined_vs_sequential = [x for x in combined_vs_sequential if x[1] != x[2]]
+    if combined_vs_sequential:
+        print(f"COMBINED REGEX DISAGREES WITH THE SEQUENCE OF REGEX (name, combined, sequential): "
+              f"{combined_vs_sequential}")
+        experiments_with_errors.add("VARIANT_NAME_COMBINED_REGEX")
     print(f"COMPREHENSIVELY TESTED THE REGEXs FOR CASES:\n"
           f"{sorted(list(experiment_tests))}")
     if experiments_with_errors:
@@ -234,15 +247,68 @@ def test_regex_of_variant_names():
     # print(f"matches {matches is not None}")
 
 
+def _combined_regex_of(test_classes) -> re.Pattern:
+    """
+    :return: a single regex alternating the regex of each class of test_classes, in the given order, each wrapped in
+    the named group _<index>. Alternatives are tried in order, so a full match of the combined regex selects the first
+    class whose regex fully matches the input. The regex of the classes must not use group references.
+    """
+    return re.compile('|'.join(f'(?P<_{i}>{test_class.regex.pattern})' for i, test_class in enumerate(test_classes)))
+
+
+VARIANT_NAME_COMBINED_REGEX = _combined_regex_of(VARIANT_NAME_REGULAR_EXPRESSIONS)
+ORGANIZATION_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=ORGANIZATION_CACHE_SIZE)
+def _organization_of(variant_name_string: str) -> Optional[str]:
+    match = VARIANT_NAME_COMBINED_REGEX.fullmatch(variant_name_string)
+    if match:
+        # the named group of the matching class encloses all the others, so it is the last one to close
+        return VARIANT_NAME_REGULAR_EXPRESSIONS[int(match.lastgroup[1:])].organization
+    logger.warning(f"Unable to recognize the organization to which {variant_name_string} belongs to while "
+                   f"no fallback value provided.")
+    return None
+
+
 def recognize_organization(variant_name_string, fallback: str = None) -> str:
+    """
+    Distinct names are classified once (and a warning is logged once for each unrecognized name) as the results are
+    cached up to ORGANIZATION_CACHE_SIZE names.
+    :return: the organization of the first class in VARIANT_NAME_REGULAR_EXPRESSIONS whose regex fully matches
+    variant_name_string, or fallback.
+    """
+    organization = _organization_of(variant_name_string)
+    return organization if organization is not None else fallback
+
+
+def recognize_organizations(variant_name_strings: Iterable[str], fallback: str = None) -> List[str]:
+    """
+    :return: the result of recognize_organization for each of variant_name_strings, classifying each distinct name
+    only once.
+    """
+    variant_name_strings = list(variant_name_strings)
+    organization_of = {name: recognize_organization(name, fallback) for name in dict.fromkeys(variant_name_strings)}
+    return [organization_of[name] for name in variant_name_strings]
+
+
+def recognize_organization_sequentially(variant_name_string, fallback: str = None) -> str:
+    """
+    Reference implementation of recognize_organization that tries each regex one after the other.
+    """
     for test_class in VARIANT_NAME_REGULAR_EXPRESSIONS:
         match = re.fullmatch(test_class.regex, variant_name_string)
         if match:
             return test_class.organization
-    logger.warning(f"Unable to recognize the organization to which {variant_name_string} belongs to while "
-                   f"no fallback value provided.")
     return fallback
 
 
+def recognize_organization_cache_info():
+    """
+    :return: hits, misses and size of the cache of recognize_organization
+    """
+    return _organization_of.cache_info()
+
+
 if __name__ == '__main__':
     test_regex_of_variant_names()
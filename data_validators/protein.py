@@ -1,6 +1,10 @@
 import re
-from typing import Optional
+from bisect import bisect_right
+from functools import lru_cache
+from os.path import dirname, join, pardir
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from loguru import logger
 
 vcm_syntax_2_short_protein_name = {
@@ -45,10 +49,13 @@ protein_name_replacements = {
 regex_orf_non_polyprot = re.compile(r'(ORF|NS)((1\d)|([2-9]+))(\w?)')
 
 
-def convert_protein(name: str, start_pos: Optional[int] = None, stop_pos: Optional[int] = None):
+def standard_protein_name(name: str) -> str:
+    """
+    Translates the protein name to the short uppercase name used in the knowledge base (e.g. "Spike (surface
+    glycoprotein)" => "S") or raises ValueError if the name is not recognized. ORF1a/b polyproteins are not mapped to
+    the included NSPs, as this requires a position (see convert_protein).
+    """
     new_name = name.upper()
-    new_start_pos = start_pos
-    new_stop_pos = stop_pos
 
     # substitution based on equivalence test
     if name in vcm_syntax_2_short_protein_name.keys():
@@ -107,108 +114,236 @@ def convert_protein(name: str, start_pos: Optional[int] = None, stop_pos: Option
     # check if standardization has succeeded
     if new_name.startswith('NSP') \
             or new_name.startswith('NS')\
-            or new_name in ('S', 'N', 'M', 'E'):
-        pass
-    elif new_name.startswith('ORF1A') \
+            or new_name in ('S', 'N', 'M', 'E') \
+            or new_name.startswith('ORF1A') \
             or new_name.startswith('ORF1AB') \
             or new_name.startswith('ORF1B'):
+        return new_name
+    else:
+        raise ValueError(f"Can't properly treat the protein named {name}.")
+
+
+# ORF1a/b TO NSP COORDINATES
+annotations_file_path = join(dirname(__file__), pardir, "data_sources", "our_sequence_annotations", "sars_cov_2.tsv")
+
+
+class PolyproteinMap:
+    """
+    Sorted table of the NSPs included in a polyprotein. Each interval [start, stop] of positions on the polyprotein
+    belongs to one NSP and is converted to the coordinates of the NSP by adding a constant shift.
+    """
+    def __init__(self, name: str, intervals: List[Tuple[int, int, str, int]]):
+        self.name = name
+        intervals = sorted(intervals)
+        self.starts: List[int] = [x[0] for x in intervals]
+        self.stops: List[int] = [x[1] for x in intervals]
+        self.nsps: List[str] = [x[2] for x in intervals]
+        self.shifts: List[int] = [x[3] for x in intervals]
+        self._np_starts = np.array(self.starts, dtype=np.int64)
+        self._np_stops = np.array(self.stops, dtype=np.int64)
+        self._np_nsps = np.array(self.nsps, dtype=object)
+        self._np_shifts = np.array(self.shifts, dtype=np.int64)
+
+    def __repr__(self):
+        return f"PolyproteinMap({self.name})"
+
+    def lookup(self, pos: int) -> Optional[Tuple[str, int]]:
+        """
+        :return: the NSP including the position pos of the polyprotein and the shift to apply to pos, or None.
+        """
+        i = bisect_right(self.starts, pos) - 1
+        if i >= 0 and pos <= self.stops[i]:
+            return self.nsps[i], self.shifts[i]
+        return None
+
+    def lookup_positions(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized lookup. :return: for each position, the NSP name, the shift and whether the position was resolved.
+        """
+        i = np.searchsorted(self._np_starts, positions, side='right') - 1
+        resolved = i >= 0
+        i = np.where(resolved, i, 0)
+        resolved &= positions <= self._np_stops[i]
+        return self._np_nsps[i], np.where(resolved, self._np_shifts[i], 0), resolved
+
+
+def _read_coding_regions(file_path: str) -> Tuple[Dict[str, List[Tuple[int, int]]], Dict[str, List[Tuple[int, int]]]]:
+    """
+    :return: the nucleotide segments of the CDS and of the mature protein regions of gene ORF1ab, by protein name.
+    """
+    cds, mature_regions = dict(), dict()
+    with open(file_path, mode="r") as file:
+        for line in file:
+            _, _, ann_type, begin_end, gene, protein, _, _ = line.rstrip().split("\t")
+            if gene != "ORF1ab" or ann_type not in ("CDS", "mature_protein_region"):
+                continue
+            segments = [tuple(int(x) for x in segment.split(",")) for segment in begin_end.split(";")]
+            if ann_type == "CDS":
+                cds[protein] = segments
+            else:
+                mature_regions[protein.split(" ")[0].upper()] = segments
+    return cds, mature_regions
+
+
+def _intervals_of(cds_segments: List[Tuple[int, int]], nsp: str, nsp_segments: List[Tuple[int, int]]) \
+        -> List[Tuple[int, int, str, int]]:
+    """
+    Intersects every segment of the polyprotein CDS with every segment of the NSP and returns the intervals of
+    codons shared in the same reading frame, in polyprotein coordinates, with the shift to NSP coordinates.
+    """
+    intervals = []
+    cds_offset = 0
+    for cds_begin, cds_end in cds_segments:
+        nsp_offset = 0
+        for nsp_begin, nsp_end in nsp_segments:
+            # offset of nucleotide x in polyprotein is cds_offset + x - cds_begin (likewise in the NSP)
+            cds_origin, nsp_origin = cds_offset - cds_begin, nsp_offset - nsp_begin
+            low, high = max(cds_begin, nsp_begin), min(cds_end, nsp_end)
+            if (cds_origin - nsp_origin) % 3 == 0:
+                first_codon = low + (-(cds_origin + low) % 3)
+                last_codon = high - 2 - ((cds_origin + high - 2) % 3)
+                if first_codon <= last_codon:
+                    intervals.append(((cds_origin + first_codon) // 3 + 1,
+                                      (cds_origin + last_codon) // 3 + 1,
+                                      nsp,
+                                      (nsp_origin - cds_origin) // 3))
+            nsp_offset += nsp_end - nsp_begin + 1
+        cds_offset += cds_end - cds_begin + 1
+    return intervals
+
+
+def _merge_intervals(intervals: List[Tuple[int, int, str, int]]) -> List[Tuple[int, int, str, int]]:
+    merged = []
+    for interval in sorted(intervals):
+        if merged and merged[-1][2:] == interval[2:] and merged[-1][1] + 1 == interval[0]:
+            merged[-1] = (merged[-1][0], interval[1], *interval[2:])
+        else:
+            merged.append(interval)
+    return merged
+
+
+def _build_polyprotein_map(name: str, cds_segments: List[Tuple[int, int]],
+                           mature_regions: Dict[str, List[Tuple[int, int]]]) -> PolyproteinMap:
+    # NSPs entirely translated from the polyprotein take precedence over NSPs that are only partially included
+    # (e.g. NSP11 and NSP12 share their first 9 codons but only NSP11 is part of ORF1a and only NSP12 of ORF1ab)
+    candidates = []
+    for nsp, nsp_segments in mature_regions.items():
+        intervals = _merge_intervals(_intervals_of(cds_segments, nsp, nsp_segments))
+        covered_codons = sum(stop - start + 1 for start, stop, _, _ in intervals)
+        nsp_codons = sum(end - begin + 1 for begin, end in nsp_segments) // 3
+        candidates.append((covered_codons < nsp_codons, intervals))
+    accepted = []
+    for _, intervals in sorted(candidates, key=lambda x: x[0]):
+        for start, stop, nsp, shift in intervals:
+            # keep only the positions not yet assigned to another NSP
+            for acc_start, acc_stop, _, _ in sorted(accepted):
+                if acc_stop < start or stop < acc_start:
+                    continue
+                if start < acc_start:
+                    accepted.append((start, acc_start - 1, nsp, shift))
+                start = acc_stop + 1
+            if start <= stop:
+                accepted.append((start, stop, nsp, shift))
+    return PolyproteinMap(name, _merge_intervals(accepted))
 
+
+_polyprotein_maps: Optional[Dict[str, PolyproteinMap]] = None
+
+
+def polyprotein_maps() -> Dict[str, PolyproteinMap]:
+    """
+    :return: the maps of ORF1AB, ORF1A and ORF1B to NSP coordinates, built once from the NSP boundaries in the
+    sequence annotations file. ORF1B is the part of ORF1ab translated after the ribosomal frameshift.
+    """
+    global _polyprotein_maps
+    if _polyprotein_maps is None:
+        cds, mature_regions = _read_coding_regions(annotations_file_path)
+        _polyprotein_maps = {
+            'ORF1AB': _build_polyprotein_map('ORF1AB', cds["ORF1ab polyprotein"], mature_regions),
+            'ORF1A': _build_polyprotein_map('ORF1A', cds["ORF1a polyprotein"], mature_regions),
+            'ORF1B': _build_polyprotein_map('ORF1B', cds["ORF1ab polyprotein"][1:], mature_regions)
+        }
+    return _polyprotein_maps
+
+
+# RESOLUTION OF RAW PROTEIN NAMES
+# inputs carry only a few dozens of distinct raw protein names, so their resolution is memoized
+PROTEIN_NAME_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=PROTEIN_NAME_CACHE_SIZE)
+def resolve_protein_name(name: str) -> Tuple[str, Optional[PolyproteinMap]]:
+    """
+    :return: the standard name of the protein and its position strategy: None if positions on this protein are kept
+    as they are, otherwise the PolyproteinMap converting them to positions on the included NSPs.
+    """
+    new_name = standard_protein_name(name)
+    return new_name, polyprotein_maps().get(new_name)
+
+
+def resolve_protein_names(names) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bulk resolve_protein_name for a column of names, doing one lookup per distinct name.
+    :return: the arrays of standard names and of position strategies.
+    """
+    names = list(names)
+    index = {name: i for i, name in enumerate(dict.fromkeys(names))}
+    inverse = np.fromiter(map(index.__getitem__, names), dtype=np.int64, count=len(names))
+    standard_names = np.empty(len(index), dtype=object)
+    strategies = np.empty(len(index), dtype=object)
+    for name, i in index.items():
+        standard_names[i], strategies[i] = resolve_protein_name(name)
+    return standard_names[inverse], strategies[inverse]
+
+
+def protein_name_cache_info():
+    """
+    :return: hits, misses, maxsize and currsize of the cache of resolve_protein_name.
+    """
+    return resolve_protein_name.cache_info()
+
+
+def convert_protein(name: str, start_pos: Optional[int] = None, stop_pos: Optional[int] = None):
+    new_name, polyprotein_map = resolve_protein_name(name)
+    new_start_pos = start_pos
+    new_stop_pos = stop_pos
+
+    if polyprotein_map is not None:
         if start_pos is not None:
-            if new_name == 'ORF1AB' or new_name == 'ORF1A':
-                if 1 <= start_pos <= 180:
-                    new_name = "NSP1"
-                elif 181 <= start_pos <= 818:
-                    new_start_pos = new_start_pos - 181 + 1
-                    new_stop_pos = new_stop_pos - 181 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP2"
-                elif 819 <= start_pos <= 2763:
-                    new_start_pos = new_start_pos - 819 + 1
-                    new_stop_pos = new_stop_pos - 819 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP3"
-                elif 2764 <= start_pos <= 3263:
-                    new_start_pos = new_start_pos - 2764 + 1
-                    new_stop_pos = new_stop_pos - 2764 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP4"
-                elif 3264 <= start_pos <= 3569:
-                    new_start_pos = new_start_pos - 3264 + 1
-                    new_stop_pos = new_stop_pos - 3264 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP5"
-                elif 3570 <= start_pos <= 3859:
-                    new_start_pos = new_start_pos - 3570 + 1
-                    new_stop_pos = new_stop_pos - 3570 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP6"
-                elif 3860 <= start_pos <= 3942:
-                    new_start_pos = new_start_pos - 3860 + 1
-                    new_stop_pos = new_stop_pos - 3860 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP7"
-                elif 3943 <= start_pos <= 4140:
-                    new_start_pos = new_start_pos - 3943 + 1
-                    new_stop_pos = new_stop_pos - 3943 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP8"
-                elif 4141 <= start_pos <= 4253:
-                    new_start_pos = new_start_pos - 4141 + 1
-                    new_stop_pos = new_stop_pos - 4141 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP9"
-                elif 4254 <= start_pos <= 4392:
-                    new_start_pos = new_start_pos - 4254 + 1
-                    new_stop_pos = new_stop_pos - 4254 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP10"
-                elif 4393 <= start_pos <= 5324:
-                    new_start_pos = new_start_pos - 4393 + 1
-                    new_stop_pos = new_stop_pos - 4393 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP12"
-                elif 5325 <= start_pos <= 5925:
-                    new_start_pos = new_start_pos - 5325 + 1
-                    new_stop_pos = new_stop_pos - 5325 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP13"
-                elif 5926 <= start_pos <= 6452:
-                    new_start_pos = new_start_pos - 5926 + 1
-                    new_stop_pos = new_stop_pos - 5926 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP14"
-                elif 6453 <= start_pos <= 6798:
-                    new_start_pos = new_start_pos - 6453 + 1
-                    new_stop_pos = new_stop_pos - 6453 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP15"
-                elif 6799 <= start_pos <= 7096:
-                    new_start_pos = new_start_pos - 6799 + 1
-                    new_stop_pos = new_stop_pos - 6799 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP16"
-                else:
-                    logger.warning(
-                        f"Attempt to convert protein name {name} to NSPxx failed because the start_pos {start_pos} "
-                        f"doesn't resolve to any NSP")
-            elif new_name == 'ORF1B':
-                if 1 <= start_pos <= 923:  # 1 -> 923
-                    new_start_pos = new_start_pos + 9
-                    new_stop_pos = new_stop_pos + 9 if new_stop_pos is not None else None
-                    new_name = "NSP12"
-                elif 924 <= start_pos <= 1524:  # 924 -> 1524
-                    new_start_pos = new_start_pos - 924 + 1
-                    new_stop_pos = new_stop_pos - 924 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP13"
-                elif 1525 <= start_pos <= 2051:  # 1525 -> 2051
-                    new_start_pos = new_start_pos - 1525 + 1
-                    new_stop_pos = new_stop_pos - 1525 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP14"
-                elif 2052 <= start_pos <= 2397:  # 2052 ->2397
-                    new_start_pos = new_start_pos - 2052 + 1
-                    new_stop_pos = new_stop_pos - 2052 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP15"
-                elif 2398 <= start_pos <= 2695:  # 2398 -> 2695
-                    new_start_pos = new_start_pos - 2398 + 1
-                    new_stop_pos = new_stop_pos - 2398 + 1 if new_stop_pos is not None else None
-                    new_name = "NSP16"
-                else:
-                    logger.warning(
-                        f"Attempt to convert protein name {name} to NSPxx failed because the start_pos {start_pos} "
-                        f"doesn't resolve to any NSP")
+            nsp = polyprotein_map.lookup(start_pos)
+            if nsp is not None:
+                new_name, shift = nsp
+                new_start_pos = new_start_pos + shift
+                new_stop_pos = new_stop_pos + shift if new_stop_pos is not None else None
+            else:
+                logger.warning(
+                    f"Attempt to convert protein name {name} to NSPxx failed because the start_pos {start_pos} "
+                    f"doesn't resolve to any NSP")
         else:
             logger.error(f"Cannot convert ORF1a/b protein {name} to NSP without at least the starting position of the "
                          "change or annotation")
-    else:
-        raise ValueError(f"Can't properly treat the protein named {name}.")
 
     return new_name, new_start_pos, new_stop_pos
-    
 
-    
+
+def convert_positions(protein: str, positions: np.ndarray, stop_positions: Optional[np.ndarray] = None) \
+        -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """
+    Vectorized convert_protein for a column of (start) positions, and optionally stop positions, of the same protein.
+    :return: the arrays of converted protein names, positions and stop positions.
+    """
+    new_name, polyprotein_map = resolve_protein_name(protein)
+    positions = np.asarray(positions, dtype=np.int64)
+    stop_positions = np.asarray(stop_positions, dtype=np.int64) if stop_positions is not None else None
+    names = np.full(len(positions), new_name, dtype=object)
+
+    if polyprotein_map is not None:
+        nsps, shifts, resolved = polyprotein_map.lookup_positions(positions)
+        names[resolved] = nsps[resolved]
+        positions = positions + shifts
+        stop_positions = stop_positions + shifts if stop_positions is not None else None
+        if not resolved.all():
+            logger.warning(
+                f"Attempt to convert protein name {protein} to NSPxx failed because the start positions "
+                f"{sorted(set(positions[~resolved].tolist()))} don't resolve to any NSP")
+    return names, positions, stop_positions
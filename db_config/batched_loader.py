@@ -0,0 +1,111 @@
+import os
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from loguru import logger
+
+from db_config.mongodb_model import natural_id
+from db_config.document_sinks import DocumentSink, Insert, Operation, Upsert, open_sink
+
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 1000))
+
+
+def _parse_batch_sizes(value: str) -> Dict[str, int]:
+    sizes = dict()
+    for item in value.split(','):
+        if item.strip():
+            collection_name, size = item.split(':')
+            sizes[collection_name.strip()] = int(size)
+    return sizes
+
+
+# batch sizes of specific collections, overriding BATCH_SIZE, as a comma separated list of <collection>:<size> (e.g.
+# aa_change:5000,variant:200, as recommended by benchmarks.bench_load)
+BATCH_SIZES = _parse_batch_sizes(os.environ.get('BATCH_SIZES', ''))
+
+
+class BatchedLoader:
+    """
+    Buffers the documents to insert and writes them to a sink of db_config.document_sinks (by default the one of the
+    run, e.g. MongoDB, where they are written with bulk_write operations), one collection at a time, every batch_size
+    documents (by default, the size in BATCH_SIZES for the collection or BATCH_SIZE). The _id of each document is
+    generated on the client, so documents can reference each other before being sent to the database. insert() always
+    adds a new document, while upsert() writes each entity (as identified by its natural key) once, no matter how many
+    times it is loaded. Use it as a context manager to flush the remaining documents at the end.
+    E.g.:
+        with BatchedLoader() as loader:
+            effect_id = loader.upsert(effect)
+            evidence.effect_ids = [effect_id]
+            loader.upsert(evidence)
+    """
+    def __init__(self, batch_size: Optional[int] = None, sink: Optional[DocumentSink] = None):
+        self.batch_size = batch_size
+        self.sink = sink or open_sink()
+        self._pending: Dict[str, List[Operation]] = dict()
+        self._classes: Dict[str, type] = dict()
+        self._batch_sizes: Dict[str, int] = dict()
+        self.inserted: Dict[str, int] = dict()     # collection name -> number of documents inserted
+        self.modified: Dict[str, int] = dict()     # collection name -> number of documents updated
+        self.bytes_written: Dict[str, int] = dict()     # collection name -> bytes written by the sink
+
+    def insert(self, obj, _id: Optional[ObjectId] = None) -> ObjectId:
+        """
+        Enqueues vars(obj) for insertion in the collection of obj.
+        :return: the ObjectId assigned to the document
+        """
+        _id = _id or ObjectId()
+        self._enqueue(type(obj), Insert({'_id': _id, **vars(obj)}))
+        return _id
+
+    def upsert(self, obj) -> ObjectId:
+        """
+        Enqueues an upsert of vars(obj) in the collection of obj, on the _id derived from the natural key of obj. The
+        attributes in merged_fields are added to the values already stored, the others are overwritten.
+        :return: the ObjectId of the document
+        """
+        cls = type(obj)
+        document = vars(obj)
+        _id = natural_id(cls, document)
+        self._enqueue(cls, Upsert(_id,
+                                  {attr: value for attr, value in document.items() if attr not in cls.merged_fields},
+                                  {attr: list(document[attr] or []) for attr in cls.merged_fields}))
+        return _id
+
+    def _enqueue(self, cls, operation: Operation):
+        collection_name = cls.collection_name
+        pending = self._pending.get(collection_name)
+        if pending is None:
+            pending = self._pending[collection_name] = []
+            self._classes[collection_name] = cls
+            self._batch_sizes[collection_name] = self.batch_size or BATCH_SIZES.get(collection_name, BATCH_SIZE)
+        pending.append(operation)
+        if len(pending) >= self._batch_sizes[collection_name]:
+            self._flush_collection(collection_name)
+
+    def _flush_collection(self, collection_name: str):
+        pending = self._pending[collection_name]
+        if pending:
+            self._pending[collection_name] = []
+            inserted, modified, written = self.sink.write(self._classes[collection_name], pending)
+            self.inserted[collection_name] = self.inserted.get(collection_name, 0) + inserted
+            self.modified[collection_name] = self.modified.get(collection_name, 0) + modified
+            self.bytes_written[collection_name] = self.bytes_written.get(collection_name, 0) + written
+
+    def flush(self):
+        """
+        Writes all the pending documents.
+        """
+        for collection_name in self._pending:
+            self._flush_collection(collection_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+            logger.info(f"Inserted documents per collection: {self.inserted}, updated: {self.modified}")
+        else:
+            logger.warning(f"Discarded pending documents after an error: "
+                           f"{ {name: len(pending) for name, pending in self._pending.items() if pending} }")
+        return False
@@ -1,8 +1,11 @@
+import os
+import threading
 from typing import Optional
 from logger import logger
 from pymongo import MongoClient
 from pymongo.database import Database
 from pymongo.collection import Collection
+from pymongo import monitoring
 import pymongo
 
 USE_DB = 'COV2K'
@@ -11,25 +14,153 @@ GECO_DB_CONNECTION_STRING = "mongodb://localhost:23456/gcm_gisaid"
 MONGO_DB_CONNECTION_URI = LOCAL_DB_CONNECTION_STRING if USE_DB == 'COV2K' else GECO_DB_CONNECTION_STRING
 DB_NAME = 'cov2k_v21_11_30' if USE_DB == 'COV2K' else 'gcm_gisaid'
 
+# CONNECTION POOL SETTINGS (can be overridden through the environment variables of the same name)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 20000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 0)) or None     # 0 = no timeout
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 0)) or None       # 0 = never closed when idle
+# comma separated list among zstd, snappy, zlib (zstd and snappy require the packages zstandard and python-snappy).
+# Compression pays off only when the server is not on the same host. Empty = no compression.
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+
+
+class PoolStatistics(monitoring.ConnectionPoolListener):
+    """
+    Counts the events of the connection pool of the client.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.check_out_failed = 0
+        self.pools_cleared = 0
+
+    def _increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._increment('pools_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._increment('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._increment('connections_closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._increment('check_out_failed')
+
+    def connection_checked_out(self, event):
+        self._increment('checked_out')
+
+    def connection_checked_in(self, event):
+        self._increment('checked_in')
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'connections_open': self.connections_created - self.connections_closed,
+                'connections_in_use': self.checked_out - self.checked_in,
+                'checked_out': self.checked_out,
+                'check_out_failed': self.check_out_failed,
+                'pools_cleared': self.pools_cleared
+            }
+
+
 _client: Optional[MongoClient] = None
+_pool_statistics: Optional[PoolStatistics] = None
+_client_lock = threading.Lock()
+
+
+def _new_client() -> MongoClient:
+    global _pool_statistics
+    _pool_statistics = PoolStatistics()
+    options = dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        event_listeners=[_pool_statistics]
+    )
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    return MongoClient(MONGO_DB_CONNECTION_URI, **options)
 
 
 def close_conn():
+    """
+    Closes the client shared by the whole process. Call it once, at the end of the run.
+    """
     global _client
-    if _client:
-        _client.close()
-        logger.info(f'Connection with mongoDB {MONGO_DB_CONNECTION_URI} CLOSED')
-        _client = None
-    else:
-        logger.warning("Request to close connection that was never opened.")
+    with _client_lock:
+        if _client:
+            logger.info(f"Connection pool statistics: {pool_stats()}")
+            _client.close()
+            logger.info(f'Connection with mongoDB {MONGO_DB_CONNECTION_URI} CLOSED')
+            _client = None
+        else:
+            logger.warning("Request to close connection that was never opened.")
 
 
 def open_conn() -> Database:
+    """
+    :return: the database through the pooled client shared by the whole process (and by all its threads). The client
+    is created on first use.
+    """
     global _client
-    if not _client:
-        _client = MongoClient(MONGO_DB_CONNECTION_URI)
-        logger.info(f"Connection with mongoDB {MONGO_DB_CONNECTION_URI} ESTABLISHED")
-    return _client[DB_NAME]
+    client = _client
+    if not client:
+        with _client_lock:
+            if not _client:
+                _client = _new_client()
+                logger.info(f"Connection with mongoDB {MONGO_DB_CONNECTION_URI} ESTABLISHED "
+                            f"(max pool size {MONGO_MAX_POOL_SIZE})")
+            client = _client
+    return client[DB_NAME]
+
+
+def pool_stats() -> dict:
+    """
+    :return: the counters of the connection pool of the current client (empty if no client was ever opened)
+    """
+    return _pool_statistics.as_dict() if _pool_statistics else dict()
+
+
+def _reset_after_fork():
+    # A MongoClient must not be used across a fork: the child process discards the inherited client (without closing
+    # the sockets it shares with the parent) and opens its own on first use.
+    global _client, _client_lock, _pool_statistics
+    _client = None
+    _pool_statistics = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 if __name__ == "__main__":
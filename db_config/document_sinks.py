@@ -0,0 +1,363 @@
+"""
+Destinations of the documents written by db_config.batched_loader.BatchedLoader, which enqueues Insert and Upsert
+operations and passes them to the sink in batches, one collection at a time. OUTPUT_SINK selects the sink of the run:
+- mongodb (default): bulk writes to the collections of the database of db_config.connection, configured by the
+  MONGO_BULK_* and MONGO_WRITE_* variables below;
+- jsonl: one file of newline-delimited JSON per collection in OUTPUT_DIR;
+- parquet: one directory per collection in OUTPUT_DIR with a Parquet file for each batch (requires pyarrow);
+- memory: an in-memory store, with the semantics of the MongoDB upserts, that can be inspected after the run.
+The file sinks append one record per operation: an entity upserted more than once (e.g. the same AA residue loaded by
+two runs of a source) appears in more records with the same _id, which readers should merge.
+"""
+import glob
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from os.path import sep
+from typing import Collection, Dict, List, Optional, Tuple, Union
+
+import bson
+import numpy as np
+from bson import ObjectId
+from loguru import logger
+from pymongo import InsertOne, UpdateOne
+from pymongo.database import Database
+from pymongo.write_concern import WriteConcern
+
+from db_config.indexes import ensure_natural_key_index
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUTPUT_SINK = os.environ.get('OUTPUT_SINK', 'mongodb').lower()
+OUTPUT_DIR = os.environ.get('OUTPUT_DIR', f'.{sep}generated{sep}output{sep}')
+# BULK WRITE SETTINGS OF THE MONGODB SINK (see benchmarks.bench_load to choose them)
+# with ordered writes, MongoDB applies the operations of a batch one after the other and stops at the first error
+MONGO_BULK_ORDERED = os.environ.get('MONGO_BULK_ORDERED', '').lower() in ('1', 'true', 'yes')
+# w of the write concern: a number of nodes, "majority" or empty for the default of the server. With 0, writes are
+# not acknowledged and the number of documents written is unknown.
+MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '')
+# each batch is split among this many connections, which write in parallel
+MONGO_WRITE_THREADS = int(os.environ.get('MONGO_WRITE_THREADS', 1))
+# stale documents are deleted by _id, this many per request
+MONGO_DELETE_BATCH_SIZE = int(os.environ.get('MONGO_DELETE_BATCH_SIZE', 10000))
+
+
+class Insert:
+    def __init__(self, document: dict):
+        self.document = document    # including the _id
+
+
+class Upsert:
+    def __init__(self, _id: ObjectId, set_fields: dict, add_to_set_fields: dict):
+        self._id = _id
+        self.set_fields = set_fields                # overwritten
+        self.add_to_set_fields = add_to_set_fields  # attribute -> values added to the stored ones
+
+    def as_document(self) -> dict:
+        return {'_id': self._id, **self.set_fields, **self.add_to_set_fields}
+
+
+Operation = Union[Insert, Upsert]
+
+
+class DocumentSink(ABC):
+    name = None
+
+    @abstractmethod
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        """
+        Writes the operations on documents of the collection of cls.
+        :return: the number of documents inserted (or upserted), the number of documents modified and the bytes written
+        (0 for sinks not writing bytes anywhere)
+        """
+
+    def delete_except(self, cls, kept_ids: Collection[ObjectId]) -> int:
+        """
+        Deletes the documents of the collection of cls whose _id is not in kept_ids, e.g. those of entities that a
+        complete run did not produce anymore. The file sinks rewrite their output at every run, so there is nothing to
+        delete there.
+        :return: the number of documents deleted
+        """
+        return 0
+
+    def close(self):
+        pass
+
+
+def _write_concern(w: str) -> WriteConcern:
+    if not w:
+        return WriteConcern()
+    return WriteConcern(w=int(w) if w.isdigit() else w)
+
+
+class MongoDBSink(DocumentSink):
+    name = 'mongodb'
+
+    def __init__(self, ordered: bool = MONGO_BULK_ORDERED, write_concern: str = MONGO_WRITE_CONCERN,
+                 threads: int = MONGO_WRITE_THREADS, database: Optional[Database] = None):
+        """
+        :param database: the database to write to (by default, the one of db_config.connection)
+        """
+        self.ordered = ordered
+        self.write_concern = _write_concern(write_concern)
+        self.threads = max(1, threads)
+        self.database = database
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _collection(self, cls):
+        collection = self.database[cls.collection_name] if self.database is not None else cls.db()
+        ensure_natural_key_index(cls, collection)
+        return collection.with_options(write_concern=self.write_concern)
+
+    def _bulk_write(self, collection, requests: list) -> Tuple[int, int]:
+        result = collection.bulk_write(requests, ordered=self.ordered)
+        if not result.acknowledged:
+            return len(requests), 0
+        return result.inserted_count + result.upserted_count, result.modified_count
+
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        collection = self._collection(cls)
+        requests = []
+        written = 0     # BSON size of the documents and of the updates sent
+        for operation in operations:
+            if isinstance(operation, Insert):
+                requests.append(InsertOne(operation.document))
+                written += len(bson.encode(operation.document))
+            else:
+                update = {'$set': operation.set_fields}
+                if operation.add_to_set_fields:
+                    update['$addToSet'] = {attr: {'$each': values}
+                                           for attr, values in operation.add_to_set_fields.items()}
+                requests.append(UpdateOne({'_id': operation._id}, update, upsert=True))
+                written += len(bson.encode(update))
+        if self.threads == 1 or len(requests) < 2 * self.threads:
+            return self._bulk_write(collection, requests) + (written,)
+        # the operations on the same document go to the same connection, in their order
+        slices = [[] for _ in range(self.threads)]
+        for operation, request in zip(operations, requests):
+            _id = operation.document['_id'] if isinstance(operation, Insert) else operation._id
+            slices[hash(_id) % self.threads].append(request)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='mongodb-sink')
+        counts = list(self._executor.map(lambda part: self._bulk_write(collection, part), filter(None, slices)))
+        return sum(inserted for inserted, _ in counts), sum(modified for _, modified in counts), written
+
+    def delete_except(self, cls, kept_ids: Collection[ObjectId]) -> int:
+        # a single $nin with every kept _id would grow with the collection up to the limit of 16 MB of a request
+        kept_ids = set(kept_ids)
+        collection = self._collection(cls)
+        deleted, stale = 0, []
+        for document in collection.find({}, {'_id': 1}):
+            if document['_id'] not in kept_ids:
+                stale.append(document['_id'])
+                if len(stale) >= MONGO_DELETE_BATCH_SIZE:
+                    deleted += collection.delete_many({'_id': {'$in': stale}}).deleted_count
+                    stale = []
+        if stale:
+            deleted += collection.delete_many({'_id': {'$in': stale}}).deleted_count
+        return deleted
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class MemorySink(DocumentSink):
+    name = 'memory'
+
+    def __init__(self):
+        self.collections: Dict[str, Dict[ObjectId, dict]] = dict()
+        self._lock = threading.Lock()
+
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        inserted = modified = 0
+        with self._lock:
+            documents = self.collections.setdefault(cls.collection_name, dict())
+            for operation in operations:
+                if isinstance(operation, Insert):
+                    documents[operation.document['_id']] = dict(operation.document)
+                    inserted += 1
+                    continue
+                document = documents.get(operation._id)
+                if document is None:
+                    document = documents[operation._id] = {'_id': operation._id}
+                    inserted += 1
+                else:
+                    modified += 1
+                document.update(operation.set_fields)
+                for attr, values in operation.add_to_set_fields.items():
+                    stored = document.setdefault(attr, [])
+                    stored.extend(value for value in values if value not in stored)
+        return inserted, modified, 0
+
+    def delete_except(self, cls, kept_ids: Collection[ObjectId]) -> int:
+        kept_ids = set(kept_ids)
+        with self._lock:
+            documents = self.collections.get(cls.collection_name, dict())
+            stale = [_id for _id in documents if _id not in kept_ids]
+            for _id in stale:
+                del documents[_id]
+        return len(stale)
+
+    def documents(self, cls) -> List[dict]:
+        return list(self.collections.get(cls.collection_name, dict()).values())
+
+
+def _plain(value):
+    """
+    :return: value with ObjectIds as strings and NumPy scalars as Python ones
+    """
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class JSONLinesSink(DocumentSink):
+    name = 'jsonl'
+
+    def __init__(self, directory: str = OUTPUT_DIR):
+        self.directory = directory
+        self._files = dict()
+        self._lock = threading.Lock()
+
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        lines = ''.join(json.dumps(_plain(operation.document if isinstance(operation, Insert)
+                                          else operation.as_document())) + '\n' for operation in operations)
+        with self._lock:
+            output_file = self._files.get(cls.collection_name)
+            if output_file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                output_file = self._files[cls.collection_name] = \
+                    open(os.path.join(self.directory, f'{cls.collection_name}.jsonl'), 'w', encoding='utf-8')
+            start = output_file.tell()
+            output_file.write(lines)
+            output_file.flush()     # complete lines even if the sink is never closed
+            written = output_file.tell() - start
+        return len(operations), 0, written
+
+    def close(self):
+        with self._lock:
+            for output_file in self._files.values():
+                output_file.close()
+            self._files.clear()
+
+
+class ParquetSink(DocumentSink):
+    """
+    Writes a Parquet file per batch. All the parts of a collection share one schema: the schema of each batch is
+    unified with that of the previous ones (e.g. a column that was all null in the first batch gets the type of its
+    later values), every part is written with the schema known so far and close() rewrites the parts written before
+    the schema changed.
+    """
+    name = 'parquet'
+
+    def __init__(self, directory: str = OUTPUT_DIR):
+        if pyarrow is None:
+            raise ImportError("The parquet output sink requires pyarrow (pip install pyarrow)")
+        self.directory = directory
+        self._parts: Dict[str, int] = dict()
+        self._schemas: Dict[str, 'pyarrow.Schema'] = dict()    # collection name -> schema of all its parts
+        self._written: Dict[str, List[Tuple[str, 'pyarrow.Schema']]] = dict()   # collection name -> (path, schema)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _conform(table: 'pyarrow.Table', schema: 'pyarrow.Schema') -> 'pyarrow.Table':
+        columns = [table.column(field.name).cast(field.type) if field.name in table.column_names
+                   else pyarrow.nulls(len(table), field.type) for field in schema]
+        return pyarrow.Table.from_arrays(columns, schema=schema)
+
+    def write(self, cls, operations: List[Operation]) -> Tuple[int, int, int]:
+        table = pyarrow.Table.from_pylist([_plain(operation.document if isinstance(operation, Insert)
+                                                  else operation.as_document()) for operation in operations])
+        collection_name = cls.collection_name
+        partition = os.path.join(self.directory, collection_name)
+        with self._lock:
+            part = self._parts.get(collection_name, 0)
+            self._parts[collection_name] = part + 1
+            if part == 0:   # replaces the output of previous runs
+                os.makedirs(partition, exist_ok=True)
+                for old_part in glob.glob(os.path.join(partition, 'part-*.parquet')):
+                    os.remove(old_part)
+                schema = table.schema
+            else:
+                schema = pyarrow.unify_schemas([self._schemas[collection_name], table.schema],
+                                               promote_options='permissive')
+            self._schemas[collection_name] = schema
+        part_path = os.path.join(partition, f'part-{part:05d}.parquet')
+        pyarrow.parquet.write_table(self._conform(table, schema), part_path)
+        with self._lock:
+            self._written.setdefault(collection_name, []).append((part_path, schema))
+        return len(operations), 0, os.path.getsize(part_path)
+
+    def close(self):
+        with self._lock:
+            for collection_name, parts in self._written.items():
+                schema = self._schemas[collection_name]
+                for part_path, part_schema in parts:
+                    if not part_schema.equals(schema):
+                        pyarrow.parquet.write_table(self._conform(pyarrow.parquet.read_table(part_path), schema),
+                                                    part_path)
+            self._written.clear()
+
+
+SINKS = {sink.name: sink for sink in (MongoDBSink, MemorySink, JSONLinesSink, ParquetSink)}
+
+_sink: Optional[DocumentSink] = None
+_sink_lock = threading.Lock()
+
+
+def open_sink() -> DocumentSink:
+    """
+    :return: the sink shared by the whole process, of the kind selected by OUTPUT_SINK. It is created on first use.
+    """
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            try:
+                _sink = SINKS[OUTPUT_SINK]()
+            except KeyError:
+                raise ValueError(f"Unknown OUTPUT_SINK {OUTPUT_SINK}. Choose one of {list(SINKS)}")
+            logger.info(f"Documents are written to the {_sink.name} sink")
+        return _sink
+
+
+def set_sink(sink: Optional[DocumentSink]) -> Optional[DocumentSink]:
+    """
+    Replaces the sink shared by the whole process (e.g. with a MemorySink in benchmarks).
+    :return: the previous sink
+    """
+    global _sink
+    with _sink_lock:
+        previous, _sink = _sink, sink
+    return previous
+
+
+def close_sink():
+    """
+    Closes the sink shared by the whole process, flushing the files of the file sinks.
+    """
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink is not None:
+        sink.close()
+
+
+def writes_to_mongodb() -> bool:
+    return isinstance(_sink, MongoDBSink) if _sink is not None else OUTPUT_SINK == MongoDBSink.name
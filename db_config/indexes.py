@@ -0,0 +1,69 @@
+import threading
+from typing import Dict, List
+
+from loguru import logger
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection as DBCCollection
+
+from db_config.mongodb_model import ENTITIES
+
+NATURAL_KEY_INDEX_NAME = 'natural_key'
+
+_natural_key_indexed_collections = set()
+_natural_key_index_lock = threading.Lock()
+
+
+def natural_key_index_of(cls) -> List[IndexModel]:
+    """
+    :return: the unique index on the natural key of cls, if cls requests it
+    """
+    if not cls.natural_key_index:
+        return []
+    return [IndexModel([(attr, ASCENDING) for attr in cls.natural_key], unique=True, name=NATURAL_KEY_INDEX_NAME)]
+
+
+def secondary_indexes_of(cls) -> List[IndexModel]:
+    """
+    :return: the indexes declared in cls.indexes, with the default names given by MongoDB (e.g. protein_1_pos_1)
+    """
+    return [IndexModel([(attr, ASCENDING) for attr in attributes]) for attributes in cls.indexes]
+
+
+def ensure_natural_key_index(cls, collection: DBCCollection):
+    """
+    Creates (once per process) the unique index on the natural key of cls, so that it is in place before the first
+    upsert.
+    """
+    with _natural_key_index_lock:
+        if collection.name not in _natural_key_indexed_collections:
+            index = natural_key_index_of(cls)
+            if index:
+                collection.create_indexes(index)
+            _natural_key_indexed_collections.add(collection.name)
+
+
+def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Creates the natural key index and the secondary indexes declared by each class of db_config.mongodb_model.
+    Indexes that already exist with the same specification are left untouched, so this can run after every load.
+    :return: the names of the indexes of each collection
+    """
+    created = dict()
+    for cls in ENTITIES:
+        collection = cls.db()
+        indexes = natural_key_index_of(cls) + secondary_indexes_of(cls)
+        if indexes:
+            created[collection.name] = collection.create_indexes(indexes)
+    logger.info(f"Indexes in place: {created}")
+    return created
+
+
+if __name__ == '__main__':
+    from os import chdir
+    from os.path import sep
+    import db_config.connection as connection
+    chdir(f"..{sep}")
+    try:
+        ensure_indexes()
+    finally:
+        connection.close_conn()
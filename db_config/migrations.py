@@ -0,0 +1,70 @@
+"""
+Databases loaded before the documents got the _id derived from their natural key (see db_config.mongodb_model) hold
+documents with random _ids: the upserts of a new run would add a second copy of each of them, or fail with a
+DuplicateKeyError on the unique natural key indexes. Each run of main.py regenerates every collection, so the legacy
+collections are dropped instead of being converted. The variants, effects and evidences reference each other by _id,
+hence they are dropped together when any of them is legacy.
+Run this module, or main.py --drop-legacy-collections, once on such databases.
+Legacy collections were loaded entirely with random _ids, so checking the first MIGRATION_SAMPLE_SIZE documents of each
+collection is enough, and re-runs on migrated databases do not read the whole collections.
+"""
+import os
+from typing import Collection, List, Optional
+
+from loguru import logger
+from pymongo.database import Database
+
+import db_config.connection as connection
+from db_config.mongodb_model import ENTITIES, Effect, Reference, Variant, natural_id
+
+MIGRATION_SAMPLE_SIZE = int(os.environ.get('MIGRATION_SAMPLE_SIZE', 20))
+# classes whose documents hold the _id of the documents of the others
+LINKED_ENTITIES = (Variant, Effect, Reference)
+
+
+def _database(database: Optional[Database]) -> Database:
+    return database if database is not None else connection.open_conn()
+
+
+def is_legacy(cls, database: Optional[Database] = None, sample_size: int = MIGRATION_SAMPLE_SIZE) -> bool:
+    """
+    :return: whether the first sample_size documents of the collection of cls include one whose _id is not the one
+    derived from its natural key
+    """
+    projection = {attr: 1 for attr in cls.natural_key}
+    for document in _database(database)[cls.collection_name].find({}, projection).limit(sample_size):
+        if document['_id'] != natural_id(cls, document):
+            return True
+    return False
+
+
+def legacy_collections(database: Optional[Database] = None) -> List[str]:
+    """
+    :return: the names of the collections to drop before loading the database with natural _ids
+    """
+    legacy = [cls for cls in ENTITIES if is_legacy(cls, database)]
+    if any(cls in LINKED_ENTITIES for cls in legacy):
+        legacy.extend(cls for cls in LINKED_ENTITIES if cls not in legacy)
+    return [cls.collection_name for cls in legacy]
+
+
+def drop_legacy_collections(database: Optional[Database] = None, legacy: Optional[Collection[str]] = None) \
+        -> List[str]:
+    """
+    Drops the collections with documents having random _ids. The next run of main.py loads them again.
+    :param legacy: the result of legacy_collections(), if already known
+    :return: the names of the collections dropped
+    """
+    database = _database(database)
+    dropped = list(legacy) if legacy is not None else legacy_collections(database)
+    for collection_name in dropped:
+        database.drop_collection(collection_name)
+    logger.info(f"Legacy collections dropped: {dropped}")
+    return dropped
+
+
+if __name__ == '__main__':
+    try:
+        drop_legacy_collections()
+    finally:
+        connection.close_conn()
@@ -1,4 +1,6 @@
+import hashlib
 from typing import Optional, Collection, List, Tuple, Dict, Union
+from bson import ObjectId
 from pymongo.database import Database
 from pymongo.collection import Collection as DBCCollection
 import db_config.connection as connection
@@ -22,9 +24,55 @@ COLL_AA_RESIDUE = "aa_residue"
 # then, you can get a mongoDB-ready representation by transforming these into dictionaries with vars(<object>).
 # Careful though, vars(<obj>) works out-of-the-box for objects without nested objects,
 # otherwise you need to override the attribute __dict__ (which is invoked by vars())
+# NATURAL KEYS:
+# 1st level classes declare the attributes identifying an entity in natural_key. Loaders upsert each document on the
+# _id returned by natural_id(), which is derived from the natural key, so that loading the same entity twice (within a
+# run or across runs) updates a single document. Attributes listed in merged_fields (arrays) accumulate the values of
+# all the loads instead of being overwritten. When the natural key is made of scalar attributes only,
+# natural_key_index = True requests a unique index on it. Databases loaded when _ids were random must be migrated
+# first (see db_config.migrations). A change of the natural key (e.g. of the aliases of a variant) changes the _id: the
+# merge stage of a complete run deletes the documents left behind (see pipeline.dedup.MergeStage.load).
+# INDEXES:
+# 1st level classes declare the secondary indexes of their collection in indexes, each as a tuple of (possibly
+# dotted) attribute names indexed in ascending order. They are created by db_config.indexes.ensure_indexes().
+
+
+def _key_value(value):
+    # arrays are sets as far as identity is concerned
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(repr(x) for x in value))
+    return value
+
+
+def natural_key_of(cls, document: dict) -> tuple:
+    """
+    :param cls: a 1st level class of this module
+    :param document: vars() of an instance of cls
+    :return: the values of the natural key of document
+    """
+    return tuple(_key_value(document.get(attr)) for attr in cls.natural_key)
+
+
+def natural_id(cls, document: dict) -> ObjectId:
+    """
+    :param cls: a 1st level class of this module
+    :param document: vars() of an instance of cls
+    :return: the _id of the entity, derived from its class and natural key
+    """
+    digest = hashlib.blake2b(repr((cls.__name__, natural_key_of(cls, document))).encode(), digest_size=12).digest()
+    return ObjectId(digest)
 
 
 class Variant:
+    collection_name = COLL_VARIANT
+    # the same variant is described by different sets of aliases in each source: a cross-source aggregation is still
+    # necessary to merge them
+    natural_key = ('aliases',)
+    natural_key_index = False
+    merged_fields = ('effects',)
+    indexes = (('aliases.name',), ('aliases.org',), ('org_2_aa_changes.changes',), ('org_2_nuc_changes.changes',),
+               ('effects',))
+
     def __init__(self, aliases=None, org_2_aa_changes=None, org_2_nuc_changes=None, effects=None):
         self.aliases: Optional[Collection[Variant.Name]] = None
         self.org_2_aa_changes: Optional[Collection[Variant.Characterization]] = None
@@ -74,10 +122,16 @@ class Variant:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_VARIANT]
+        return connection.open_conn()[cls.collection_name]
 
 
 class Organization:
+    collection_name = COLL_ORG
+    natural_key = ('name',)
+    natural_key_index = True
+    merged_fields = ()
+    indexes = ()
+
     def __init__(self, name=None, reference_url=None, rule_description=None, threshold=None):
         self.name: Optional[str] = name
         self.reference_url: Optional[str] = reference_url
@@ -86,10 +140,19 @@ class Organization:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_ORG]
+        return connection.open_conn()[cls.collection_name]
 
 
 class NUCChange:
+    collection_name = COLL_NUC_CHANGE
+    # changes are value objects identified by change_id: equal changes collapse in sets and dicts. Equality ignores
+    # is_optional, which does not identify the change (see data_validators.change_registry)
+    __slots__ = ('change_id', 'ref', 'pos', 'alt', 'type', 'length', 'is_optional')
+    natural_key = ('change_id',)
+    natural_key_index = True
+    merged_fields = ()
+    indexes = (('pos',),)
+
     def __init__(self, change_id=None, ref=None, pos=None, alt=None, _type=None, length=None, is_opt=None):
         self.change_id: Optional[str] = change_id.upper()
         self.ref: Optional[str] = ref.upper()
@@ -99,12 +162,33 @@ class NUCChange:
         self.length: Optional[int] = int(length)
         self.is_optional: Optional[bool] = is_opt
 
+    def __eq__(self, other):
+        if not isinstance(other, NUCChange):
+            return NotImplemented
+        return self.change_id == other.change_id
+
+    def __hash__(self):
+        return hash(self.change_id)
+
+    @property
+    def __dict__(self):
+        return {attr: getattr(self, attr) for attr in NUCChange.__slots__}
+
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_NUC_CHANGE]
+        return connection.open_conn()[cls.collection_name]
 
 
 class AAChange:
+    collection_name = COLL_AA_CHANGE
+    # changes are value objects identified by change_id: equal changes collapse in sets and dicts. Equality ignores
+    # is_optional, which does not identify the change (see data_validators.change_registry)
+    __slots__ = ('change_id', 'protein', 'ref', 'pos', 'alt', 'type', 'length', 'is_optional')
+    natural_key = ('change_id',)
+    natural_key_index = True
+    merged_fields = ()
+    indexes = (('protein', 'pos'),)
+
     def __init__(self, change_id=None, protein=None, ref=None, pos=None, alt=None, _type=None, length=None, is_opt=None):
         self.change_id: Optional[str] = change_id.upper()
         self.protein: Optional[str] = protein.upper()
@@ -115,12 +199,31 @@ class AAChange:
         self.length: Optional[int] = int(length)
         self.is_optional: Optional[bool] = is_opt
 
+    def __eq__(self, other):
+        if not isinstance(other, AAChange):
+            return NotImplemented
+        return self.change_id == other.change_id
+
+    def __hash__(self):
+        return hash(self.change_id)
+
+    @property
+    def __dict__(self):
+        return {attr: getattr(self, attr) for attr in AAChange.__slots__}
+
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_AA_CHANGE]
+        return connection.open_conn()[cls.collection_name]
 
 
 class Effect:
+    collection_name = COLL_EFFECT
+    # aa_changes is an array (compared as a set): the key is enforced by natural_id() instead of a unique index
+    natural_key = ('type', 'lv', 'method', 'aa_changes')
+    natural_key_index = False
+    merged_fields = ()
+    indexes = (('aa_changes',), ('type',))
+
     def __init__(self, _type: str = None, lv: str = None, method: str = None, aa_changes: Collection[str] = None):
         self.type: Optional[str] = _type
         self.lv: Optional[str] = lv
@@ -135,10 +238,16 @@ class Effect:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_EFFECT]
+        return connection.open_conn()[cls.collection_name]
 
 
 class Reference:
+    collection_name = COLL_REFERENCE
+    natural_key = ('uri', 'citation', 'type', 'publisher')
+    natural_key_index = True
+    merged_fields = ('effect_ids',)
+    indexes = (('effect_ids',), ('type',))
+
     def __init__(self, effect_ids: Collection[str] = None, citation: str = None, _type: str = None, uri: str = None, publisher: str = None):
         self.effect_ids: Optional[Collection[str]] = effect_ids if effect_ids else []
         self.citation: Optional[str] = citation
@@ -154,10 +263,16 @@ class Reference:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_REFERENCE]
+        return connection.open_conn()[cls.collection_name]
 
 
 class Structure:
+    collection_name = COLL_STRUCTURE
+    natural_key = ('annotation_id',)
+    natural_key_index = True
+    merged_fields = ()
+    indexes = (('protein_characterization.protein_name',), ('start_on_ref', 'stop_on_ref'))
+
     def __init__(self, annotation_id: str, start_on_ref: int = None, stop_on_ref: int = None,
                  protein_characterization=None):
         self.annotation_id: str = annotation_id.upper() if annotation_id else None
@@ -189,10 +304,16 @@ class Structure:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_STRUCTURE]
+        return connection.open_conn()[cls.collection_name]
 
 
 class ProteinRegion:
+    collection_name = COLL_PROTEIN_REGION
+    natural_key = ('protein_name', 'start_on_prot', 'stop_on_prot', 'type', 'description')
+    natural_key_index = True
+    merged_fields = ()
+    indexes = (('description',), ('type',))    # protein_name is the prefix of the natural key index
+
     def __init__(self, protein_name: str, start_on_prot: int, stop_on_prot: int, description: str = None
                  , _type: str = None, category: str = None):
         self.protein_name: str = protein_name.upper() if protein_name else None
@@ -204,10 +325,16 @@ class ProteinRegion:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_PROTEIN_REGION]
+        return connection.open_conn()[cls.collection_name]
 
 
 class AAResidue:
+    collection_name = COLL_AA_RESIDUE
+    natural_key = ('residue',)
+    natural_key_index = True
+    merged_fields = ()
+    indexes = ()
+
     def __init__(self, args):
         self.residue: str = args[0].upper()
         self.molecular_weight: int = int(args[1]) if args[1] is not None else None
@@ -224,7 +351,11 @@ class AAResidue:
 
     @classmethod
     def db(cls):
-        return connection.open_conn()[COLL_AA_RESIDUE]
+        return connection.open_conn()[cls.collection_name]
+
+
+# 1st level classes
+ENTITIES = (Variant, Organization, NUCChange, AAChange, Effect, Reference, Structure, ProteinRegion, AAResidue)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,175 @@
+"""
+Cache of the files downloaded from remote sources. Next to each downloaded file (e.g. generated/covariants/clusters.json)
+a sidecar file <file>.cache.json stores the URL, the ETag and Last-Modified headers and the SHA-256 of the content.
+download() then:
+- asks the server for the file only if it changed since the last download (If-None-Match / If-Modified-Since), after
+  verifying that the local copy still matches its hash;
+- writes the content to <file>.part and, if the transfer is interrupted, retries resuming it with a Range request
+  (If-Range guarantees that the parts belong to the same version of the file);
+- replaces the local copy only once the download is complete and tells the caller whether the content changed.
+The tests in tests/test_download_cache.py check this behaviour against a local HTTP server.
+"""
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import socket
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+from loguru import logger
+
+DOWNLOAD_ATTEMPTS = int(os.environ.get('DOWNLOAD_ATTEMPTS', 5))
+DOWNLOAD_TIMEOUT_S = float(os.environ.get('DOWNLOAD_TIMEOUT_S', 60))
+DOWNLOAD_BACKOFF_S = float(os.environ.get('DOWNLOAD_BACKOFF_S', 1))     # doubled after each failed attempt
+_CHUNK_SIZE = 1 << 16
+
+
+class DownloadResult:
+    def __init__(self, path: str, changed: bool, sha256: str, status: str, received: int = 0):
+        self.path = path
+        self.changed = changed      # whether the content differs from the one of the previous download
+        self.sha256 = sha256
+        self.status = status        # 'not modified', 'downloaded' or 'resumed'
+        self.received = received    # bytes received by the transfer completing the file (0 if not modified)
+
+    def __repr__(self):
+        return f"{self.path}: {self.status}, {'changed' if self.changed else 'unchanged'} (sha256 {self.sha256[:12]})"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _metadata_path(destination_path: str) -> str:
+    return destination_path + '.cache.json'
+
+
+def _read_metadata(destination_path: str) -> dict:
+    try:
+        with open(_metadata_path(destination_path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _write_metadata(destination_path: str, metadata: dict):
+    temp_path = _metadata_path(destination_path) + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(temp_path, _metadata_path(destination_path))
+
+
+def _validator(headers) -> Optional[str]:
+    # If-Range accepts either a strong ETag or a Last-Modified date
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _transfer(url: str, part_path: str, metadata: dict, conditional: bool, timeout: float):
+    """
+    Writes (or appends) the content of url to part_path.
+    :return: None if the server replied 304 Not Modified, otherwise (status, response headers, bytes received)
+    """
+    headers = dict()
+    if conditional:
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset and metadata.get('part_validator'):
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = metadata['part_validator']
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        if e.code == 416:   # the part is not a prefix of the current content
+            os.remove(part_path)
+        raise
+    with response:
+        if response.status == 206:
+            content_range = response.headers.get('Content-Range', '')
+            if not content_range.startswith(f'bytes {offset}-'):
+                os.remove(part_path)
+                raise ConnectionError(f"Unexpected Content-Range {content_range} when resuming from byte {offset}")
+            mode, status = 'ab', 'resumed'
+        elif response.status == 200:
+            mode, status = 'wb', 'downloaded'
+        else:
+            raise RuntimeError(f"fetch URL {url} failed with STATUS CODE {response.status}\n"
+                               f"HEADERS: {response.headers}")
+        metadata['part_validator'] = _validator(response.headers)
+        received = 0
+        with open(part_path, mode) as out_file:
+            for chunk in iter(lambda: response.read(_CHUNK_SIZE), b''):
+                out_file.write(chunk)
+                received += len(chunk)
+        # http.client does not complain if the connection is closed before the end of the content
+        expected = response.headers.get('Content-Length')
+        if expected is not None and received < int(expected):
+            raise http.client.IncompleteRead(b'', int(expected) - received)
+        return status, response.headers, received
+
+
+def download(url: str, destination_path: str, attempts: int = DOWNLOAD_ATTEMPTS,
+             timeout: float = DOWNLOAD_TIMEOUT_S) -> DownloadResult:
+    """
+    Downloads url into destination_path unless the local copy is up to date (see the module documentation).
+    :return: a DownloadResult telling whether the content changed since the previous download.
+    """
+    metadata = _read_metadata(destination_path)
+    if metadata.get('url') != url:
+        metadata = {'url': url}
+    previous_sha256 = metadata.get('sha256')
+    # a conditional request is meaningful only if the local copy is intact
+    conditional = previous_sha256 is not None and os.path.exists(destination_path) \
+        and file_sha256(destination_path) == previous_sha256
+    os.makedirs(os.path.dirname(destination_path) or '.', exist_ok=True)
+    part_path = destination_path + '.part'
+    backoff = DOWNLOAD_BACKOFF_S
+    for attempt in range(1, attempts + 1):
+        try:
+            outcome = _transfer(url, part_path, metadata, conditional, timeout)
+            break
+        except (http.client.IncompleteRead, ConnectionError, socket.timeout, urllib.error.URLError) as e:
+            if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 416:
+                raise
+            _write_metadata(destination_path, metadata)    # keep the validator of the part for the next attempt
+            if attempt == attempts:
+                raise
+            logger.warning(f"Download of {url} interrupted ({e!r}). Attempt {attempt + 1}/{attempts} in {backoff}s")
+            time.sleep(backoff)
+            backoff *= 2
+    if outcome is None:
+        logger.info(f"{url} not modified since {metadata.get('last_modified') or metadata.get('etag')}")
+        return DownloadResult(destination_path, False, previous_sha256, 'not modified')
+
+    status, headers, received = outcome
+    sha256 = file_sha256(part_path)
+    os.replace(part_path, destination_path)
+    metadata.update({
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'sha256': sha256,
+        'size': os.path.getsize(destination_path),
+        'downloaded_at': email.utils.formatdate(usegmt=True)
+    })
+    metadata.pop('part_validator', None)
+    _write_metadata(destination_path, metadata)
+    result = DownloadResult(destination_path, sha256 != previous_sha256, sha256, status, received)
+    logger.info(f"Download of {url}: {result}")
+    return result
+
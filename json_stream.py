@@ -0,0 +1,164 @@
+"""
+Incremental reader of large JSON documents. JSONStream walks a text file a chunk at a time: the caller iterates over
+the members of objects and the elements of arrays and, for each of them, either decodes the value or skips it. Skipped
+values are scanned without building any Python object and the consumed part of the file is discarded, so memory
+depends on the size of the values decoded, not on the size of the file.
+"""
+import json
+import re
+from typing import Generator, TextIO
+
+_decoder = json.JSONDecoder()
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = ' \t\r\n'
+_NUMBER_CONTINUATION = '.eE'
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class JSONStream:
+    def __init__(self, file: TextIO, chunk_size: int = 1 << 16):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """
+        Discards the consumed part of the buffer and appends to it at least chunk_size characters (or as many as
+        the buffer holds, so that decoding a long value needs a logarithmic number of attempts).
+        :return: False at the end of the file
+        """
+        chunk = self._file.read(max(self._chunk_size, len(self._buffer) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, message: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(message, self._buffer, self._pos)
+
+    def _peek(self) -> str:
+        """
+        :return: the next non-whitespace character, without consuming it, or '' at the end of the file
+        """
+        while True:
+            buffer, pos = self._buffer, self._pos
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self._pos += 1
+
+    def value(self):
+        """
+        :return: the next value, decoded
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # a number at the end of the buffer, or followed by the '.' or the exponent whose digits are still in
+                # the next chunk, may continue in the next chunk
+                if self._eof or not _is_number(value) or \
+                        (end < len(self._buffer) and self._buffer[end] not in _NUMBER_CONTINUATION):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def skip(self):
+        """
+        Consumes the next value without decoding it.
+        """
+        if self._peek() not in ('{', '['):
+            self.value()    # scalars are short
+            return
+        depth, in_string = 0, False
+        while True:
+            buffer, pos = self._buffer, self._pos
+            while True:
+                match = (_STRING_SPECIAL if in_string else _STRUCTURAL).search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                char, pos = match.group(), match.end()
+                if in_string:
+                    if char == '\\':
+                        if pos == len(buffer):  # the escaped character is in the next chunk
+                            pos -= 1
+                            break
+                        pos += 1
+                    else:
+                        in_string = False
+                elif char == '"':
+                    in_string = True
+                elif char in '{[':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        self._pos = pos
+                        return
+            self._pos = pos
+            if not self._fill():
+                raise self._error("Unterminated value")
+
+    def keys(self) -> Generator[str, None, None]:
+        """
+        Iterates over the object starting at the current position. After receiving a key, the caller must consume its
+        value with value(), skip() or another iteration.
+        :return: the keys of the object
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self._expect(':')
+            yield key
+            separator = self._peek()
+            self._pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise self._error("Expecting ',' delimiter")
+
+    def elements(self) -> Generator[int, None, None]:
+        """
+        Iterates over the array starting at the current position. After receiving an index, the caller must consume
+        the element with value(), skip() or another iteration.
+        :return: the indexes of the elements of the array
+        """
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            separator = self._peek()
+            self._pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise self._error("Expecting ',' delimiter")
@@ -1,4 +1,11 @@
-from time import sleep
+import argparse
+import sys
+from functools import partial
+from loguru import logger
+from data_validators.protein import protein_name_cache_info
+from data_validators.change_registry import close_registry
+import db_config.connection as connection
+from db_config.document_sinks import close_sink, writes_to_mongodb
 from data_sources.aa_residues import aa_residues
 from data_sources.coguk_me import coguk_me
 from data_sources.our_sequence_annotations import our_sequence_annotations
@@ -7,20 +14,81 @@ from data_sources.ruba_variant_effects import effects_of_variants
 from data_sources import covariants
 from data_sources import phe_variants
 from data_sources import uniprot
+from db_config.indexes import ensure_indexes
+from db_config.migrations import drop_legacy_collections, legacy_collections
+from pipeline.dedup import close_merge_stage
+from pipeline.metrics import measured, write_run_report
+from pipeline.profiling import PROFILE_DIR, PROFILE_STAGES, enable_profiling
+from pipeline.scheduler import DAGScheduler, Task, failed_tasks
+
+# sources inserting changes in the change registry
+CHANGE_SOURCES = ('covariants', 'phe_variants', 'coguk_me', 'effects_of_aa_changes')
+# sources adding variants, effects and evidences to the merge stage
+MERGE_SOURCES = ('covariants', 'phe_variants', 'coguk_me', 'effects_of_aa_changes', 'effects_of_variants')
+
+
+def load_changes():
+    """
+    Loads the changes of the shared change registry, recording the stage in the metrics of the run.
+    """
+    with measured('change_registry', 'load_changes', 'dedup') as stats:
+        stats.rows_in, stats.rows_out, stats.bytes = close_registry()
+
+
+PIPELINE = [
+    # independent sources
+    Task('covariants', covariants.run),
+    Task('phe_variants', phe_variants.run),
+    Task('coguk_me', coguk_me.run),
+    Task('our_sequence_annotations', our_sequence_annotations.run),
+    Task('uniprot', uniprot.run),
+    Task('aa_residues', aa_residues.run),
+    Task('effects_of_aa_changes', effects_of_aa_changes.run),
+    Task('effects_of_variants', effects_of_variants.run),
+    # steps requiring the sources above: each distinct change, effect, evidence and variant is written once
+    Task('load_changes', load_changes, depends_on=CHANGE_SOURCES),
+    # every merge source succeeded, so the variants, effects and evidences not produced by this run are stale
+    Task('load_merged_entities', partial(close_merge_stage, delete_stale=True), depends_on=MERGE_SOURCES),
+]
+# indexes are built after every load
+if writes_to_mongodb():
+    PIPELINE.append(Task('ensure_indexes', ensure_indexes, depends_on=[task.name for task in PIPELINE]))
+
 
 if __name__ == '__main__':
-    covariants.run()
-    sleep(3)
-    phe_variants.run()
-    sleep(3)
-    coguk_me.run()
-    sleep(3)
-    our_sequence_annotations.run()
-    sleep(3)
-    uniprot.run()
-    sleep(3)
-    aa_residues.run()
-    sleep(3)
-    effects_of_aa_changes.run()
-    sleep(3)
-    effects_of_variants.run()
+    parser = argparse.ArgumentParser(description="Collects the data of every source")
+    parser.add_argument('--profile', metavar='PROFILERS',
+                        help="profile every stage with cprofile, sample and/or memory (comma separated) or all. See "
+                             "pipeline.profiling (default: the PROFILE environment variable)")
+    parser.add_argument('--profile-dir', default=PROFILE_DIR)
+    parser.add_argument('--profile-stages', default=PROFILE_STAGES, metavar='PATTERN',
+                        help="glob pattern of the <source>.<stage> to profile, e.g. 'covariants.*'")
+    parser.add_argument('--drop-legacy-collections', action='store_true',
+                        help="drop the collections loaded before the _ids were derived from the natural keys (see "
+                             "db_config.migrations). Without it, the run stops if there are any")
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling(args.profile.split(','), args.profile_dir, args.profile_stages)
+    if writes_to_mongodb():
+        legacy = legacy_collections()
+        if legacy and args.drop_legacy_collections:
+            drop_legacy_collections(legacy=legacy)
+        elif legacy:
+            logger.error(f"The collections {legacy} hold documents with random _ids, which would be "
+                         f"duplicated by the upserts of this run. Run again with --drop-legacy-collections.")
+            connection.close_conn()
+            sys.exit(1)
+
+    results = None
+    try:
+        results = DAGScheduler(PIPELINE).run()
+    finally:
+        # the output sink and the connection shared by all the sources are closed
+        close_sink()
+        connection.close_conn()
+        # the metrics of the stages run so far are written even if the run was interrupted
+        write_run_report(results)
+    logger.info(f"protein name resolution cache: {protein_name_cache_info()}")
+    if failed_tasks(results):
+        logger.error(f"Tasks failed or skipped: {failed_tasks(results)}")
+        sys.exit(1)
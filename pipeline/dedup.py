@@ -0,0 +1,128 @@
+"""
+Entities merged across the sources of a pipeline run. Sources producing variants, effects and evidences do not load
+them: they add them to the merge stage of the run (open_merge_stage()), which collapses the duplicates, merges the
+variants of all the sources sharing an alias and, in close_merge_stage(), once every such source has completed, writes
+each entity once. AA and NUC changes are collected in the same way by data_validators.change_registry.
+"""
+import threading
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from db_config.batched_loader import BatchedLoader
+from db_config.mongodb_model import Effect, Reference, Variant, natural_key_of
+from pipeline.metrics import measured
+from pipeline.variant_clustering import cluster_variants
+
+# attributes holding references to other entities: while in the merge stage they contain the handles returned by
+# MergeStage.add(), which are replaced with the _id of the referenced entities when loading
+REFERENCE_FIELDS = {
+    Reference: (('effect_ids', Effect),),
+    Variant: (('effects', Effect),)
+}
+
+
+class MergeStage:
+    """
+    Collapses in memory the entities produced by the sources of a run before they are written. Entities are identified
+    by the natural key of their class (e.g. effects by type, lv, method and the set of aa_changes, evidences by uri,
+    citation, type and publisher): the first entity added with a key survives and the values of the merged_fields of
+    the duplicates are added to it. References to other entities (see REFERENCE_FIELDS) are expressed with the handles
+    returned by add() and are remapped to the _id of the surviving entities by load(), which writes each entity once.
+    AA and NUC changes are collapsed by data_validators.change_registry in the same way.
+    Before being written, the variants sharing an alias are merged by pipeline.variant_clustering, unless
+    cluster_variants is False.
+    """
+    def __init__(self, cluster_variants: bool = True):
+        self.cluster_variants = cluster_variants
+        self._lock = threading.Lock()
+        self._entities: Dict[type, list] = dict()                # class -> surviving entities, indexed by handle
+        self._handle_of: Dict[type, Dict[tuple, int]] = dict()   # class -> natural key -> handle
+        self._added: Dict[type, int] = dict()                    # class -> number of entities added
+
+    def add(self, obj) -> int:
+        """
+        :return: the handle of the entity obj belongs to. Handles are dense integers, separate for each class.
+        """
+        cls = type(obj)
+        key = natural_key_of(cls, vars(obj))
+        with self._lock:
+            entities = self._entities.setdefault(cls, [])
+            handle_of = self._handle_of.setdefault(cls, dict())
+            self._added[cls] = self._added.get(cls, 0) + 1
+            handle = handle_of.get(key)
+            if handle is None:
+                handle = handle_of[key] = len(entities)
+                for attr in cls.merged_fields:
+                    setattr(obj, attr, list(dict.fromkeys(getattr(obj, attr) or [])))
+                entities.append(obj)
+            else:
+                survivor = entities[handle]
+                for attr in cls.merged_fields:
+                    setattr(survivor, attr, list(dict.fromkeys((getattr(survivor, attr) or []) +
+                                                               list(getattr(obj, attr) or []))))
+        return handle
+
+    def __len__(self):
+        return sum(len(entities) for entities in self._entities.values())
+
+    def load(self, delete_stale: bool = False) -> int:
+        """
+        Remaps the references among the entities and writes each of them once.
+        :param delete_stale: whether to delete the stored entities of the same classes that were not written, like the
+        variants of a previous run whose set of aliases changed (hence their _id). Pass True only when every source
+        adding entities of those classes contributed to this merge stage.
+        :return: the bytes written
+        """
+        ids: Dict[type, List] = dict()
+        # referenced classes first
+        classes = sorted(self._entities, key=lambda c: c in REFERENCE_FIELDS)
+        with BatchedLoader() as loader:
+            for cls in classes:
+                entities = self._entities[cls]
+                for entity in entities:
+                    for attr, referenced_cls in REFERENCE_FIELDS.get(cls, ()):
+                        setattr(entity, attr, list(dict.fromkeys(ids[referenced_cls][handle]
+                                                                 for handle in getattr(entity, attr))))
+                if cls is Variant and self.cluster_variants:
+                    # handles of variants are never referenced, so the clusters can replace them
+                    entities = cluster_variants(entities)
+                ids[cls] = [loader.upsert(entity) for entity in entities]
+        if delete_stale:
+            deleted = {cls.__name__: loader.sink.delete_except(cls, ids[cls]) for cls in classes}
+            logger.info(f"Stale merged entities deleted: {deleted}")
+        logger.info(f"Merged entities (added -> distinct): "
+                    f"{ {cls.__name__: f'{self._added[cls]} -> {len(self._entities[cls])}' for cls in classes} }")
+        return sum(loader.bytes_written.values())
+
+
+_merge_stage: Optional[MergeStage] = None
+_merge_stage_lock = threading.Lock()
+
+
+def open_merge_stage() -> MergeStage:
+    """
+    :return: the merge stage shared by all the sources of this run. It is created on first use.
+    """
+    global _merge_stage
+    with _merge_stage_lock:
+        if _merge_stage is None:
+            _merge_stage = MergeStage()
+        return _merge_stage
+
+
+def close_merge_stage(delete_stale: bool = False):
+    """
+    Loads the entities collected by the shared merge stage and discards it.
+    :param delete_stale: see MergeStage.load()
+    """
+    global _merge_stage
+    with _merge_stage_lock:
+        merge_stage, _merge_stage = _merge_stage, None
+    if merge_stage is not None:
+        with measured('merge_stage', 'load_merged_entities', 'dedup') as stats:
+            stats.rows_in = sum(merge_stage._added.values())
+            stats.rows_out = len(merge_stage)
+            stats.bytes = merge_stage.load(delete_stale)
+    else:
+        logger.warning("Request to close a merge stage that was never opened.")
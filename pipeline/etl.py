@@ -0,0 +1,248 @@
+"""
+Common structure of the modules in data_sources. A Source is a chain of generator stages:
+    extract() -> transform_1(rows) -> ... -> transform_n(rows) -> sink
+extract() generates the rows of the source, each transform maps an iterable of rows to an iterable of rows (usually a
+generator, so that rows flow one at a time) and the sink (see pipeline.sinks) receives them in batches of
+sink.batch_size rows. Unless ETL_QUEUE_SIZE is 0, every stage but the sink runs in its own thread and passes batches of
+rows to the next one through a queue holding at most ETL_QUEUE_SIZE batches: a slow stage (e.g. the sink waiting for
+the database) blocks the stages before it, so the rows in memory are bounded regardless of the size of the source.
+Every run records, for each stage, the rows received and emitted, the time spent in the stage itself, its wall-clock
+and CPU time and the bytes written by the sink, and adds them to the metrics of the run (see pipeline.metrics). When
+profiling is enabled (see pipeline.profiling), the thread of each stage is profiled separately; with ETL_QUEUE_SIZE 0,
+the whole chain is profiled as one stage named all_stages.
+"""
+import os
+import queue
+import threading
+from itertools import chain, islice
+from time import perf_counter, thread_time
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+from pipeline.metrics import StageStats, peak_rss_bytes, record
+from pipeline.profiling import profiled
+from pipeline.sinks import Sink
+
+ETL_QUEUE_SIZE = int(os.environ.get('ETL_QUEUE_SIZE', 4))
+_POLL_INTERVAL_S = 0.1
+
+Stage = Callable[[Iterable], Iterable]
+
+
+class _Stopped(Exception):
+    """Raised in the stage threads when the pipeline is aborted."""
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+class _Timed:
+    """
+    Iterator wrapper counting the items returned and the time (and CPU time of the calling thread) spent producing
+    them, which includes the time spent by the previous stages.
+    """
+    def __init__(self, iterable: Iterable):
+        self._iterator = iter(iterable)
+        self.items = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.started: Optional[float] = None    # when the first item was requested
+        self.finished: Optional[float] = None   # when the items were exhausted
+        self.peak_rss_bytes: Optional[int] = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start, cpu_start = perf_counter(), thread_time()
+        if self.started is None:
+            self.started = start
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self.finished = perf_counter()
+            self.peak_rss_bytes = peak_rss_bytes()
+            raise
+        finally:
+            self.seconds += perf_counter() - start
+            self.cpu_seconds += thread_time() - cpu_start
+        self.items += 1
+        return item
+
+
+def _deferred(stage: Callable, *args) -> Iterator:
+    """
+    Calls stage when the first row is requested, so that stages returning lists run (and are timed) in their thread.
+    """
+    yield from stage(*args)
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            q.put(item, timeout=_POLL_INTERVAL_S)
+            return
+        except queue.Full:
+            pass
+
+
+def _drain(q: queue.Queue, stop: threading.Event) -> Iterator:
+    """
+    :return: the rows of the batches put in q by the previous stage
+    """
+    while True:
+        try:
+            item = q.get(timeout=_POLL_INTERVAL_S)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Stopped()
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield from item
+
+
+def _produce(rows: Iterable, q: queue.Queue, batch_size: int, stop: threading.Event, profile):
+    try:
+        with profile:
+            rows = iter(rows)
+            for batch in iter(lambda: list(islice(rows, batch_size)), []):
+                _put(q, batch, stop)
+        _put(q, _END, stop)
+    except _Stopped:
+        pass
+    except BaseException as e:
+        try:
+            _put(q, _Failure(e), stop)
+        except _Stopped:
+            pass
+
+
+def batched(size: int) -> Stage:
+    """
+    :return: a stage grouping the rows in lists of size rows (the last one may be shorter)
+    """
+    def batched_rows(rows: Iterable) -> Iterator[list]:
+        rows = iter(rows)
+        return iter(lambda: list(islice(rows, size)), [])
+    return batched_rows
+
+
+def map_rows(function: Callable) -> Stage:
+    """
+    :return: a stage replacing each row with function(row)
+    """
+    def stage(rows: Iterable) -> Iterator:
+        return map(function, rows)
+    stage.__name__ = function.__name__
+    return stage
+
+
+def flat_map_rows(function: Callable[..., Iterable]) -> Stage:
+    """
+    :return: a stage replacing each row with the rows of function(row)
+    """
+    def stage(rows: Iterable) -> Iterator:
+        return chain.from_iterable(map(function, rows))
+    stage.__name__ = function.__name__
+    return stage
+
+
+class Source:
+    def __init__(self, name: str, extract: Callable[[], Iterable], transforms: Sequence[Stage], sink: Sink,
+                 queue_size: int = None, queue_batch_size: int = None):
+        """
+        :param queue_size: the maximum number of batches waiting between two stages (ETL_QUEUE_SIZE by default). With
+        0, the stages run in the calling thread.
+        :param queue_batch_size: the rows passed at once between two stages (sink.batch_size by default). Sources whose
+        rows are large (e.g. chunks of rows) should pass them one by one.
+        """
+        self.name = name
+        self.extract = extract
+        self.transforms = list(transforms)
+        self.sink = sink
+        self.queue_size = queue_size if queue_size is not None else ETL_QUEUE_SIZE
+        self.queue_batch_size = queue_batch_size or sink.batch_size
+        self.stats: List[StageStats] = []
+
+    def run(self) -> List[StageStats]:
+        """
+        Runs the stages until the extracted rows are exhausted. If a stage fails, the other stages are stopped, the
+        sink is closed with the error and the error is raised.
+        :return: the statistics of each stage, also logged
+        """
+        stage_names = [self.extract.__name__] + [t.__name__ for t in self.transforms] + [self.sink.name]
+        kinds = ['parse'] + ['transform'] * len(self.transforms) + ['load']
+        self.stats = [StageStats(self.name, stage_name, kind) for stage_name, kind in zip(stage_names, kinds)]
+        stop = threading.Event()
+        threads: List[threading.Thread] = []
+        inputs: List[Optional[_Timed]] = []
+        outputs: List[_Timed] = []
+        sink_input: Optional[_Timed] = None
+        start = perf_counter()
+        error = None
+        self.sink.open()
+        try:
+            rows = None
+            for i, stage in enumerate([self.extract] + self.transforms):
+                inputs.append(_Timed(rows) if rows is not None else None)
+                outputs.append(_Timed(_deferred(stage, inputs[-1]) if i else _deferred(stage)))
+                rows = outputs[-1]
+                if self.queue_size > 0:
+                    q = queue.Queue(self.queue_size)
+                    thread = threading.Thread(target=_produce,
+                                              args=(rows, q, self.queue_batch_size, stop,
+                                                    profiled(self.name, stage_names[i])),
+                                              name=f'{self.name}.{stage_names[i]}', daemon=True)
+                    thread.start()
+                    threads.append(thread)
+                    rows = _drain(q, stop)
+            rows = sink_input = _Timed(rows)
+            sink_stats = self.stats[-1]
+            with profiled(self.name, stage_names[-1] if self.queue_size > 0 else 'all_stages'):
+                for batch in iter(lambda: list(islice(rows, self.sink.batch_size)), []):
+                    batch_start, batch_cpu_start = perf_counter(), thread_time()
+                    self.sink.write(batch)
+                    sink_stats.seconds += perf_counter() - batch_start
+                    sink_stats.cpu_seconds += thread_time() - batch_cpu_start
+                    sink_stats.rows_out += len(batch)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            close_start, close_cpu_start = perf_counter(), thread_time()
+            self.sink.close(error)
+            sink_stats = self.stats[-1]
+            sink_stats.seconds += perf_counter() - close_start     # the last documents are flushed when closing
+            sink_stats.cpu_seconds += thread_time() - close_cpu_start
+            sink_stats.wall_seconds = perf_counter() - start
+            sink_stats.peak_rss_bytes = peak_rss_bytes()
+            sink_stats.bytes = self.sink.bytes_written
+            for stats, stage_input, stage_output in zip(self.stats, inputs, outputs):
+                stats.rows_in = stage_input.items if stage_input is not None else 0
+                stats.rows_out = stage_output.items
+                stats.seconds = stage_output.seconds - (stage_input.seconds if stage_input is not None else 0)
+                stats.cpu_seconds = stage_output.cpu_seconds - \
+                    (stage_input.cpu_seconds if stage_input is not None else 0)
+                if stage_output.started is not None:
+                    stats.wall_seconds = (stage_output.finished or perf_counter()) - stage_output.started
+                stats.peak_rss_bytes = stage_output.peak_rss_bytes or sink_stats.peak_rss_bytes
+            if sink_input is not None:
+                sink_stats.rows_in = sink_input.items
+            record(*self.stats)
+            logger.info(f"{self.name} {'failed' if error else 'completed'} in {perf_counter() - start:.3f}s: "
+                        f"{'; '.join(map(repr, self.stats))}")
+        return self.stats
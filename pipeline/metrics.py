@@ -0,0 +1,210 @@
+"""
+Metrics of the stages of a run. Every stage of every source (download, parse, transform, load) and the final dedup of
+the changes and of the merged entities records a StageStats: rows received and emitted, time spent in the stage, its
+wall-clock and CPU time, the peak RSS of the process when it ended and the bytes it downloaded or wrote. At the end of
+the run, write_run_report() writes them to METRICS_DIR as
+- run-<UTC start time>.json, one file per run, to track regressions over time;
+- pipeline.prom, in the Prometheus text format (e.g. for the textfile collector of the node exporter), replaced at
+  every run.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from os.path import sep
+from time import perf_counter, thread_time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from pipeline.profiling import profiled
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+METRICS_DIR = os.environ.get('METRICS_DIR', f'.{sep}generated{sep}metrics{sep}')
+METRIC_PREFIX = 'cov2k'
+
+
+class StageStats:
+    def __init__(self, source: str, stage: str, kind: Optional[str] = None):
+        """
+        :param kind: download, parse, transform, load or dedup (the name of the stage by default)
+        """
+        self.source = source
+        self.stage = stage
+        self.kind = kind or stage
+        self.rows_in = 0
+        self.rows_out = 0
+        self.seconds = 0.0      # time spent in the stage, excluding the time spent waiting for the previous stages
+        self.wall_seconds = 0.0         # from the start to the end of the stage
+        self.cpu_seconds = 0.0          # CPU time of the thread(s) running the stage
+        self.peak_rss_bytes: Optional[int] = None   # peak resident memory of the process when the stage ended
+        self.bytes = 0          # bytes downloaded (download stages) or written to the output sink (load stages)
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __repr__(self):
+        rate = f", {self.rows_out / self.seconds:.0f} rows/s" if self.seconds else ""
+        return f"{self.stage}: {self.rows_in} -> {self.rows_out} rows in {self.seconds:.3f}s{rate}"
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    :return: the peak resident set size of the process so far (None where the platform does not tell)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024    # bytes on macOS, KiB elsewhere
+
+
+_stages: List[StageStats] = []
+_stages_lock = threading.Lock()
+_run_started: Tuple[float, float, float] = (time.time(), perf_counter(), time.process_time())
+
+
+def record(*stats: StageStats):
+    """
+    Adds the statistics of some stages to the report of the run.
+    """
+    with _stages_lock:
+        _stages.extend(stats)
+
+
+def recorded_stages() -> List[StageStats]:
+    with _stages_lock:
+        return list(_stages)
+
+
+def reset_metrics():
+    """
+    Discards the recorded stages and restarts the clock of the run.
+    """
+    global _run_started
+    with _stages_lock:
+        _stages.clear()
+        _run_started = (time.time(), perf_counter(), time.process_time())
+
+
+@contextlib.contextmanager
+def measured(source: str, stage: str, kind: Optional[str] = None) -> Iterator[StageStats]:
+    """
+    Records the time spent in the block as a stage of source, which is also profiled if profiling is enabled (see
+    pipeline.profiling). The block can set the rows and bytes of the stage on the StageStats it receives.
+    E.g.:
+        with measured('covariants', 'download') as stats:
+            stats.bytes = download(URL, LOCAL_PATH).received
+    """
+    stats = StageStats(source, stage, kind)
+    start, cpu_start = perf_counter(), thread_time()
+    try:
+        with profiled(source, stage):
+            yield stats
+    finally:
+        stats.seconds = stats.wall_seconds = perf_counter() - start
+        stats.cpu_seconds = thread_time() - cpu_start
+        stats.peak_rss_bytes = peak_rss_bytes()
+        record(stats)
+
+
+def run_report(task_results: Optional[dict] = None) -> dict:
+    """
+    :param task_results: the results of pipeline.scheduler.DAGScheduler.run(), if any
+    :return: the metrics of the run and of each recorded stage
+    """
+    started_at, start, cpu_start = _run_started
+    return {
+        'started_at': datetime.fromtimestamp(started_at, timezone.utc).isoformat(timespec='seconds'),
+        'wall_seconds': perf_counter() - start,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'tasks': {name: {'status': result.status, 'seconds': result.elapsed}
+                  for name, result in (task_results or dict()).items()},
+        'stages': [stats.as_dict() for stats in recorded_stages()]
+    }
+
+
+def _label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+
+# stage metrics: attribute of StageStats -> (metric name, help)
+_STAGE_METRICS = {
+    'wall_seconds': ('stage_wall_seconds', 'Wall-clock time from the start to the end of the stage'),
+    'seconds': ('stage_busy_seconds', 'Time spent in the stage, excluding the wait for the previous stages'),
+    'cpu_seconds': ('stage_cpu_seconds', 'CPU time of the threads running the stage'),
+    'rows_in': ('stage_rows_in', 'Rows received by the stage'),
+    'rows_out': ('stage_rows_out', 'Rows emitted by the stage'),
+    'bytes': ('stage_bytes', 'Bytes downloaded or written by the stage'),
+    'peak_rss_bytes': ('stage_peak_rss_bytes', 'Peak resident memory of the process when the stage ended'),
+}
+
+
+def prometheus_text(report: dict) -> str:
+    """
+    :return: the metrics of report in the Prometheus text exposition format. Stages run more than once in the same
+    run (e.g. the download of each UniProt accession) are summed, except the peak RSS, which is the maximum.
+    """
+    lines = []
+
+    def metric(name: str, help_text: str, samples: List[Tuple[str, float]]):
+        lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+        lines.extend(f'{METRIC_PREFIX}_{name}{labels} {value}' for labels, value in samples)
+
+    finished_at = datetime.fromisoformat(report['started_at']).timestamp() + report['wall_seconds']
+    metric('run_finished_timestamp_seconds', 'End of the last run as a Unix timestamp', [('', round(finished_at))])
+    metric('run_wall_seconds', 'Wall-clock time of the run', [('', report['wall_seconds'])])
+    metric('run_cpu_seconds', 'CPU time of the process during the run', [('', report['cpu_seconds'])])
+    if report['peak_rss_bytes'] is not None:
+        metric('run_peak_rss_bytes', 'Peak resident memory of the process', [('', report['peak_rss_bytes'])])
+    if report['tasks']:
+        metric('task_seconds', 'Duration of the task (0 if skipped)',
+               [(_labels(task=name, status=task['status']), task['seconds'] or 0)
+                for name, task in report['tasks'].items()])
+    totals: Dict[tuple, dict] = defaultdict(lambda: defaultdict(int))
+    for stats in report['stages']:
+        total = totals[(stats['source'], stats['kind'], stats['stage'])]
+        for attr in _STAGE_METRICS:
+            if attr == 'peak_rss_bytes':
+                total[attr] = max(total[attr], stats[attr] or 0)
+            else:
+                total[attr] += stats[attr]
+    for attr, (name, help_text) in _STAGE_METRICS.items():
+        metric(name, help_text, [(_labels(source=source, kind=kind, stage=stage), total[attr])
+                                 for (source, kind, stage), total in totals.items()])
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomically(path: str, content: str):
+    with open(path + '.tmp', 'w') as output_file:
+        output_file.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def write_run_report(task_results: Optional[dict] = None, directory: str = METRICS_DIR) -> Tuple[str, str]:
+    """
+    Writes the JSON report and the Prometheus metrics of the run to directory.
+    :return: the paths of the two files
+    """
+    report = run_report(task_results)
+    os.makedirs(directory, exist_ok=True)
+    started_at = datetime.fromisoformat(report['started_at']).strftime('%Y%m%dT%H%M%SZ')
+    json_path = os.path.join(directory, f'run-{started_at}.json')
+    prometheus_path = os.path.join(directory, 'pipeline.prom')
+    _write_atomically(json_path, json.dumps(report, indent=2))
+    _write_atomically(prometheus_path, prometheus_text(report))
+    logger.info(f"Run metrics written to {json_path} and {prometheus_path}")
+    return json_path, prometheus_path
@@ -0,0 +1,202 @@
+"""
+Opt-in profiling of the stages of the sources (see pipeline.etl.Source, which runs every stage in its own thread, and
+pipeline.metrics.measured, used by downloads and by the final dedup). PROFILE (or main.py --profile) lists the
+profilers to use, separated by commas:
+- cprofile: deterministic profile of the thread running the stage, written as <stage>.pstats (open it with
+  python -m pstats or snakeviz) and as <stage>.txt, the functions with the highest cumulative time;
+- sample: samples the stack of the thread running the stage every PROFILE_SAMPLE_INTERVAL_S and writes the collapsed
+  stacks to <stage>.collapsed (input of flamegraph.pl or speedscope). Its overhead is lower than that of cProfile;
+- memory: traces the allocations with tracemalloc and writes to <stage>.alloc.txt the PROFILE_TOP_ALLOCATIONS source
+  lines that allocated the most memory while the stage was running. tracemalloc traces the whole process, so the
+  allocations of stages running at the same time are mixed;
+- all: all of the above.
+The files of a run are written to a directory named after its start time in PROFILE_DIR, one set per stage, named
+<source>.<stage>. PROFILE_STAGES restricts profiling to the stages matching a glob pattern (e.g. "covariants.*").
+When PROFILE is empty (the default) profiled() returns a context manager doing nothing.
+"""
+import contextlib
+import cProfile
+import fnmatch
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from os.path import sep
+from typing import Collection, Dict, Optional
+
+from loguru import logger
+
+PROFILE = os.environ.get('PROFILE', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', f'.{sep}generated{sep}profiles{sep}')
+PROFILE_STAGES = os.environ.get('PROFILE_STAGES', '*')
+PROFILE_SAMPLE_INTERVAL_S = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_S', 0.005))
+PROFILE_TOP_ALLOCATIONS = int(os.environ.get('PROFILE_TOP_ALLOCATIONS', 50))
+PROFILE_TOP_FUNCTIONS = 50
+PROFILERS = ('cprofile', 'sample', 'memory')
+
+
+def _parse_profilers(value: str) -> frozenset:
+    profilers = {p.strip().lower() for p in value.split(',') if p.strip()}
+    if 'all' in profilers:
+        return frozenset(PROFILERS)
+    unknown = profilers.difference(PROFILERS)
+    if unknown:
+        raise ValueError(f"Unknown profilers {sorted(unknown)} in PROFILE. Choose among {list(PROFILERS) + ['all']}")
+    return frozenset(profilers)
+
+
+_profilers = _parse_profilers(PROFILE)
+_output_dir: Optional[str] = None
+_stage_pattern = PROFILE_STAGES
+_lock = threading.Lock()
+_used_names: Dict[str, int] = dict()
+_tracemalloc_users = 0
+_DISABLED = contextlib.nullcontext()
+
+
+def enable_profiling(profilers: Collection[str] = PROFILERS, directory: str = PROFILE_DIR,
+                     stages: str = PROFILE_STAGES):
+    """
+    Profiles the stages matching the glob pattern stages with profilers from now on.
+    """
+    global _profilers, _output_dir, _stage_pattern
+    with _lock:
+        _profilers = _parse_profilers(','.join(profilers))
+        _output_dir = os.path.join(directory, datetime.now().strftime('%Y%m%dT%H%M%S'))
+        _stage_pattern = stages
+        _used_names.clear()
+
+
+def disable_profiling():
+    global _profilers
+    with _lock:
+        _profilers = frozenset()
+
+
+def profiling_enabled() -> bool:
+    return bool(_profilers)
+
+
+def _output_path(name: str) -> str:
+    global _output_dir
+    with _lock:
+        if _output_dir is None:
+            _output_dir = os.path.join(PROFILE_DIR, datetime.now().strftime('%Y%m%dT%H%M%S'))
+        # stages run more than once (e.g. the download of each UniProt accession) get a numbered file each
+        count = _used_names[name] = _used_names.get(name, 0) + 1
+        os.makedirs(_output_dir, exist_ok=True)
+        return os.path.join(_output_dir, name if count == 1 else f'{name}-{count}')
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Counts the stacks of a thread, sampled every interval seconds by a background thread.
+    """
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=f'sampler-{thread_id}', daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w') as output_file:
+            for stack, count in self.stacks.most_common():
+                output_file.write(f'{stack} {count}\n')
+
+
+def _start_tracemalloc() -> tracemalloc.Snapshot:
+    global _tracemalloc_users
+    with _lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc(start: tracemalloc.Snapshot, path: str):
+    global _tracemalloc_users
+    ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    differences = tracemalloc.take_snapshot().filter_traces(ignored).compare_to(start.filter_traces(ignored), 'lineno')
+    with _lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    with open(path, 'w') as output_file:
+        output_file.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites by memory allocated during the stage and "
+                          f"not yet freed at its end\n")
+        for stat in differences[:PROFILE_TOP_ALLOCATIONS]:
+            output_file.write(f"{stat.size_diff / 1024:12.1f} KiB {stat.count_diff:10d} blocks  {stat.traceback}\n")
+
+
+@contextlib.contextmanager
+def _profiled(name: str, profilers: frozenset):
+    path = _output_path(name)
+    profile = sampler = snapshot = None
+    if 'memory' in profilers:
+        snapshot = _start_tracemalloc()
+    if 'sample' in profilers:
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+    if 'cprofile' in profilers:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # since Python 3.12, only one cProfile can be active at a time
+            logger.warning(f"{name} not profiled with cProfile: another stage is being profiled")
+            profile = None
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(path + '.pstats')
+            summary = io.StringIO()
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            with open(path + '.txt', 'w') as output_file:
+                output_file.write(summary.getvalue())
+        if sampler is not None:
+            sampler.stop()
+            sampler.write_collapsed(path + '.collapsed')
+        if snapshot is not None:
+            _stop_tracemalloc(snapshot, path + '.alloc.txt')
+        logger.info(f"Profiles of {name} ({', '.join(sorted(profilers))}) written to {path}.*")
+
+
+def profiled(source: str, stage: str):
+    """
+    :return: a context manager profiling the calling thread as the stage of source, if profiling is enabled for it
+    """
+    profilers = _profilers
+    if not profilers:
+        return _DISABLED
+    name = f'{source}.{stage}'
+    if not fnmatch.fnmatch(name, _stage_pattern):
+        return _DISABLED
+    return _profiled(name, profilers)
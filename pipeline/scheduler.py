@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from time import perf_counter
+from typing import Callable, Collection, Dict, List, Optional
+
+from loguru import logger
+
+# maximum number of tasks running at the same time (can be overridden through the environment variable of the same name)
+PIPELINE_MAX_WORKERS = int(os.environ.get('PIPELINE_MAX_WORKERS', 4))
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Task:
+    def __init__(self, name: str, function: Callable[[], None], depends_on: Collection[str] = ()):
+        """
+        :param name: unique name of the task
+        :param function: the callable executing the task
+        :param depends_on: names of the tasks that must succeed before this one starts
+        """
+        self.name = name
+        self.function = function
+        self.depends_on = tuple(depends_on)
+
+
+class TaskResult:
+    def __init__(self, name: str, status: str, elapsed: Optional[float] = None, error: Optional[BaseException] = None):
+        self.name = name
+        self.status = status
+        self.elapsed = elapsed      # seconds
+        self.error = error
+
+    def __repr__(self):
+        elapsed = f" in {self.elapsed:.2f}s" if self.elapsed is not None else ""
+        return f"{self.name}: {self.status}{elapsed}"
+
+
+class DAGScheduler:
+    """
+    Runs a set of tasks in a thread pool, starting each task as soon as all the tasks it depends on have succeeded.
+    Tasks run in threads (not in processes) because the sources share in-memory state, like the change registry and
+    the MongoDB client.
+    Failure policy: a task that raises (including SystemExit, as the sources call sys.exit() on fatal errors when run
+    as scripts) is marked as failed and every task depending on it (directly or transitively)
+    is skipped, while the independent tasks go on. With fail_fast=True, no new task is started after the first failure
+    (the running ones are completed) and the remaining ones are skipped.
+    """
+    def __init__(self, tasks: Collection[Task], max_workers: int = PIPELINE_MAX_WORKERS, fail_fast: bool = False):
+        self.tasks: Dict[str, Task] = dict()
+        for task in tasks:
+            if task.name in self.tasks:
+                raise ValueError(f"Duplicate task name {task.name}")
+            self.tasks[task.name] = task
+        for task in self.tasks.values():
+            unknown = [d for d in task.depends_on if d not in self.tasks]
+            if unknown:
+                raise ValueError(f"Task {task.name} depends on unknown tasks {unknown}")
+        self._check_acyclic()
+        self.max_workers = max(1, max_workers)
+        self.fail_fast = fail_fast
+
+    def _check_acyclic(self):
+        visiting, visited = set(), set()
+
+        def visit(name: str, path: List[str]):
+            if name in visiting:
+                raise ValueError(f"Circular dependency among tasks {path[path.index(name):] + [name]}")
+            if name not in visited:
+                visiting.add(name)
+                for dependency in self.tasks[name].depends_on:
+                    visit(dependency, path + [name])
+                visiting.remove(name)
+                visited.add(name)
+
+        for task_name in self.tasks:
+            visit(task_name, [])
+
+    @staticmethod
+    def _timed_call(task: Task) -> float:
+        logger.info(f"Task {task.name} STARTED")
+        start = perf_counter()
+        task.function()
+        return perf_counter() - start
+
+    def run(self) -> Dict[str, TaskResult]:
+        """
+        :return: the result of each task, in the order they were completed or skipped.
+        """
+        results: Dict[str, TaskResult] = dict()
+        waiting = dict(self.tasks)
+        running: Dict[Future, Task] = dict()
+        failed = False
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline') as executor:
+            while waiting or running:
+                # skip the tasks that can't run anymore
+                for task in list(waiting.values()):
+                    if (failed and self.fail_fast) or any(results.get(d) and results[d].status != SUCCEEDED
+                                                          for d in task.depends_on):
+                        del waiting[task.name]
+                        results[task.name] = TaskResult(task.name, SKIPPED)
+                        logger.warning(f"Task {task.name} SKIPPED")
+                # start the tasks whose dependencies are satisfied, if there are free workers
+                for task in list(waiting.values()):
+                    if len(running) >= self.max_workers:
+                        break
+                    if all(d in results for d in task.depends_on):
+                        del waiting[task.name]
+                        running[executor.submit(self._timed_call, task)] = task
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        results[task.name] = TaskResult(task.name, SUCCEEDED, future.result())
+                        logger.info(f"Task {results[task.name]}")
+                    except BaseException as e:     # SystemExit must not escape run() and abort the other tasks
+                        failed = True
+                        results[task.name] = TaskResult(task.name, FAILED, error=e)
+                        logger.opt(exception=e).error(f"Task {task.name} FAILED")
+        logger.info(f"Completed {len(results)} tasks in {perf_counter() - start:.2f}s: "
+                    f"{[results[name] for name in results]}")
+        return results
+
+
+def failed_tasks(results: Dict[str, TaskResult]) -> List[str]:
+    """
+    :return: the names of the tasks that failed or were skipped
+    """
+    return [name for name, result in results.items() if result.status != SUCCEEDED]
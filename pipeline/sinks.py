@@ -0,0 +1,68 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Optional
+
+from db_config.batched_loader import BatchedLoader, BATCH_SIZE
+
+
+class Sink(ABC):
+    """
+    Final stage of a pipeline.etl.Source: receives the rows in batches of at most batch_size rows. A sink is opened
+    before the first batch and closed after the last one, or when the pipeline fails (error is then the exception).
+    """
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        self.batch_size = batch_size
+        self.bytes_written = 0      # bytes written to the output sink by the last run
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write(self, batch: list):
+        pass
+
+    def close(self, error: Optional[BaseException] = None):
+        pass
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+
+class UpsertSink(Sink):
+    """
+    Upserts each row (an object of db_config.mongodb_model) through a BatchedLoader, which flushes the documents of
+    each collection in batches of the size configured for the collection.
+    """
+    def __init__(self, batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self._loader: Optional[BatchedLoader] = None
+
+    def open(self):
+        self.bytes_written = 0
+        self._loader = BatchedLoader().__enter__()
+
+    def write(self, batch: list):
+        for obj in batch:
+            self._loader.upsert(obj)
+
+    def close(self, error: Optional[BaseException] = None):
+        loader, self._loader = self._loader, None
+        if loader is not None:
+            loader.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+            self.bytes_written = sum(loader.bytes_written.values())
+
+
+class CallbackSink(Sink):
+    """
+    Passes each batch to function, e.g. the load() of a source adding its entities to the merge stage of the run.
+    """
+    def __init__(self, function: Callable[[Iterable], None], batch_size: int = BATCH_SIZE):
+        super().__init__(batch_size)
+        self.function = function
+
+    def write(self, batch: list):
+        self.function(batch)
+
+    @property
+    def name(self) -> str:
+        return self.function.__name__
@@ -0,0 +1,215 @@
+"""
+Clusters the variants described by different sources into single variants. Two variants belong to the same cluster
+when they share an alias (same organization and name), directly or through a chain of other variants. Clusters are
+maintained incrementally with a union-find structure while the variants arrive and the merged variants are emitted in a
+single pass at the end.
+Two clusters whose PANGO names are disjoint are never merged, whatever alias they share: e.g. covariants names 21I and
+21J both DELTA (WHO) and B.1.617.1, which would otherwise merge Delta (B.1.617.2) with Kappa (B.1.617.1). Such a variant
+joins the cluster of the first variant it is linked to, in order of arrival, and the refused link is logged. Clusters
+holding more than one PANGO name (e.g. B.1.427 and B.1.429, which covariants describes as a single variant) are logged
+once for each set of names.
+This replaces aggregators/variant_aggregator.js, which merged only the variants sharing a PANGO alias and ran on the
+whole variant collection after the load. js_pipeline_reference() reproduces the output of that pipeline on a list of
+variants, so that the two methods can be compared with compare_with_js_pipeline(); running this module does so on the
+local copy of the source files.
+"""
+from typing import Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from data_validators.vocabulary import Organization
+from db_config.mongodb_model import Variant
+
+_PANGO = Organization.PANGO.upper()
+
+class VariantClusters:
+    def __init__(self, organizations: Optional[Collection[str]] = None):
+        """
+        :param organizations: the organizations of the aliases that link variants together, or None for all of them.
+        """
+        self.organizations = {org.upper() for org in organizations} if organizations is not None else None
+        self._variants: List[Variant] = []
+        self._parent: List[int] = []    # union-find forest over the indexes of _variants
+        self._size: List[int] = []
+        self._pango_names: List[Set[str]] = []     # PANGO names of the cluster, kept up to date for the roots only
+        self._logged_lineages: Set[frozenset] = set()
+        self._variant_of_alias: Dict[Tuple[str, str], int] = dict()    # (org, name) -> first variant with the alias
+
+    def _root(self, i: int) -> int:
+        parent = self._parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:    # path compression
+            parent[i], i = root, parent[i]
+        return root
+
+    def _union(self, i: int, j: int, alias: Variant.Name):
+        i, j = self._root(i), self._root(j)
+        if i == j:
+            return
+        names_i, names_j = self._pango_names[i], self._pango_names[j]
+        if names_i and names_j and names_i.isdisjoint(names_j):
+            logger.warning(f"Variants of PANGO lineages {sorted(names_i)} and {sorted(names_j)} not merged through the "
+                           f"alias {alias.org} {alias.name}")
+            return
+        if self._size[i] < self._size[j]:
+            i, j = j, i
+        self._parent[j] = i
+        self._size[i] += self._size[j]
+        self._pango_names[i] |= self._pango_names[j]
+        self._pango_names[j] = set()
+        self._log_lineages(i, alias)
+
+    def _log_lineages(self, root: int, alias: Optional[Variant.Name] = None):
+        lineages = frozenset(self._pango_names[root])
+        if len(lineages) > 1 and lineages not in self._logged_lineages:
+            self._logged_lineages.add(lineages)
+            link = f" through the alias {alias.org} {alias.name}" if alias else ""
+            logger.info(f"Cross-lineage merge: one variant groups the PANGO lineages {sorted(lineages)}{link}")
+
+    def add(self, variant: Variant) -> int:
+        """
+        Adds variant to the cluster of any variant sharing one of its aliases, merging such clusters if necessary,
+        unless their PANGO names are disjoint.
+        :return: the index of variant
+        """
+        i = len(self._variants)
+        self._variants.append(variant)
+        self._parent.append(i)
+        self._size.append(1)
+        self._pango_names.append({alias.name for alias in variant.aliases if alias.org == _PANGO})
+        self._log_lineages(i)
+        for alias in variant.aliases:
+            if self.organizations is None or alias.org in self.organizations:
+                other = self._variant_of_alias.setdefault((alias.org, alias.name), i)
+                if other != i:
+                    self._union(i, other, alias)
+        return i
+
+    def clusters(self) -> List[List[int]]:
+        """
+        :return: the indexes of the variants of each cluster, in order of first appearance
+        """
+        clusters: Dict[int, List[int]] = dict()
+        for i in range(len(self._variants)):
+            clusters.setdefault(self._root(i), []).append(i)
+        return list(clusters.values())
+
+    def merged_variants(self) -> List[Variant]:
+        """
+        :return: one variant for each cluster, having the union of the aliases and the concatenation of the
+        characterizations and of the effects of the variants of the cluster.
+        """
+        merged = []
+        for cluster in self.clusters():
+            if len(cluster) == 1:
+                merged.append(self._variants[cluster[0]])
+                continue
+            aliases = dict()
+            org_2_aa_changes, org_2_nuc_changes, effects = [], [], []
+            for i in cluster:
+                variant = self._variants[i]
+                for alias in variant.aliases:
+                    aliases.setdefault((alias.org, alias.name, alias.v_class), alias)
+                org_2_aa_changes += variant.org_2_aa_changes
+                org_2_nuc_changes += variant.org_2_nuc_changes
+                effects += variant.effects
+            merged.append(Variant(list(aliases.values()), org_2_aa_changes, org_2_nuc_changes,
+                                  list(dict.fromkeys(effects))))
+        return merged
+
+    def __len__(self):
+        return len(self._variants)
+
+
+def cluster_variants(variants: Iterable[Variant], organizations: Optional[Collection[str]] = None) -> List[Variant]:
+    """
+    :return: the variants obtained by merging the input variants that share an alias of the given organizations (any
+    organization if None), except those of disjoint PANGO lineages.
+    """
+    clusters = VariantClusters(organizations)
+    for variant in variants:
+        clusters.add(variant)
+    merged = clusters.merged_variants()
+    logger.info(f"Clustered {len(clusters)} variants into {len(merged)}")
+    return merged
+
+
+def js_pipeline_reference(variants: List[Variant]) -> Dict[str, dict]:
+    """
+    Python transcription of aggregators/variant_aggregator.js.
+    :return: for each PANGO name, the indexes of the input variants merged under that name, their aliases (as a set of
+    (org, name, v_class), without the other PANGO names) and the number of characterizations and effects concatenated.
+    Variants without a PANGO alias are discarded, as in the JS pipeline.
+    """
+    pango = Organization.PANGO.upper()
+    groups: Dict[str, List[int]] = dict()
+    for i, variant in enumerate(variants):
+        for alias in variant.aliases:
+            if alias.org == pango:
+                members = groups.setdefault(alias.name, [])
+                if i not in members:
+                    members.append(i)
+    output = dict()
+    for pango_name, members in groups.items():
+        aliases = {(a.org, a.name, a.v_class) for i in members for a in variants[i].aliases
+                   if not (a.org == pango and a.name != pango_name)}
+        output[pango_name] = {
+            'members': members,
+            'aliases': aliases,
+            'org_2_aa_changes': sum(len(variants[i].org_2_aa_changes) for i in members),
+            'org_2_nuc_changes': sum(len(variants[i].org_2_nuc_changes) for i in members),
+            'effects': sum(len(variants[i].effects) for i in members)
+        }
+    return output
+
+
+def compare_with_js_pipeline(variants: List[Variant]) -> dict:
+    """
+    Clusters variants on PANGO aliases only and compares the clusters with the groups produced by the JS pipeline.
+    The two agree on every PANGO name unless a variant carries more than one PANGO name: the JS pipeline then copies
+    it in a group for each name, while the union-find merges those groups.
+    :return: the number of PANGO names on which the methods agree and the details of the disagreements
+    """
+    pango = Organization.PANGO.upper()
+    js_groups = js_pipeline_reference(variants)
+    clusters = VariantClusters([pango])
+    for variant in variants:
+        clusters.add(variant)
+    cluster_of: Dict[int, List[int]] = {i: cluster for cluster in clusters.clusters() for i in cluster}
+    agreements, disagreements = 0, []
+    for pango_name, group in js_groups.items():
+        cluster = cluster_of[group['members'][0]]
+        if sorted(cluster) == sorted(group['members']):
+            agreements += 1
+        else:
+            bridges = [variants[i].aliases for i in cluster
+                       if sum(a.org == pango for a in variants[i].aliases) > 1]
+            disagreements.append({
+                'pango_name': pango_name,
+                'js_members': group['members'],
+                'union_find_members': cluster,
+                'variants_with_many_pango_names': [[a.name for a in aliases if a.org == pango] for aliases in bridges]
+            })
+    return {'pango_names': len(js_groups), 'agreements': agreements, 'disagreements': disagreements}
+
+
+if __name__ == '__main__':
+    from os import chdir
+    from os.path import sep
+    from pprint import pprint
+    from data_sources import covariants, phe_variants
+    from data_sources.ruba_variant_effects import effects_of_variants
+    from data_validators.new_variant import recognize_organization
+    chdir(f"..{sep}")
+    input_variants = list(covariants.transform(covariants.read_input_file()))
+    input_variants += phe_variants.transform(phe_variants.read_zipped_source_files())
+    # the variants of effects_of_variants are named by a single alias
+    input_variants += [Variant([Variant.Name(recognize_organization(pango_id), pango_id)])
+                       for pango_id, _, _ in map(effects_of_variants.transform, effects_of_variants.extract())]
+    comparison = compare_with_js_pipeline(input_variants)
+    print(f"{len(input_variants)} input variants, {comparison['pango_names']} PANGO names, "
+          f"{comparison['agreements']} equal clusters")
+    pprint(comparison['disagreements'])
+    print(f"clustering on all the organizations: {len(cluster_variants(input_variants))} variants")
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks.bench_change_parsing import synthetic_parts
+from data_validators.change import AAChange, Change
+
+ROWS = synthetic_parts(2_000, seed=1)
+
+
+def db_objs(changes) -> list:
+    return [vars(change.to_db_obj()) for change in changes]
+
+
+def test_bulk_aa_parts_equal_the_scalar_path():
+    proteins, refs, positions, alts = zip(*ROWS)
+    expected = db_objs(c for p, r, pos, a in ROWS for c in AAChange.from_parts(p, r, pos, a))
+    assert [vars(x) for x in AAChange.bulk_from_parts(proteins, refs, positions, alts).to_db_objs()] == expected
+
+
+def test_bulk_aa_strings_equal_the_scalar_path():
+    strings = [f"{p.split(' ')[0]}:{r}{pos}{a}" for p, r, pos, a in ROWS]
+    expected = db_objs(c for s in strings for c in AAChange.from_string(s))
+    assert [vars(x) for x in AAChange.bulk_from_strings(strings).to_db_objs()] == expected
+
+
+def test_bulk_nuc_strings_and_parts_equal_the_scalar_path():
+    parts = [(r, str(int(pos) * 3), a) for _, r, pos, a in ROWS]
+    strings = [r + pos + a for r, pos, a in parts]
+    expected = db_objs(c for s in strings for c in Change.from_string(s))
+    assert [vars(x) for x in Change.bulk_from_strings(strings).to_db_objs()] == expected
+    refs, positions, alts = zip(*parts)
+    expected = db_objs(c for r, pos, a in parts for c in Change.from_parts(r, pos, a))
+    assert [vars(x) for x in Change.bulk_from_parts(refs, positions, alts).to_db_objs()] == expected
+
+
+def test_bulk_parsers_reject_invalid_inputs_like_the_scalar_path():
+    with pytest.raises(ValueError):
+        list(Change.from_string("A12"))
+    with pytest.raises(ValueError):
+        Change.bulk_from_strings(["A12T", "A12"])
@@ -0,0 +1,25 @@
+from data_validators.change import AAChange
+from data_validators.change_registry import ChangeRegistry
+
+
+def test_each_change_gets_one_id_whatever_the_input():
+    registry = ChangeRegistry()
+    ids = registry.aa_from_string("S:D614G") + registry.aa_from_parts("S", "D", 614, "G") + \
+        registry.aa_from_columns(AAChange.bulk_from_strings(["S:D614G", "S:N501Y"]))
+    assert ids == [0, 0, 0, 1]
+    assert registry.aa_encoded_strings(ids) == ["S:D614G"] * 3 + ["S:N501Y"]
+    assert registry.nuc_from_string("A23403G") == registry.nuc_from_parts("A", 23403, "G") == [0]
+    assert len(registry) == 3
+
+
+def test_a_change_is_optional_only_if_every_registration_is_optional():
+    registry = ChangeRegistry()
+    optional_first = registry.aa_from_string("S:D614G", optional=True)
+    assert registry.aa_change(optional_first[0]).is_optional
+    assert registry.aa_from_string("S:D614G") == optional_first
+    assert registry.aa_from_string("S:D614G", optional=True) == optional_first
+    assert not registry.aa_change(optional_first[0]).is_optional
+
+    required_first = registry.nuc_from_string("C3037T")
+    registry.nuc_from_string("C3037T", optional=True)
+    assert not registry.nuc_change(required_first[0]).is_optional
@@ -0,0 +1,111 @@
+import email.utils
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import pytest
+
+import download_cache
+from download_cache import download
+
+
+class StandInServer:
+    """
+    Local stand-in for the remote sources, supporting conditional and range requests.
+    """
+    def __init__(self):
+        self.content = os.urandom(300_000)
+        self.last_modified = email.utils.formatdate(time.time() - 3600, usegmt=True)
+        self.drop_after: Optional[int] = None   # drops the connection after sending this many bytes of content
+        self.requests = []
+
+    def etag(self) -> str:
+        return '"' + hashlib.sha256(self.content).hexdigest()[:16] + '"'
+
+
+def handler_of(server: StandInServer):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            server.requests.append(dict(self.headers))
+            if self.headers.get('If-None-Match') == server.etag():
+                self.send_response(304)
+                self.end_headers()
+                return
+            start = 0
+            range_header = self.headers.get('Range')
+            if range_header and self.headers.get('If-Range') in (server.etag(), server.last_modified):
+                start = int(range_header.split('=')[1].rstrip('-'))
+            body = server.content[start:]
+            self.send_response(206 if start else 200)
+            if start:
+                self.send_header('Content-Range', f'bytes {start}-{len(server.content) - 1}/{len(server.content)}')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', server.etag())
+            self.send_header('Last-Modified', server.last_modified)
+            self.end_headers()
+            if server.drop_after is not None:
+                self.wfile.write(body[:server.drop_after])
+                server.drop_after = None
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+    return Handler
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(download_cache, 'DOWNLOAD_BACKOFF_S', 0.01)
+    stand_in = StandInServer()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_of(stand_in))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    stand_in.url = f'http://127.0.0.1:{httpd.server_address[1]}/clusters.json'
+    yield stand_in
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_first_download_then_not_modified(server, tmp_path):
+    path = str(tmp_path / 'clusters.json')
+    first = download(server.url, path)
+    assert (first.status, first.changed, first.received) == ('downloaded', True, len(server.content))
+    assert read(path) == server.content
+
+    second = download(server.url, path)
+    assert (second.status, second.changed, second.received) == ('not modified', False, 0)
+    assert server.requests[-1].get('If-None-Match') == server.etag()
+    assert read(path) == server.content
+
+
+def test_interrupted_download_is_resumed(server, tmp_path):
+    path = str(tmp_path / 'clusters.json')
+    download(server.url, path)
+    server.content = os.urandom(300_000)
+    server.drop_after = 100_000
+    result = download(server.url, path)
+    assert (result.status, result.changed, result.received) == ('resumed', True, 200_000)
+    assert server.requests[-1].get('Range') == 'bytes=100000-'
+    assert server.requests[-1].get('If-Range') == server.etag()
+    assert read(path) == server.content
+    assert not os.path.exists(path + '.part')
+
+
+def test_corrupted_local_copy_is_downloaded_unconditionally(server, tmp_path):
+    path = str(tmp_path / 'clusters.json')
+    download(server.url, path)
+    with open(path, 'ab') as corrupted:
+        corrupted.write(b'garbage')
+    result = download(server.url, path)
+    assert (result.status, result.changed) == ('downloaded', False)
+    assert 'If-None-Match' not in server.requests[-1]
+    assert read(path) == server.content
@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+from data_sources import covariants
+from json_stream import JSONStream
+
+DOCUMENT = {
+    "plots": {"a": [1, 2, {"b": "}]\\\"{["}], "empty": {}, "none": []},
+    "clusters": [
+        {"display_name": "20I (Alpha, V1)", "type": "variant", "country_info": {"UK": [{"n": 1}, {"n": 23456}]},
+         "mutations": {"nonsynonymous": [{"gene": "S", "left": "N", "pos": 501, "right": "Y"}]},
+         "cluster_data": [[0.5, -1.25e-3, True, False, None]], "alt_display_name": ["B.1.1.7"]},
+        {"display_name": "21J (Delta) \\ é中", "type": "variant", "country_info": {},
+         "pango_lineages": [{"name": "B.1.617.2", "url": "https://cov-lineages.org"}], "who_name": ["Delta"]},
+        {"display_name": "S:677H", "type": "mutation", "score": 1234567890123}
+    ],
+    "growth": 2.25, "share": -0.125, "rate": 1.5e-7, "count": 12E3,
+    "trailing": 12345678
+}
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64, 1 << 16]
+
+
+def as_stream(document, chunk_size: int, indent=None) -> JSONStream:
+    return JSONStream(io.StringIO(json.dumps(document, indent=indent, ensure_ascii=False)), chunk_size)
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+@pytest.mark.parametrize('indent', [None, 2])
+def test_value_decodes_the_whole_document(chunk_size, indent):
+    assert as_stream(DOCUMENT, chunk_size, indent).value() == DOCUMENT
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_iteration_and_skip_at_small_chunk_sizes(chunk_size):
+    stream = as_stream(DOCUMENT, chunk_size, indent=1)
+    read = dict()
+    for key in stream.keys():
+        if key == "clusters":
+            read[key] = []
+            for index in stream.elements():
+                if index == 1:
+                    stream.skip()
+                else:
+                    read[key].append(stream.value())
+        elif key == "plots":
+            stream.skip()
+        else:
+            read[key] = stream.value()
+    assert read == {"clusters": [DOCUMENT["clusters"][0], DOCUMENT["clusters"][2]], "growth": 2.25, "share": -0.125,
+                    "rate": 1.5e-7, "count": 12E3, "trailing": 12345678}
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_read_clusters_skips_the_unused_fields(chunk_size, monkeypatch):
+    monkeypatch.setattr(covariants, 'JSONStream', lambda file: JSONStream(file, chunk_size))
+    clusters = list(covariants.read_clusters(io.StringIO(json.dumps(DOCUMENT))))
+    assert clusters == [{field: value for field, value in cluster.items() if field not in covariants.SKIPPED_FIELDS}
+                        for cluster in DOCUMENT["clusters"]]
+
+
+@pytest.mark.parametrize('text', ['1.5', '-0.25', '12e3', '12E+3', '1.5e-7', '123456789.0625'])
+def test_numbers_split_at_any_point_are_decoded_whole(text):
+    for chunk_size in range(1, len(text) + 1):
+        assert JSONStream(io.StringIO(text), chunk_size).value() == json.loads(text)
+        stream = JSONStream(io.StringIO(f'[{text}, {text}]'), chunk_size)
+        assert [stream.value() for _ in stream.elements()] == [json.loads(text)] * 2
+        stream = JSONStream(io.StringIO(f'{{"a": {text}, "b": 1}}'), chunk_size)
+        assert {key: stream.value() for key in stream.keys()} == {"a": json.loads(text), "b": 1}
+
+
+@pytest.mark.parametrize('text', ['{"a": [1, 2}', '{"a" 1}', '{"a": "unterminated', '{"a": {"b": [}'])
+def test_malformed_documents_raise_json_decode_error(text):
+    stream = JSONStream(io.StringIO(text), 3)
+    with pytest.raises(json.JSONDecodeError):
+        for _ in stream.keys():
+            stream.skip()
@@ -0,0 +1,68 @@
+import sys
+import time
+
+import pytest
+
+from pipeline.scheduler import DAGScheduler, FAILED, SKIPPED, SUCCEEDED, Task, failed_tasks
+
+
+def fail():
+    raise RuntimeError("source unavailable")
+
+
+def statuses(results) -> dict:
+    return {name: result.status for name, result in results.items()}
+
+
+def test_dependents_of_a_failed_task_are_skipped_and_the_others_run():
+    ran = []
+    results = DAGScheduler([
+        Task('a', fail),
+        Task('b', lambda: ran.append('b'), depends_on=['a']),
+        Task('c', lambda: ran.append('c'), depends_on=['b']),
+        Task('d', lambda: ran.append('d')),
+        Task('e', lambda: ran.append('e'), depends_on=['d']),
+    ]).run()
+    assert statuses(results) == {'a': FAILED, 'b': SKIPPED, 'c': SKIPPED, 'd': SUCCEEDED, 'e': SUCCEEDED}
+    assert sorted(ran) == ['d', 'e']
+    assert isinstance(results['a'].error, RuntimeError)
+    assert sorted(failed_tasks(results)) == ['a', 'b', 'c']
+
+
+def test_a_task_calling_sys_exit_is_failed_instead_of_stopping_the_run():
+    results = DAGScheduler([
+        Task('exits', lambda: sys.exit(1)),
+        Task('dependent', lambda: None, depends_on=['exits']),
+        Task('independent', lambda: None),
+    ]).run()
+    assert statuses(results) == {'exits': FAILED, 'dependent': SKIPPED, 'independent': SUCCEEDED}
+    assert isinstance(results['exits'].error, SystemExit)
+
+
+def test_fail_fast_starts_no_task_after_a_failure():
+    tasks = [Task('a', fail), Task('b', lambda: None), Task('c', lambda: None, depends_on=['b'])]
+    results = DAGScheduler(tasks, max_workers=1, fail_fast=True).run()
+    assert statuses(results) == {'a': FAILED, 'b': SKIPPED, 'c': SKIPPED}
+
+
+def test_a_task_starts_only_after_its_dependencies():
+    order = []
+
+    def slow():
+        time.sleep(0.05)
+        order.append('slow')
+
+    results = DAGScheduler([Task('slow', slow), Task('next', lambda: order.append('next'), depends_on=['slow'])],
+                           max_workers=4).run()
+    assert order == ['slow', 'next']
+    assert not failed_tasks(results)
+
+
+@pytest.mark.parametrize('tasks', [
+    [Task('a', fail, depends_on=['b']), Task('b', fail, depends_on=['a'])],
+    [Task('a', fail, depends_on=['missing'])],
+    [Task('a', fail), Task('a', fail)],
+])
+def test_invalid_graphs_are_rejected(tasks):
+    with pytest.raises(ValueError):
+        DAGScheduler(tasks)
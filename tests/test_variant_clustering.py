@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from data_validators.vocabulary import Organization
+from db_config.mongodb_model import Variant
+from pipeline.variant_clustering import VariantClusters, cluster_variants
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def variant(*aliases) -> Variant:
+    return Variant([Variant.Name(org, name) for org, name in aliases], [], [], [])
+
+
+def pango_names(v: Variant) -> set:
+    return {alias.name for alias in v.aliases if alias.org == Organization.PANGO.upper()}
+
+
+def test_variants_sharing_an_alias_are_merged_transitively():
+    merged = cluster_variants([variant(("pango", "B.1.1.7"), ("who", "alpha")),
+                               variant(("phe", "VOC-20DEC-01"), ("who", "alpha")),
+                               variant(("phe", "VOC-20DEC-01")),
+                               variant(("pango", "P.1"))])
+    assert len(merged) == 2
+    assert {(a.org, a.name) for a in merged[0].aliases} == {("PANGO", "B.1.1.7"), ("WHO", "ALPHA"),
+                                                           ("PHE", "VOC-20DEC-01")}
+
+
+def test_only_the_given_organizations_link_variants():
+    clusters = VariantClusters([Organization.PANGO])
+    for v in (variant(("pango", "B.1.1.7"), ("who", "alpha")), variant(("who", "alpha"))):
+        clusters.add(v)
+    assert clusters.clusters() == [[0], [1]]
+
+
+def test_overlapping_pango_names_are_merged():
+    merged = cluster_variants([variant(("pango", "B.1.427")),
+                               variant(("pango", "B.1.427"), ("pango", "B.1.429")),
+                               variant(("pango", "B.1.429"))])
+    assert len(merged) == 1
+    assert pango_names(merged[0]) == {"B.1.427", "B.1.429"}
+
+
+def test_disjoint_pango_names_are_never_merged():
+    # covariants names 21I DELTA (WHO) but B.1.617.1, the PANGO name of Kappa
+    merged = cluster_variants([variant(("pango", "B.1.617.2"), ("who", "delta")),
+                               variant(("pango", "B.1.617.1"), ("who", "delta"), ("covariants", "21I")),
+                               variant(("pango", "B.1.617.1"), ("who", "kappa"))])
+    assert sorted(map(sorted, map(pango_names, merged))) == [["B.1.617.1"], ["B.1.617.2"]]
+
+
+def test_delta_and_kappa_stay_separate_on_the_bundled_sources(monkeypatch):
+    from data_sources import covariants, phe_variants
+    monkeypatch.chdir(ROOT)
+    if not os.path.exists(covariants.LOCAL_PATH) or not os.path.exists(phe_variants.LOCAL_PATH):
+        pytest.skip("bundled source files not found")
+    variants = list(covariants.transform(covariants.read_input_file()))
+    variants += phe_variants.transform(phe_variants.read_zipped_source_files(processes=1))
+    lineages = [pango_names(v) for v in cluster_variants(variants)]
+    assert not [names for names in lineages if {"B.1.617.1", "B.1.617.2"} <= names]
+    assert any("B.1.617.2" in names for names in lineages) and any("B.1.617.1" in names for names in lineages)